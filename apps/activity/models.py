@@ -17,6 +17,7 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.db import models
 from django.db import transaction
 from django.db.models import Q
@@ -516,9 +517,81 @@ class ActivityManager(models.Manager):
                                       private_to_team=True)
 
     def move_video_records_to_team(self, video, team):
-        for record in self.filter(video=video, copied_from=None,
-                                  private_to_team=False):
-            record.move_to_team(team)
+        self.move_videos_records_to_team([video.id], team)
+
+    # Max number of videos to handle in each set of queries in
+    # move_videos_records_to_team()
+    MOVE_CHUNK_SIZE = 1000
+
+    def move_videos_records_to_team(self, video_ids, team):
+        """Move the activity for a list of videos to a new team
+
+        This does the same thing as calling ActivityRecord.move_to_team() for
+        each original, non-private record for the videos:
+
+          - Records that currently belong to a team leave a copy with that
+            team
+          - Records get moved to the new team
+          - Copies of the records left in the new team from a previous move
+            get deleted
+
+        Rather than handling records one at a time, we use a single DELETE,
+        INSERT ... SELECT, and UPDATE for each chunk of videos.
+        """
+        video_ids = list(video_ids)
+        team_id = team.id if team is not None else None
+        qn = connection.ops.quote_name
+        table = qn(self.model._meta.db_table)
+        copy_columns = ', '.join(qn(name) for name in [
+            'type', 'user_id', 'team_id', 'video_id', 'video_language_code',
+            'language_code', 'related_obj_id', 'created', 'private_to_team',
+        ])
+        cursor = connection.cursor()
+        with transaction.atomic():
+            for i in xrange(0, len(video_ids), self.MOVE_CHUNK_SIZE):
+                chunk = video_ids[i:i+self.MOVE_CHUNK_SIZE]
+                originals_where = (
+                    '{} IN ({}) AND {} IS NULL AND {} = %s'.format(
+                        qn('video_id'), ', '.join(['%s'] * len(chunk)),
+                        qn('copied_from_id'), qn('private_to_team')))
+                originals_params = chunk + [False]
+                if team_id is not None:
+                    # MySQL doesn't allow a subquery on the table we're
+                    # deleting from, unless it's wrapped in a derived table
+                    cursor.execute(
+                        'DELETE FROM {table} WHERE {team_id} = %s AND '
+                        '{copied_from_id} IN (SELECT id FROM ('
+                        'SELECT id FROM {table} WHERE {originals_where}'
+                        ') AS originals)'.format(
+                            table=table, team_id=qn('team_id'),
+                            copied_from_id=qn('copied_from_id'),
+                            originals_where=originals_where),
+                        [team_id] + originals_params)
+                    copy_where = '{} IS NOT NULL AND {} <> %s'.format(
+                        qn('team_id'), qn('team_id'))
+                    copy_params = [team_id]
+                else:
+                    copy_where = '{} IS NOT NULL'.format(qn('team_id'))
+                    copy_params = []
+                cursor.execute(
+                    'INSERT INTO {table} ({columns}, {copied_from_id}) '
+                    'SELECT {columns}, id FROM {table} '
+                    'WHERE {originals_where} AND {copy_where}'.format(
+                        table=table, columns=copy_columns,
+                        copied_from_id=qn('copied_from_id'),
+                        originals_where=originals_where,
+                        copy_where=copy_where),
+                    originals_params + copy_params)
+                cursor.execute(
+                    'UPDATE {table} SET {team_id} = %s '
+                    'WHERE {originals_where}'.format(
+                        table=table, team_id=qn('team_id'),
+                        originals_where=originals_where),
+                    [team_id] + originals_params)
+        # We bypassed the post_save signal, so invalidate the video caches
+        # ourselves.
+        for video_id in video_ids:
+            Video.cache.invalidate_by_pk(video_id)
 
 class ActivityRecord(models.Model):
     type = CodeField(choices=activity_choices)
@@ -601,8 +674,9 @@ class ActivityRecord(models.Model):
 
     def make_copy(self):
         copy = ActivityRecord(copied_from=self)
-        fields = ['type', 'user_id', 'team_id', 'video_id', 'language_code',
-                  'related_obj_id', 'created', ]
+        fields = ['type', 'user_id', 'team_id', 'video_id',
+                  'video_language_code', 'language_code', 'related_obj_id',
+                  'created', ]
         for name in fields:
             setattr(copy, name, getattr(self, name))
         copy.save()
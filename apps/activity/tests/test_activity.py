@@ -343,6 +343,54 @@ class TeamVideoActivityTest(TestCase):
         assert_equal(record_to.team, team_2)
         assert_equal(record_to.get_related_obj(), team_1)
 
+    def test_bulk_move(self):
+        first_team = TeamFactory()
+        second_team = TeamFactory()
+        videos = [TeamVideoFactory(team=first_team).video for i in range(3)]
+        clear_activity()
+        records = [ActivityRecord.objects.create_for_video_added(v)
+                   for v in videos]
+        private_record = ActivityRecord.objects.create_for_video_added(
+            videos[0])
+        private_record.private_to_team = True
+        private_record.save()
+        ActivityRecord.objects.move_videos_records_to_team(
+            [v.id for v in videos], second_team)
+        for record in records:
+            self.check_copies(record, second_team, [first_team])
+        self.check_copies(private_record, first_team, [])
+        # move back, this should delete the copies on first_team
+        ActivityRecord.objects.move_videos_records_to_team(
+            [v.id for v in videos], first_team)
+        for record in records:
+            self.check_copies(record, first_team, [second_team])
+
+    def test_bulk_move_copies_fields(self):
+        team = TeamFactory()
+        video = TeamVideoFactory(team=team).video
+        clear_activity()
+        record = ActivityRecord.objects.create_for_video_added(video)
+        record.video_language_code = 'en'
+        record.language_code = 'fr'
+        record.save()
+        ActivityRecord.objects.move_videos_records_to_team([video.id], None)
+        copy = ActivityRecord.objects.get(copied_from=record)
+        for name in ('type', 'user_id', 'video_id', 'video_language_code',
+                     'language_code', 'related_obj_id', 'created',
+                     'private_to_team'):
+            assert_equal(getattr(copy, name), getattr(record, name))
+        assert_equal(copy.team, team)
+
+    def test_bulk_move_query_count(self):
+        video = TeamVideoFactory().video
+        clear_activity()
+        for i in range(10):
+            ActivityRecord.objects.create_for_video_added(video)
+        new_team = TeamFactory()
+        with self.assertNumQueries(3):
+            ActivityRecord.objects.move_videos_records_to_team(
+                [video.id], new_team)
+
 class TestViewableByUser(TestCase):
     def setUp(self):
         self.user = UserFactory()
@@ -15,8 +15,40 @@
 # You should have received a copy of the GNU Affero General Public License along
 # with this program.  If not, see http://www.gnu.org/licenses/agpl-3.0.html.
 
+"""API authentication
+
+TokenAuthentication checks the X-API-USERNAME and X-API-KEY headers.  To
+avoid hitting the DB for every API request, we cache the result of checking
+a username/key pair:
+
+    - First in a small per-process LRU cache with a short timeout
+    - Then in the shared django cache
+
+Failed checks are cached too, using a shorter timeout.  Cached values for a
+user get invalidated when their ApiKey or user row changes (see
+api.signalhandlers).  Since the per-process cache can't be invalidated from
+other processes, its timeout should be kept short.
+
+The cached result is only the user id.  The user itself comes from
+User.cache, so steady-state requests don't need any DB queries.  Instances
+from User.cache refuse to be saved, but views sometimes save request.user,
+so we remove that guard.  This is safe because api.signalhandlers
+invalidates User.cache whenever a user is saved.
+"""
+
 from __future__ import absolute_import
 
+import collections
+import hashlib
+import hmac
+import logging
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import smart_str
 from rest_framework import authentication
 from rest_framework import exceptions
 # Need to use tastypie's ApiKey, since that's what the apiv2 app uses.  Once
@@ -26,6 +58,8 @@ from tastypie.models import ApiKey
 
 from auth.models import CustomUser as User
 
+logger = logging.getLogger('api.auth')
+
 class TokenAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
         username = request.META.get('HTTP_X_API_USERNAME')
@@ -37,15 +71,197 @@ class TokenAuthentication(authentication.BaseAuthentication):
         if not username:
             return None
 
+        user_id = check_credentials(username, api_key)
         try:
-            user = User.objects.get(username=username)
+            user = User.cache.get_instance(user_id)
         except User.DoesNotExist:
+            invalidate_credentials(username)
             raise exceptions.AuthenticationFailed('No such user')
+        # Allow saving the user (see the module docstring)
+        user.__dict__.pop('save', None)
+        return (user, None)
 
-        if not user.is_active:
-            raise exceptions.AuthenticationFailed('User disabled')
+class CredentialCacheStats(object):
+    """Track how check_credentials() calls get handled
 
-        if not ApiKey.objects.filter(user=user, key=api_key).exists():
-            raise exceptions.AuthenticationFailed('Invalid API Key')
+    Attributes:
+        local_hits: results found in the per-process cache
+        shared_hits: results found in the shared cache
+        misses: results that we had to calculate using the DB
+        failures: calls that raised AuthenticationFailed
+    """
+    def __init__(self):
+        self.reset()
 
-        return (user, None)
+    def reset(self):
+        self.local_hits = self.shared_hits = self.misses = self.failures = 0
+
+    def __repr__(self):
+        return ('<CredentialCacheStats local: {0} shared: {1} misses: {2} '
+                'failures: {3}>'.format(self.local_hits, self.shared_hits,
+                                        self.misses, self.failures))
+
+credential_cache_stats = CredentialCacheStats()
+
+class _LocalCredentialCache(object):
+    """Per-process LRU cache for check_credentials() results
+
+    Maps credential keys to (expire_time, username, result) tuples.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.data = collections.OrderedDict()
+
+    def max_size(self):
+        return getattr(settings, 'API_AUTH_LOCAL_CACHE_SIZE', 1000)
+
+    def get(self, key):
+        with self.lock:
+            try:
+                expire_time, username, result = self.data.pop(key)
+            except KeyError:
+                return None
+            if expire_time < time.time():
+                return None
+            # re-insert the value to move it to the end of the LRU list
+            self.data[key] = (expire_time, username, result)
+            return result
+
+    def set(self, key, username, result, timeout):
+        max_size = self.max_size()
+        if max_size <= 0:
+            return
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (time.time() + timeout, smart_str(username),
+                              result)
+            while len(self.data) > max_size:
+                self.data.popitem(last=False)
+
+    def invalidate_username(self, username):
+        username = smart_str(username)
+        with self.lock:
+            for key, entry in self.data.items():
+                if entry[1] == username:
+                    del self.data[key]
+
+_local_cache = _LocalCredentialCache()
+
+def check_credentials(username, api_key):
+    """Check an API username/key pair
+
+    Returns:
+        the user id for the API key
+    Raises:
+        AuthenticationFailed: the username or key is invalid
+    """
+    key = _credential_key(username, api_key)
+    result = _local_cache.get(key)
+    if result is not None:
+        credential_cache_stats.local_hits += 1
+    else:
+        namespace_key = _namespace_key(username)
+        values = cache.get_many([namespace_key, key])
+        namespace = values.get(namespace_key)
+        entry = values.get(key)
+        if namespace is not None and entry is not None and \
+                entry[0] == namespace:
+            credential_cache_stats.shared_hits += 1
+            result = entry[1]
+        else:
+            credential_cache_stats.misses += 1
+            if namespace is None:
+                namespace = _create_namespace(namespace_key)
+            result = _calc_credentials(username, api_key)
+            cache.set(key, (namespace, result), _result_timeout(result))
+        _local_cache.set(key, username, result,
+                         getattr(settings, 'API_AUTH_LOCAL_CACHE_TIMEOUT', 30))
+    if isinstance(result, basestring):
+        _record_failure(username)
+        raise exceptions.AuthenticationFailed(result)
+    return result
+
+def _calc_credentials(username, api_key):
+    """Check credentials using the DB
+
+    Returns the user id if they are valid, or an error message if not.
+    """
+    try:
+        user = User.objects.get(username=username)
+    except User.DoesNotExist:
+        return 'No such user'
+
+    if not user.is_active:
+        return 'User disabled'
+
+    if not ApiKey.objects.filter(user=user, key=api_key).exists():
+        return 'Invalid API Key'
+
+    return user.id
+
+def invalidate_credentials(username):
+    """Invalidate the cached credential checks for a user."""
+    cache.set(_namespace_key(username), uuid.uuid4().hex,
+              _namespace_timeout())
+    _local_cache.invalidate_username(username)
+
+def recent_failures(username):
+    """Get the number of failed authentications for a username
+
+    This counts failures since the start of the current
+    API_AUTH_FAILURE_WINDOW.
+    """
+    return cache.get(_failures_key(username), 0)
+
+def _record_failure(username):
+    credential_cache_stats.failures += 1
+    key = _failures_key(username)
+    window = getattr(settings, 'API_AUTH_FAILURE_WINDOW', 60)
+    cache.add(key, 0, window)
+    try:
+        count = cache.incr(key)
+    except ValueError:
+        # key expired between the add and the incr
+        return
+    if count == getattr(settings, 'API_AUTH_FAILURE_WARNING_COUNT', 100):
+        logger.warn('%s failed API authentications for %s in %s seconds',
+                    count, username, window)
+
+def _credential_key(username, api_key):
+    # Hash the key with our secret, so that the cache doesn't contain
+    # anything that could be used to authenticate.
+    msg = '{}\0{}'.format(smart_str(username), smart_str(api_key or ''))
+    digest = hmac.new(smart_str(settings.SECRET_KEY), msg,
+                      hashlib.sha256).hexdigest()
+    return 'api-auth:{}'.format(digest)
+
+def _username_hash(username):
+    return hashlib.md5(smart_str(username)).hexdigest()
+
+def _namespace_key(username):
+    return 'api-auth-ns:{}'.format(_username_hash(username))
+
+def _failures_key(username):
+    return 'api-auth-failures:{}'.format(_username_hash(username))
+
+def _create_namespace(namespace_key):
+    namespace = uuid.uuid4().hex
+    if not cache.add(namespace_key, namespace, _namespace_timeout()):
+        # Someone else created the namespace at the same time
+        namespace = cache.get(namespace_key, namespace)
+    return namespace
+
+def _namespace_timeout():
+    # Keep the namespace around longer than any of the results stored with
+    # it.
+    return 2 * getattr(settings, 'API_AUTH_CACHE_TIMEOUT', 300)
+
+def _result_timeout(result):
+    if isinstance(result, basestring):
+        return getattr(settings, 'API_AUTH_NEGATIVE_CACHE_TIMEOUT', 60)
+    else:
+        return getattr(settings, 'API_AUTH_CACHE_TIMEOUT', 300)
@@ -22,16 +22,127 @@ method to use offset/limit based pagination instead of page based pagination.
 
 This will get much simpler  once we switch to django-rest-framework 3.1 which
 has built-in support for this.
+
+Views that set cursor_ordering also support cursor pagination.  Clients opt
+in by passing the cursor query param (empty for the first page).  Rather than
+using OFFSET, we filter on the values of the cursor_ordering fields for the
+last row of the previous page, so deep pages are as fast as the first one.
+
+Clients can also pass total_count=approximate or total_count=none to avoid a
+full COUNT(*) query.
 """
 
+import base64
 from collections import OrderedDict
+import json
 
+from django.core.exceptions import ValidationError
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 class AmaraPagination(pagination.LimitOffsetPagination):
     default_limit = 20
     max_limit = 100
+    cursor_query_param = 'cursor'
+    total_count_query_param = 'total_count'
+    # For total_count=approximate, count at most this many rows
+    approximate_count_limit = 1000
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.cursor_ordering = getattr(view, 'cursor_ordering', None)
+        # We can't filter/reorder querysets that have already been sliced.
+        # Fall back to offset pagination for those.
+        self.use_cursor = (self.cursor_query_param in request.query_params
+                           and self.cursor_ordering is not None
+                           and queryset.query.can_filter())
+        self.count = self.calc_count(queryset, request)
+        if self.use_cursor:
+            self.offset = None
+            queryset = queryset.order_by(*self.cursor_ordering)
+            cursor = request.query_params[self.cursor_query_param]
+            if cursor:
+                queryset = queryset.filter(self.cursor_filter(
+                    self.decode_cursor(queryset.model, cursor)))
+            results = list(queryset[:self.limit + 1])
+        else:
+            self.offset = self.get_offset(request)
+            results = list(queryset[self.offset:self.offset + self.limit + 1])
+        self.has_next = len(results) > self.limit
+        results = results[:self.limit]
+        if self.use_cursor and self.has_next:
+            self.next_cursor = self.encode_cursor(results[-1])
+        return results
+
+    def calc_count(self, queryset, request):
+        mode = request.query_params.get(self.total_count_query_param)
+        if mode == 'none':
+            return None
+        elif mode == 'approximate':
+            # Django's count() ignores slicing, so fetch the ids instead
+            return len(queryset.values_list('pk', flat=True)
+                       [:self.approximate_count_limit])
+        else:
+            return queryset.count()
+
+    def encode_cursor(self, obj):
+        values = [
+            obj._meta.get_field(name.lstrip('-')).value_to_string(obj)
+            for name in self.cursor_ordering
+        ]
+        return base64.urlsafe_b64encode(json.dumps(values))
+
+    def decode_cursor(self, model, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(str(cursor)))
+            if (not isinstance(values, list) or
+                    len(values) != len(self.cursor_ordering)):
+                raise ValueError()
+            return [
+                model._meta.get_field(name.lstrip('-')).to_python(value)
+                for name, value in zip(self.cursor_ordering, values)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound('Invalid cursor')
+
+    def cursor_filter(self, values):
+        """Build a Q object that selects the rows after the cursor
+
+        For ordering (-a, -b), this is: a < x OR (a = x AND b < y)
+        """
+        q = None
+        for name, value in reversed(zip(self.cursor_ordering, values)):
+            field_name = name.lstrip('-')
+            lookup = '__lt' if name.startswith('-') else '__gt'
+            clause = Q(**{field_name + lookup: value})
+            if q is not None:
+                clause = clause | (Q(**{field_name: value}) & q)
+            q = clause
+        return q
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        if self.use_cursor:
+            return replace_query_param(url, self.cursor_query_param,
+                                       self.next_cursor)
+        else:
+            return replace_query_param(url, self.offset_query_param,
+                                       self.offset + self.limit)
+
+    def get_previous_link(self):
+        if self.use_cursor:
+            # Cursors only go forward
+            return None
+        return super(AmaraPagination, self).get_previous_link()
 
     def get_paginated_response(self, data):
         return Response(OrderedDict([
@@ -0,0 +1,46 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+from __future__ import absolute_import
+
+from django.contrib.auth.models import User as BaseUser
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from tastypie.models import ApiKey
+
+from api.auth import invalidate_credentials
+from auth.models import CustomUser as User
+
+@receiver(post_save, sender=ApiKey)
+@receiver(post_delete, sender=ApiKey)
+def on_api_key_change(sender, instance, **kwargs):
+    try:
+        username = instance.user.username
+    except BaseUser.DoesNotExist:
+        return
+    invalidate_credentials(username)
+
+# Invalidate on any user change, since that's where is_active gets updated.
+# TokenAuthentication returns users from User.cache, so invalidate that too.
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=BaseUser)
+@receiver(post_delete, sender=BaseUser)
+def on_user_change(sender, instance, **kwargs):
+    invalidate_credentials(instance.username)
+    User.cache.invalidate_by_pk(instance.pk)
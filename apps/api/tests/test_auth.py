@@ -20,13 +20,18 @@ from __future__ import absolute_import
 from django.test import TestCase
 from django.http import HttpRequest
 from nose.tools import *
+from tastypie.models import ApiKey
 from rest_framework.exceptions import AuthenticationFailed
 
+from api import auth
 from api.auth import TokenAuthentication
+from auth.models import CustomUser as User
 from utils.factories import *
 
 class TestAPIAuth(TestCase):
     def setUp(self):
+        auth._local_cache.clear()
+        auth.credential_cache_stats.reset()
         self.user = UserFactory()
         self.api_key = self.user.get_api_key()
         self.auth = TokenAuthentication()
@@ -41,6 +46,19 @@ class TestAPIAuth(TestCase):
         request = self.make_request(self.user.username, self.api_key)
         assert_equal(self.auth.authenticate(request), (self.user, None))
 
+    def test_user_can_be_saved(self):
+        # Views sometimes save request.user, so the user that we return from
+        # the cache should allow it
+        request = self.make_request(self.user.username, self.api_key)
+        self.auth.authenticate(request)
+        user, _ = self.auth.authenticate(request)
+        user.first_name = 'New'
+        user.save()
+        assert_equal(User.objects.get(pk=self.user.pk).first_name, 'New')
+        # saving should invalidate the cached user
+        user, _ = self.auth.authenticate(request)
+        assert_equal(user.first_name, 'New')
+
     def test_incorrect_token(self):
         request = self.make_request(self.user.username, "foo")
         with assert_raises(AuthenticationFailed):
@@ -49,3 +67,48 @@ class TestAPIAuth(TestCase):
     def test_no_token(self):
         request = self.make_request(None, None)
         assert_equal(self.auth.authenticate(request), None)
+
+    def test_cached(self):
+        request = self.make_request(self.user.username, self.api_key)
+        self.auth.authenticate(request)
+        with self.assertNumQueries(0):
+            assert_equal(self.auth.authenticate(request), (self.user, None))
+        assert_equal(auth.credential_cache_stats.misses, 1)
+        assert_equal(auth.credential_cache_stats.local_hits, 1)
+
+    def test_shared_cache(self):
+        request = self.make_request(self.user.username, self.api_key)
+        self.auth.authenticate(request)
+        auth._local_cache.clear()
+        with self.assertNumQueries(0):
+            assert_equal(self.auth.authenticate(request), (self.user, None))
+        assert_equal(auth.credential_cache_stats.shared_hits, 1)
+
+    def test_negative_cache(self):
+        request = self.make_request(self.user.username, "foo")
+        with assert_raises(AuthenticationFailed):
+            self.auth.authenticate(request)
+        with self.assertNumQueries(0):
+            with assert_raises(AuthenticationFailed):
+                self.auth.authenticate(request)
+        assert_equal(auth.credential_cache_stats.failures, 2)
+        assert_equal(auth.recent_failures(self.user.username), 2)
+
+    def test_api_key_change_invalidates(self):
+        request = self.make_request(self.user.username, self.api_key)
+        self.auth.authenticate(request)
+        api_key = ApiKey.objects.get(user=self.user)
+        api_key.key = api_key.generate_key()
+        api_key.save()
+        with assert_raises(AuthenticationFailed):
+            self.auth.authenticate(request)
+        request = self.make_request(self.user.username, api_key.key)
+        assert_equal(self.auth.authenticate(request), (self.user, None))
+
+    def test_deactivate_user_invalidates(self):
+        request = self.make_request(self.user.username, self.api_key)
+        self.auth.authenticate(request)
+        self.user.is_active = False
+        self.user.save()
+        with assert_raises(AuthenticationFailed):
+            self.auth.authenticate(request)
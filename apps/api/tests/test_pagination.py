@@ -0,0 +1,99 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2015 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify it under
+# the terms of the GNU Affero General Public License as published by the Free
+# Software Foundation, either version 3 of the License, or (at your option) any
+# later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT
+# ANY WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS
+# FOR A PARTICULAR PURPOSE.  See the GNU Affero General Public License for more
+# details.
+#
+# You should have received a copy of the GNU Affero General Public License along
+# with this program.  If not, see http://www.gnu.org/licenses/agpl-3.0.html.
+
+from __future__ import absolute_import
+from datetime import datetime
+import urlparse
+
+from django.test import TestCase
+from nose.tools import *
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.pagination import AmaraPagination
+from utils.factories import *
+from videos.models import Video
+
+class CursorView(object):
+    cursor_ordering = ('-created', '-id')
+
+class PaginationTest(TestCase):
+    def setUp(self):
+        # create videos with some duplicate created values to test the
+        # tie-breaking on id
+        self.videos = []
+        for i in range(5):
+            created = datetime(2015, 1, 1 + i // 2)
+            self.videos.append(VideoFactory(created=created))
+        self.correct_order = sorted(self.videos,
+                                    key=lambda v: (v.created, v.id),
+                                    reverse=True)
+        self.factory = APIRequestFactory()
+
+    def paginate(self, url, view=None):
+        paginator = AmaraPagination()
+        request = Request(self.factory.get(url))
+        results = paginator.paginate_queryset(Video.objects.all(), request,
+                                              view)
+        return results, paginator.get_paginated_response([]).data['meta']
+
+    def next_url(self, meta):
+        parts = urlparse.urlparse(meta['next'])
+        return '/?' + parts.query
+
+    def test_cursor_pagination(self):
+        results, meta = self.paginate('/?cursor=&limit=2', CursorView())
+        seen = list(results)
+        assert_equal(meta['offset'], None)
+        assert_equal(meta['previous'], None)
+        assert_equal(meta['total_count'], 5)
+        while meta['next']:
+            results, meta = self.paginate(self.next_url(meta), CursorView())
+            seen.extend(results)
+        assert_equal(seen, self.correct_order)
+
+    def test_offset_pagination(self):
+        results, meta = self.paginate('/?limit=2&offset=2', CursorView())
+        assert_equal(len(results), 2)
+        assert_equal(meta['offset'], 2)
+        assert_not_equal(meta['previous'], None)
+        assert_true('offset=4' in meta['next'])
+        results, meta = self.paginate('/?limit=2&offset=4', CursorView())
+        assert_equal(len(results), 1)
+        assert_equal(meta['next'], None)
+
+    def test_cursor_requires_view_support(self):
+        # views without cursor_ordering use offset pagination
+        results, meta = self.paginate('/?cursor=&limit=2')
+        assert_equal(meta['offset'], 0)
+
+    def test_invalid_cursor(self):
+        with assert_raises(NotFound):
+            self.paginate('/?cursor=invalid', CursorView())
+
+    def test_total_count_none(self):
+        results, meta = self.paginate('/?total_count=none', CursorView())
+        assert_equal(meta['total_count'], None)
+        assert_equal(len(results), 5)
+
+    def test_total_count_approximate(self):
+        paginator = AmaraPagination()
+        paginator.approximate_count_limit = 3
+        request = Request(self.factory.get('/?total_count=approximate'))
+        paginator.paginate_queryset(Video.objects.all(), request)
+        assert_equal(paginator.count, 3)
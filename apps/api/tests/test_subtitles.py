@@ -532,6 +532,69 @@ class SubtitlesViewTest(TestCase):
         assert_equal(response.content,
                      babelsubs.to(self.version.get_subtitles(), 'dfxp'))
 
+    def test_raw_format_uses_cache(self):
+        # The second request should be served from the cache without
+        # parsing the subtitles
+        self.client.get(self.url, HTTP_ACCEPT='text/srt')
+        with mock.patch('subtitles.models.SubtitleVersion.get_subtitles') \
+                as mock_get_subtitles:
+            response = self.client.get(self.url, HTTP_ACCEPT='text/srt')
+        assert_equal(mock_get_subtitles.call_count, 0)
+        assert_equal(response.content,
+                     babelsubs.to(self.version.get_subtitles(), 'srt'))
+
+    def test_etag(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='text/srt')
+        etag = response['ETag']
+        response = self.client.get(self.url, HTTP_ACCEPT='text/srt',
+                                   HTTP_IF_NONE_MATCH=etag)
+        assert_equal(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        assert_equal(response.content, '')
+        # different formats should have different ETags
+        response = self.client.get(self.url, HTTP_ACCEPT='text/vtt',
+                                   HTTP_IF_NONE_MATCH=etag)
+        assert_equal(response.status_code, status.HTTP_200_OK)
+
+    def test_etag_changes_with_new_version(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='text/srt')
+        etag = response['ETag']
+        pipeline.add_subtitles(self.video, 'en',
+                               SubtitleSetFactory(num_subs=2))
+        response = self.client.get(self.url, HTTP_ACCEPT='text/srt',
+                                   HTTP_IF_NONE_MATCH=etag)
+        assert_equal(response.status_code, status.HTTP_200_OK)
+        assert_not_equal(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='text/srt')
+        response = self.client.get(
+            self.url, HTTP_ACCEPT='text/srt',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        assert_equal(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_if_modified_since_after_tip_deleted(self):
+        # If the newest version gets deleted, the tip goes back to an older
+        # version.  Clients that have the newer version should get the older
+        # one, not a 304.
+        new_version = pipeline.add_subtitles(self.video, 'en',
+                                             SubtitleSetFactory(num_subs=2))
+        response = self.client.get(self.url, HTTP_ACCEPT='text/srt')
+        last_modified = response['Last-Modified']
+        new_version.unpublish(delete=True)
+        response = self.client.get(self.url, HTTP_ACCEPT='text/srt',
+                                   HTTP_IF_MODIFIED_SINCE=last_modified)
+        assert_equal(response.status_code, status.HTTP_200_OK)
+        assert_equal(response.content,
+                     babelsubs.to(self.version.get_subtitles(), 'srt'))
+
+    def test_etag_takes_precedence(self):
+        response = self.client.get(self.url, HTTP_ACCEPT='text/srt')
+        response = self.client.get(
+            self.url, HTTP_ACCEPT='text/srt',
+            HTTP_IF_NONE_MATCH='"stale-etag"',
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        assert_equal(response.status_code, status.HTTP_200_OK)
+
     def run_get_object(self, **query_params):
         view = SubtitlesView()
         view.kwargs = {
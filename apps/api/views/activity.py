@@ -321,6 +321,7 @@ class ActivityFilterBackend(filters.BaseFilterBackend):
 
 class VideoActivityView(generics.ListAPIView):
     serializer_class = ActivitySerializer
+    cursor_ordering = ('-created', '-id')
     filter_backends = (ActivityFilterBackend,)
     enabled_filters = ['type', 'user', 'language', 'before', 'after']
 
@@ -330,6 +331,7 @@ class VideoActivityView(generics.ListAPIView):
 
 class TeamActivityView(generics.ListAPIView):
     serializer_class = ActivitySerializer
+    cursor_ordering = ('-created', '-id')
     filter_backends = (ActivityFilterBackend,)
     enabled_filters = ['video', 'video_language', 'type', 'user',
                        'language', 'before', 'after']
@@ -340,6 +342,7 @@ class TeamActivityView(generics.ListAPIView):
 
 class UserActivityView(generics.ListAPIView):
     serializer_class = ActivitySerializer
+    cursor_ordering = ('-created', '-id')
     filter_backends = (ActivityFilterBackend,)
     enabled_filters = ['video', 'team', 'video_language', 'type', 
                        'language', 'before', 'after']
@@ -406,6 +409,7 @@ class ActivityViewSet(viewsets.ReadOnlyModelViewSet):
     lookup_field = 'id'
     serializer_class = LegacyActivitySerializer
     paginate_by = 20
+    cursor_ordering = ('-created', '-id')
 
     def get_queryset(self):
         params = self.request.query_params
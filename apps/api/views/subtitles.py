@@ -173,6 +173,11 @@ WEBVTT                text/vtt                vtt
     GET /api/videos/(video-id)/languages/(language-code)/subtitles/
     Accept: application/ttml+xml
 
+These responses include ``ETag`` and ``Last-Modified`` headers.  If you poll
+for subtitle changes, send them back using ``If-None-Match`` or
+``If-Modified-Since`` and you will get a ``304 Not Modified`` response if
+the subtitles haven't changed.
+
 Creating new subtitles
 ^^^^^^^^^^^^^^^^^^^^^^
 
@@ -271,6 +276,7 @@ import logging
 from django.db import IntegrityError
 from django.http import Http404
 from django.shortcuts import get_object_or_404
+from django.utils.http import http_date, parse_http_date_safe
 from django.utils.translation import ugettext_lazy as _
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import generics
@@ -291,6 +297,7 @@ from api.fields import (LanguageCodeField, TimezoneAwareDateTimeField,
                         UserField)
 from api.views.apiswitcher import APISwitcherMixin
 from videos.models import Video
+from subtitles import cache as subtitle_cache
 from subtitles import compat
 from subtitles import pipeline
 from subtitles import workflows
@@ -506,10 +513,22 @@ class SubtitleLanguageViewSet(mixins.CreateModelMixin,
             'show_private_versions': self.show_private_versions,
         }
 
+class RenderedSubtitles(object):
+    """Response data to render a SubtitleVersion with SubtitleRenderer
+
+    This lets SubtitleRenderer fetch the rendered subtitles from the cache,
+    avoiding parsing the subtitles.
+    """
+    def __init__(self, version):
+        self.version = version
+
 class SubtitleRenderer(renderers.BaseRenderer):
     """Render SubtitleSets using babelsubs."""
     def render(self, data, media_type=None, renderer_context=None):
-        if isinstance(data, SubtitleSet):
+        if isinstance(data, RenderedSubtitles):
+            return subtitle_cache.get_rendered_subtitles(data.version,
+                                                         self.format)
+        elif isinstance(data, SubtitleSet):
             return babelsubs.to(data, self.format)
         else:
             # Fall back to JSON renderer for other responses.  This handles
@@ -548,8 +567,8 @@ class SubtitlesField(serializers.CharField):
         })
 
     def get_attribute(self, version):
-        return babelsubs.to(version.get_subtitles(),
-                            self.context['sub_format'])
+        return subtitle_cache.get_rendered_subtitles(
+            version, self.context['sub_format'])
 
     def to_representation(self, value):
         if self.context['sub_format'] == 'json':
@@ -753,7 +772,8 @@ class SubtitlesView(generics.CreateAPIView):
         # serializer and return the subtitles instead
         if isinstance(request.accepted_renderer, SubtitleRenderer):
             if user_can_access_subtitles_format(request.user, request.accepted_renderer.format):
-                return Response(version.get_subtitles())
+                return self.get_raw_subtitles_response(
+                    request, version, request.accepted_renderer.format)
             else:
                 raise PermissionDenied()
         serializer = self.get_serializer(version)
@@ -762,6 +782,36 @@ class SubtitlesView(generics.CreateAPIView):
         else:
             raise PermissionDenied()
 
+    def get_raw_subtitles_response(self, request, version, sub_format):
+        # Versions never change, so we can support conditional GET requests
+        # using the version and format.  Last-Modified is the last time the
+        # language changed rather than when the version was created, since
+        # the tip can go back to an older version.
+        etag = subtitle_cache.rendered_subtitles_etag(version, sub_format)
+        last_modified = subtitle_cache.get_language_changed(
+            version.subtitle_language_id)
+        if self.check_not_modified(request, etag, last_modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(RenderedSubtitles(version))
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def check_not_modified(self, request, etag, last_modified):
+        # If-None-Match takes precedence over If-Modified-Since, since the
+        # ETag identifies the exact version
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            etags = [e.strip() for e in if_none_match.split(',')]
+            return etag in etags or '*' in etags
+        if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since is not None:
+            if_modified_since = parse_http_date_safe(if_modified_since)
+            return (if_modified_since is not None and
+                    last_modified <= if_modified_since)
+        return False
+
     def get_object(self):
         video = self.get_video()
         workflow = workflows.get_workflow(video)
@@ -869,6 +869,7 @@ class TaskUpdateSerializer(TaskSerializer):
 class TaskViewSet(TeamSubview):
     lookup_field = 'id'
     paginate_by = 20
+    cursor_ordering = ('-id',)
 
     def get_queryset(self):
         if not self.team.user_is_member(self.request.user):
@@ -525,6 +525,7 @@ class VideoViewSet(mixins.CreateModelMixin,
     serializer_class = VideoSerializer
     queryset = Video.objects.all()
     paginate_by = 20
+    cursor_ordering = ('-id',)
 
     lookup_field = 'video_id'
     lookup_value_regex = r'(\w|-)+'
@@ -5,8 +5,10 @@ Caching
 Amara uses a couple tricks for caching things.
 
 .. automodule:: caching.cachegroup
+.. automodule:: caching.codecs
 """
 
 from __future__ import absolute_import
 
-from .cachegroup import CacheGroup, ModelCacheManager
+from .cachegroup import (CacheGroup, ModelCacheManager, get_many_multi_group,
+                         set_many_multi_group)
@@ -86,6 +86,21 @@ CacheGroup we will do a couple things:
 
 This speeds things up by reducing the number of round trips to memcached.
 
+The keys for each pattern are stored in the cache itself, so they are shared
+between all processes and new processes can prefetch the right keys starting
+with their first request.  For each key we track how often it gets used by
+CacheGroups with that pattern.  The usage data is aged so that keys that stop
+being used eventually get dropped from the get_many() calls.  Some settings
+control this:
+
+- ``CACHE_PATTERN_SYNC_INTERVAL``: how often, in seconds, each process merges
+  its usage data with the data stored in the cache.
+- ``CACHE_PATTERN_DECAY``: how much weight to give the latest usage data vs
+  the stored data when we merge.
+- ``CACHE_PATTERN_MIN_USAGE``: keys used by less than this fraction of cache
+  groups are dropped.
+- ``CACHE_PATTERN_MAX_KEYS``: max number of keys to remember for a pattern.
+
 Behind the scenes
 ^^^^^^^^^^^^^^^^^
 
@@ -118,6 +133,47 @@ Z         def:bar          *invalid*
     version key.  This way the version key changes for each deploy, which will
     invalidate all values.
 
+.. _cache-local-cache:
+
+Local Cache
+^^^^^^^^^^^
+
+CacheGroups that use a cache pattern can also use a small in-process cache
+that sits in front of memcached.  This is controlled by a couple settings:
+
+- ``CACHE_GROUP_LOCAL_CACHE_SIZE``: max number of bytes to store.  Set this
+  to 0 (the default) to disable the local cache.
+- ``CACHE_GROUP_LOCAL_CACHE_TIMEOUT``: how long, in seconds, to keep values in
+  the local cache.
+- ``CACHE_GROUP_LOCAL_CACHE_STALENESS``: how long, in seconds, to trust the
+  version key from the local cache.
+
+Since all values are stored with the group version, they can't be stale as
+long as the version is correct.  The version key is only kept locally for a
+short time, so invalidate() called from a different process will take effect
+after at most ``CACHE_GROUP_LOCAL_CACHE_STALENESS`` seconds.  If all keys for
+a get_many() call are found locally, then we skip the memcached round trip
+entirely.  We track hits and misses for each cache pattern in
+``local_cache_stats``.
+
+.. _cache-timeouts:
+
+Timeouts
+^^^^^^^^
+
+By default values are stored using the default timeout for the cache
+backend.  :class:`TTLPolicy` can be used to pick the timeouts for a
+CacheGroup.  It supports a default timeout for the group, timeouts for keys
+matching a glob-style pattern and random jitter, which helps avoid lots of
+values expiring at the same time.  If a CacheGroup is created without a
+policy, we use the one in ``CACHE_GROUP_TTL_POLICIES`` for its cache
+pattern, if any.  Passing an explicit timeout to set()/set_many()/set_model()
+overrides the policy.
+
+If ``CACHE_GROUP_SIZE_STATS`` is True, we also track the sizes of the values
+stored for each type of CacheGroup (the first part of the prefix, for example
+``video``).  Use the ``cache_size_report`` command to see them.
+
 .. _cache-race-condition-prevention:
 
 Race condition prevention
@@ -158,34 +214,272 @@ attribute to your class definition.
 
 .. autoclass:: CacheGroup
 .. autoclass:: ModelCacheManager
+.. autoclass:: TTLPolicy
 """
 from __future__ import absolute_import
 import collections
+import cPickle as pickle
+import fnmatch
+import math
+import random
+import threading
+import time
 
 from django.conf import settings
 from django.core.cache import cache
 
+from caching.codecs import get_model_codec
 from utils import codes
 
 def get_commit_id():
     return settings.LAST_COMMIT_GUID
 
+class _LocalCache(object):
+    """In-process LRU cache used in front of memcached
+
+    Values are stored with an expiration time and the cache is limited to
+    CACHE_GROUP_LOCAL_CACHE_SIZE bytes.  Non-string values are stored pickled
+    so that we can measure their size and so that callers can't modify our
+    copy of the data.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            # map keys to (expire_time, is_pickled, data) tuples
+            self.data = collections.OrderedDict()
+            self.size = 0
+
+    def max_size(self):
+        return getattr(settings, 'CACHE_GROUP_LOCAL_CACHE_SIZE', 0)
+
+    def enabled(self):
+        return self.max_size() > 0
+
+    def get_many(self, keys):
+        """Get values from the local cache
+
+        Returns a dict mapping keys to values for the keys that we found.
+        """
+        now = time.time()
+        found = {}
+        with self.lock:
+            for key in keys:
+                try:
+                    expire_time, is_pickled, data = self.data.pop(key)
+                except KeyError:
+                    continue
+                if expire_time < now:
+                    self.size -= len(data)
+                    continue
+                # re-insert the value to move it to the end of the LRU list
+                self.data[key] = (expire_time, is_pickled, data)
+                found[key] = (is_pickled, data)
+        return dict((key, pickle.loads(data) if is_pickled else data)
+                    for key, (is_pickled, data) in found.items())
+
+    def set(self, key, value, timeout):
+        if isinstance(value, str):
+            is_pickled, data = False, value
+        else:
+            is_pickled = True
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        max_size = self.max_size()
+        if len(data) > max_size:
+            return
+        with self.lock:
+            self._remove(key)
+            self.data[key] = (time.time() + timeout, is_pickled, data)
+            self.size += len(data)
+            while self.size > max_size:
+                self._remove(next(iter(self.data)))
+
+    def delete(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        try:
+            expire_time, is_pickled, data = self.data.pop(key)
+        except KeyError:
+            return
+        self.size -= len(data)
+
+_local_cache = _LocalCache()
+
+class LocalCacheStats(object):
+    """Track local cache usage for a cache pattern
+
+    Attributes:
+        hits: keys found in the local cache
+        misses: keys we needed to fetch from memcached
+        round_trips_saved: get_many() calls where we found all keys locally
+    """
+    def __init__(self):
+        self.hits = self.misses = self.round_trips_saved = 0
+
+    def __repr__(self):
+        return '<LocalCacheStats hits: {0} misses: {1} saved: {2}>'.format(
+            self.hits, self.misses, self.round_trips_saved)
+
+# map cache pattern IDs to LocalCacheStats objects
+local_cache_stats = collections.defaultdict(LocalCacheStats)
+
+class TTLPolicy(object):
+    """Decide the timeouts to use when storing CacheGroup values
+
+    Args:
+        default: timeout for keys that don't match any of the overrides.
+            None means use the default timeout for the cache backend.
+        overrides: dict mapping key patterns to timeouts.  Patterns use the
+            fnmatch syntax.  If multiple patterns match, we pick the
+            longest one.
+        jitter: if set, we reduce each timeout by a random fraction of up to
+            this amount.  For example, with jitter=0.1 a timeout of 100
+            becomes something from 90 to 100.
+    """
+    def __init__(self, default=None, overrides=None, jitter=0):
+        self.default = default
+        self.overrides = overrides or {}
+        # check longer patterns first since they're probably more specific
+        self._override_patterns = sorted(self.overrides, key=len,
+                                         reverse=True)
+        self.jitter = jitter
+
+    @classmethod
+    def for_cache_pattern(cls, cache_pattern):
+        """Get the policy for a cache pattern from our settings."""
+        policies = getattr(settings, 'CACHE_GROUP_TTL_POLICIES', {})
+        try:
+            config = policies[cache_pattern]
+        except KeyError:
+            return cls(getattr(settings, 'CACHE_GROUP_DEFAULT_TTL', None))
+        return cls(**config)
+
+    def base_timeout(self, key):
+        """Get the timeout for a key, before adding jitter."""
+        if key in self.overrides:
+            return self.overrides[key]
+        for pattern in self._override_patterns:
+            if fnmatch.fnmatchcase(key, pattern):
+                return self.overrides[pattern]
+        return self.default
+
+    def add_jitter(self, timeout):
+        if not timeout or not self.jitter:
+            return timeout
+        return max(1, int(timeout * (1 - random.uniform(0, self.jitter))))
+
+    def get_timeout(self, key, timeout=None):
+        """Get the timeout to store a key with
+
+        Args:
+            key: key being stored
+            timeout: timeout passed to set().  If this is not None, we use
+                it instead of checking the policy.
+        """
+        if timeout is not None:
+            return timeout
+        return self.add_jitter(self.base_timeout(key))
+
+class _ValueSizeStats(object):
+    """Track the size of values stored by CacheGroups
+
+    We track a histogram of value sizes for each type of cache group, using
+    power-of-2 buckets, similar to how memcached slabs work.  Like the cache
+    pattern registry, each process periodically merges its data into the
+    cache so that we can report on the totals.
+    """
+    cache_key = 'cache-group-size-stats'
+    min_bucket = 64
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        # map cache group types to dicts that map bucket sizes to counts
+        self.histograms = collections.defaultdict(
+            lambda: collections.defaultdict(int))
+        self.last_sync = time.time()
+
+    def enabled(self):
+        return getattr(settings, 'CACHE_GROUP_SIZE_STATS', False)
+
+    @classmethod
+    def bucket_for_size(cls, size):
+        bucket = cls.min_bucket
+        while bucket < size:
+            bucket *= 2
+        return bucket
+
+    @staticmethod
+    def value_size(value):
+        if isinstance(value, str):
+            return len(value)
+        else:
+            return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    def record(self, prefix, values):
+        group_type = prefix.split(':', 1)[0]
+        with self.lock:
+            histogram = self.histograms[group_type]
+            for value in values:
+                histogram[self.bucket_for_size(self.value_size(value))] += 1
+            sync_interval = getattr(settings, 'CACHE_PATTERN_SYNC_INTERVAL',
+                                    60)
+            if time.time() - self.last_sync >= sync_interval:
+                self._sync()
+
+    def sync(self):
+        with self.lock:
+            self._sync()
+
+    def _sync(self):
+        stored = cache.get(self.cache_key) or {}
+        for group_type, histogram in self.histograms.items():
+            stored_histogram = stored.setdefault(group_type, {})
+            for bucket, count in histogram.items():
+                stored_histogram[bucket] = (
+                    stored_histogram.get(bucket, 0) + count)
+        cache.set(self.cache_key, stored)
+        self.clear()
+
+    def report(self):
+        """Get the size stats stored in the cache
+
+        Returns:
+            dict mapping cache group types to a list of (bucket_size, count)
+            tuples, sorted by bucket size.
+        """
+        stored = cache.get(self.cache_key) or {}
+        return dict((group_type, sorted(histogram.items()))
+                    for group_type, histogram in stored.items())
+
+value_size_stats = _ValueSizeStats()
+
 class _CacheWrapper(object):
     """Wrap cache access for CacheGroup.
 
-    This class helps CacheGroup access the cache.  It does 2 things:
+    This class helps CacheGroup access the cache.  It does a few things:
         - adds the key prefix
         - remembers previously fetched values and avoids fetching them again
         - handles prefetching keys for a cache pattern
+        - optionally checks the local cache before going to memcached
     """
-    def __init__(self, prefix):
+    def __init__(self, prefix, version_key=None, cache_pattern=None):
         self.prefix = prefix
+        self.version_key = version_key
+        self.cache_pattern = cache_pattern
+        self.use_local_cache = (cache_pattern is not None and
+                                _local_cache.enabled())
         self._cache_data = {}
 
     def get(self, key):
-        value = cache.get(self._prefix_key(key))
-        self._cache_data[key] = value
-        return value
+        self._run_get_many([key])
+        return self._cache_data[key]
 
     def get_many(self, keys):
         unfetched_keys = [key for key in keys if key not in self._cache_data]
@@ -194,25 +488,211 @@ class _CacheWrapper(object):
         return dict((key, self._cache_data.get(key)) for key in keys)
 
     def _run_get_many(self, keys):
-        result = cache.get_many([self._prefix_key(key) for key in keys])
+        self.run_get_many_multi([(self, keys)])
+
+    @staticmethod
+    def run_get_many_multi(wrappers_and_keys):
+        """Fetch keys for several _CacheWrappers with 1 get_many() call
+
+        Args:
+            wrappers_and_keys: list of (cache_wrapper, keys) tuples
+        """
+        # map prefixed keys to (wrapper, key) tuples
+        keys_to_fetch = {}
+        for wrapper, keys in wrappers_and_keys:
+            if wrapper.use_local_cache and keys:
+                keys = wrapper._fetch_from_local_cache(keys)
+            for key in keys:
+                keys_to_fetch[wrapper._prefix_key(key)] = (wrapper, key)
+        if not keys_to_fetch:
+            return
+        result = cache.get_many(keys_to_fetch.keys())
+        for prefixed_key, (wrapper, key) in keys_to_fetch.items():
+            value = result.get(prefixed_key)
+            wrapper._cache_data[key] = value
+            if wrapper.use_local_cache and value is not None:
+                wrapper._set_local(key, value)
+
+    def _fetch_from_local_cache(self, keys):
+        """Fetch keys from the local cache
+
+        Returns the list of keys that still need to be fetched.
+        """
+        local_result = _local_cache.get_many(
+            [self._prefix_key(key) for key in keys])
+        missing_keys = []
         for key in keys:
-            self._cache_data[key] = result.get(self._prefix_key(key))
+            try:
+                self._cache_data[key] = local_result[self._prefix_key(key)]
+            except KeyError:
+                missing_keys.append(key)
+        stats = local_cache_stats[self.cache_pattern]
+        stats.hits += len(keys) - len(missing_keys)
+        stats.misses += len(missing_keys)
+        if not missing_keys:
+            stats.round_trips_saved += 1
+        return missing_keys
+
+    def _set_local(self, key, value):
+        if key == self.version_key:
+            timeout = getattr(settings, 'CACHE_GROUP_LOCAL_CACHE_STALENESS',
+                              5)
+        else:
+            timeout = getattr(settings, 'CACHE_GROUP_LOCAL_CACHE_TIMEOUT',
+                              300)
+        _local_cache.set(self._prefix_key(key), value, timeout)
 
     def set(self, key, value, timeout=None):
-        cache.set(self._prefix_key(key), value)
+        cache.set(self._prefix_key(key), value, timeout)
         self._cache_data[key] = value
+        if self.use_local_cache:
+            self._set_local(key, value)
+        if value_size_stats.enabled():
+            value_size_stats.record(self.prefix, [value])
 
     def set_many(self, values, timeout=None):
-        raw_values = dict((self._prefix_key(key), value)
-                          for (key, value) in values.items())
+        self.run_set_many_multi([(self, values)], timeout)
+
+    @staticmethod
+    def run_set_many_multi(wrappers_and_values, timeout=None):
+        """Set values for several _CacheWrappers with 1 set_many() call
+
+        Args:
+            wrappers_and_values: list of (cache_wrapper, values) tuples.
+                values is a dict mapping keys to values.
+            timeout: timeout to store the values with
+        """
+        raw_values = {}
+        for wrapper, values in wrappers_and_values:
+            for key, value in values.items():
+                raw_values[wrapper._prefix_key(key)] = value
         cache.set_many(raw_values, timeout)
-        self._cache_data.update(values)
+        for wrapper, values in wrappers_and_values:
+            wrapper._cache_data.update(values)
+            if wrapper.use_local_cache:
+                for key, value in values.items():
+                    wrapper._set_local(key, value)
+            if value_size_stats.enabled():
+                value_size_stats.record(wrapper.prefix, values.values())
+
+    def add(self, key, value, timeout):
+        return cache.add(self._prefix_key(key), value, timeout)
+
+    def delete(self, key):
+        cache.delete(self._prefix_key(key))
+        self._cache_data.pop(key, None)
+        if self.use_local_cache:
+            _local_cache.delete(self._prefix_key(key))
 
     def _prefix_key(self, key):
         return '{0}:{1}'.format(self.prefix, key)
 
-# map cache pattern IDs to the keys we've seen used
-_cache_pattern_memory = collections.defaultdict(set)
+class _CachePatternUsage(object):
+    """Track key usage for a single cache pattern
+
+    Attributes:
+        scores: map keys to their usage score.  This is roughly the fraction
+            of cache groups that use the key, averaged over time.  These
+            are the values that we store in the cache.
+        group_count: number of cache groups created since the last sync
+        key_counts: map keys to the number of cache groups that used them
+            since the last sync
+        last_sync: last time we synced with the cache
+    """
+    def __init__(self, cache_pattern):
+        self.cache_key = 'cache-pattern:{0}'.format(cache_pattern)
+        self.scores = cache.get(self.cache_key) or {}
+        self.group_count = 0
+        self.key_counts = collections.defaultdict(int)
+        self.last_sync = time.time()
+
+    def keys_to_prefetch(self):
+        keys = set(self.scores)
+        keys.update(self.key_counts)
+        return keys
+
+    def record_group(self):
+        self.group_count += 1
+
+    def record_keys(self, keys):
+        for key in keys:
+            self.key_counts[key] += 1
+        sync_interval = getattr(settings, 'CACHE_PATTERN_SYNC_INTERVAL', 60)
+        if time.time() - self.last_sync >= sync_interval:
+            self.sync()
+
+    def sync(self):
+        """Merge our usage data with the data stored in the cache."""
+        decay = getattr(settings, 'CACHE_PATTERN_DECAY', 0.2)
+        min_usage = getattr(settings, 'CACHE_PATTERN_MIN_USAGE', 0.01)
+        max_keys = getattr(settings, 'CACHE_PATTERN_MAX_KEYS', 100)
+
+        stored_scores = cache.get(self.cache_key) or {}
+        group_count = max(self.group_count, 1)
+        scores = {}
+        for key in set(stored_scores).union(self.key_counts):
+            usage = min(float(self.key_counts.get(key, 0)) / group_count, 1.0)
+            if key in stored_scores:
+                score = (1 - decay) * stored_scores[key] + decay * usage
+            else:
+                score = usage
+            if score >= min_usage:
+                scores[key] = score
+        if len(scores) > max_keys:
+            top_keys = sorted(scores, key=scores.get, reverse=True)[:max_keys]
+            scores = dict((key, scores[key]) for key in top_keys)
+        cache.set(self.cache_key, scores)
+        self.scores = scores
+        self.group_count = 0
+        self.key_counts.clear()
+        self.last_sync = time.time()
+
+class _CachePatternRegistry(object):
+    """Remember which keys get used for each cache pattern."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        # map cache pattern IDs to _CachePatternUsage objects
+        self.patterns = {}
+
+    def _get_usage(self, cache_pattern):
+        try:
+            return self.patterns[cache_pattern]
+        except KeyError:
+            usage = _CachePatternUsage(cache_pattern)
+            self.patterns[cache_pattern] = usage
+            return usage
+
+    def start_group(self, cache_pattern):
+        """Start using a new CacheGroup with a cache pattern
+
+        Returns: set of keys to prefetch for the group
+        """
+        with self.lock:
+            usage = self._get_usage(cache_pattern)
+            usage.record_group()
+            return usage.keys_to_prefetch()
+
+    def record_keys(self, cache_pattern, keys):
+        """Record that a CacheGroup used a set of keys
+
+        This should only be called once per key for each CacheGroup.
+        """
+        with self.lock:
+            self._get_usage(cache_pattern).record_keys(keys)
+
+    def keys_to_prefetch(self, cache_pattern):
+        with self.lock:
+            return self._get_usage(cache_pattern).keys_to_prefetch()
+
+    def sync(self, cache_pattern):
+        with self.lock:
+            self._get_usage(cache_pattern).sync()
+
+_cache_pattern_registry = _CachePatternRegistry()
 
 class CacheGroup(object):
     """Manage a group of cached values
@@ -221,35 +701,47 @@ class CacheGroup(object):
         prefix(str): prefix keys with this
         cache_pattern(str): :ref:`cache pattern <cache-patterns>` identifier
         invalidate_on_deploy(bool): Invalidate values when we redeploy
+        ttl_policy(TTLPolicy): :ref:`timeout policy <cache-timeouts>` to use.
+            If None, we use the policy for our cache pattern.
 
     .. automethod:: get
     .. automethod:: get_many
     .. automethod:: set
     .. automethod:: set_many
     .. automethod:: get_or_calc
+    .. automethod:: get_or_calc_single_flight
     .. automethod:: get_model
     .. automethod:: set_model
     .. automethod:: invalidate
 
     """
 
-    def __init__(self, prefix, cache_pattern=None, invalidate_on_deploy=True):
+    def __init__(self, prefix, cache_pattern=None, invalidate_on_deploy=True,
+                 ttl_policy=None):
         self.prefix = prefix
-        self.cache_wrapper = _CacheWrapper(prefix)
+        if ttl_policy is None:
+            ttl_policy = TTLPolicy.for_cache_pattern(cache_pattern)
+        self.ttl_policy = ttl_policy
+        if invalidate_on_deploy:
+            self.version_key = 'version:{0}'.format(get_commit_id())
+        else:
+            self.version_key = 'version'
+        self.cache_wrapper = _CacheWrapper(prefix, self.version_key,
+                                           cache_pattern)
         if cache_pattern:
-            # copy the values from _cache_pattern_memory now.  It's going to
-            # change as we fetch keys and for sanity sake we should not care
-            # about that
+            # get the keys from _cache_pattern_registry now.  The registry is
+            # going to change as we fetch keys and for sanity sake we should
+            # not care about that
             self._cache_pattern_keys = \
-                    set(_cache_pattern_memory[cache_pattern])
+                    _cache_pattern_registry.start_group(cache_pattern)
         else:
             self._cache_pattern_keys = None
+        # keys that we've recorded with _cache_pattern_registry
+        self._recorded_keys = set()
         self.cache_pattern = cache_pattern
         self.current_version = None
-        if invalidate_on_deploy:
-            self.version_key = 'version:{0}'.format(get_commit_id())
-        else:
-            self.version_key = 'version'
+        # keys where get_or_calc_single_flight() returned a stale value
+        self.stale_keys = set()
         self.invalidate_on_deploy = invalidate_on_deploy
 
     def invalidate(self):
@@ -282,22 +774,7 @@ class CacheGroup(object):
 
         If there is no value set for our version key, we set it now.
         """
-        if self.cache_pattern:
-            _cache_pattern_memory[self.cache_pattern].update(keys)
-        keys_to_fetch = set(keys)
-        if self.current_version is None:
-            keys_to_fetch.add(self.version_key)
-        if self._cache_pattern_keys:
-            keys_to_fetch.update(self._cache_pattern_keys)
-            self._cache_pattern_keys = None
-        get_many_result = self.cache_wrapper.get_many(keys_to_fetch)
-        # first of all, handle the version.
-        if self.current_version is None:
-            if get_many_result[self.version_key] is None:
-                self.invalidate()
-                return {}
-            else:
-                self.current_version = get_many_result[self.version_key]
+        get_many_result = self._get_many_raw(keys)
         result = {}
         for key in keys:
             cache_value = get_many_result.get(key)
@@ -306,19 +783,57 @@ class CacheGroup(object):
                 result[key] = value
         return result
 
+    def _get_many_raw(self, keys):
+        """Fetch packed values from the cache
+
+        This handles the cache pattern and version key logic for get_many(),
+        but returns the values without checking their version.
+        """
+        get_many_result = self.cache_wrapper.get_many(
+            self._keys_to_fetch(keys))
+        # first of all, handle the version.
+        if self.current_version is None:
+            if get_many_result[self.version_key] is None:
+                self.invalidate()
+            else:
+                self.current_version = get_many_result[self.version_key]
+        return get_many_result
+
+    def _keys_to_fetch(self, keys):
+        """Get the keys to fetch for a get_many() call
+
+        This includes keys from our cache pattern and the version key.
+        """
+        if self.cache_pattern:
+            new_keys = set(keys).difference(self._recorded_keys)
+            if new_keys:
+                _cache_pattern_registry.record_keys(self.cache_pattern,
+                                                    new_keys)
+                self._recorded_keys.update(new_keys)
+        keys_to_fetch = set(keys)
+        if self.current_version is None:
+            keys_to_fetch.add(self.version_key)
+        if self._cache_pattern_keys:
+            keys_to_fetch.update(self._cache_pattern_keys)
+            self._cache_pattern_keys = None
+        return keys_to_fetch
+
     def set(self, key, value, timeout=None):
-        """Set a value in the cache """
+        """Set a value in the cache
+
+        If timeout is None, we use our TTLPolicy to pick it.
+        """
         self.ensure_version()
-        self.cache_wrapper.set(key, self._pack_cache_value(value), timeout)
+        self.cache_wrapper.set(key, self._pack_cache_value(value),
+                               self.ttl_policy.get_timeout(key, timeout))
 
     def set_many(self, values, timeout=None):
-        """Set multiple values in the cache """
-        self.ensure_version()
-        values_to_set = dict(
-            (key, self._pack_cache_value(value))
-            for key, value in values.items()
-        )
-        self.cache_wrapper.set_many(values_to_set, timeout)
+        """Set multiple values in the cache
+
+        If timeout is None, we use our TTLPolicy to pick the timeout for each
+        key.
+        """
+        set_many_multi_group([(self, values)], timeout)
 
     def get_or_calc(self, key, work_func, *args, **kwargs):
         """Shortcut for the typical cache usage pattern
@@ -339,6 +854,103 @@ class CacheGroup(object):
         self.set(key, calculated_value)
         return calculated_value
 
+    def get_or_calc_single_flight(self, key, work_func, timeout=None,
+                                  wait_time=1.0, lease_time=10, beta=1.0):
+        """Version of get_or_calc() that protects against cache stampedes
+
+        Use this for values that are expensive to calculate and are fetched
+        by many requests at once.  On a cache miss, only one caller
+        calculates the value.  We use cache.add() to take a short lease on
+        the key and whoever gets the lease calls work_func().  Other callers
+        will:
+
+        - Return the value from the previous version of the group if there
+          is one.  These keys get added to stale_keys.
+        - Otherwise, wait up to wait_time seconds for the value to be
+          calculated.  If it's still not there, calculate it ourselves.
+
+        If timeout is given, we also do probabilistic early refreshes: as
+        the value gets closer to expiring, callers are more and more likely
+        to recalculate it before it does.  beta controls how aggressive this
+        is, higher values mean earlier refreshes.
+
+        Values stored by this method are packed with some extra data, so
+        they should only be fetched with get_or_calc_single_flight().
+
+        Args:
+            key: key to fetch
+            work_func: function that takes no arguments and calculates the
+                value.
+            timeout: timeout to store the value with
+            wait_time: max seconds to wait for another process to
+                calculate the value
+            lease_time: max seconds that the lease lasts for
+            beta: scale factor for early refreshes.
+        """
+        cache_value = self._get_many_raw([key]).get(key)
+        version, value = self._unpack_cache_value(cache_value)
+        if isinstance(value, tuple) and len(value) == 3:
+            data, delta, expire_time = value
+        else:
+            data = delta = expire_time = version = None
+
+        if version == self.current_version:
+            if not self._should_refresh_early(delta, expire_time, beta):
+                return data
+            # early refresh: if someone else is already working on it,
+            # return the current value
+            if not self._acquire_lease(key, lease_time):
+                return data
+        elif not self._acquire_lease(key, lease_time):
+            if version is not None:
+                self.stale_keys.add(key)
+                return data
+            value = self._wait_for_single_flight_value(key, wait_time)
+            if value is not None:
+                return value
+            # the other process is taking too long, calculate the value
+            # ourselves without storing it
+            return work_func()
+        try:
+            return self._calc_single_flight_value(key, work_func, timeout)
+        finally:
+            self.cache_wrapper.delete(self._lease_key(key))
+
+    def _lease_key(self, key):
+        return 'lease:{0}'.format(key)
+
+    def _acquire_lease(self, key, lease_time):
+        return self.cache_wrapper.add(self._lease_key(key), 1, lease_time)
+
+    def _should_refresh_early(self, delta, expire_time, beta):
+        if expire_time is None:
+            return False
+        # This is the XFetch algorithm.  random.random() can return 0, so
+        # use 1 - random.random() to keep the log() argument in (0, 1]
+        jitter = delta * beta * -math.log(1.0 - random.random())
+        return time.time() + jitter >= expire_time
+
+    def _calc_single_flight_value(self, key, work_func, timeout):
+        start_time = time.time()
+        data = work_func()
+        end_time = time.time()
+        if timeout:
+            expire_time = end_time + timeout
+        else:
+            expire_time = None
+        self.set(key, (data, end_time - start_time, expire_time), timeout)
+        return data
+
+    def _wait_for_single_flight_value(self, key, wait_time):
+        give_up_time = time.time() + wait_time
+        while time.time() < give_up_time:
+            time.sleep(0.05)
+            version, value = self._unpack_cache_value(
+                self.cache_wrapper.get(key))
+            if version == self.current_version and isinstance(value, tuple):
+                return value[0]
+        return None
+
     def get_model(self, ModelClass, key):
         """Get a model stored with set_model()
 
@@ -354,7 +966,7 @@ class CacheGroup(object):
         if value == 'does-not-exist':
             raise ModelClass.DoesNotExist()
         try:
-            instance = self._tuple_to_model(ModelClass, value)
+            instance = self._decode_model(ModelClass, value)
         except StandardError:
             # invalid data stored or we're fetching the wrong cache key, don't
             # return anything.
@@ -368,9 +980,9 @@ class CacheGroup(object):
     def set_model(self, key, instance, timeout=None):
         """Store a model instance in the cache
 
-        Storing a model is a tricky thing.  This method works by storing a
-        tuple containing the values of the DB row.  We store it like that for
-        2 reasons:
+        Storing a model is a tricky thing.  This method works by storing the
+        values of the DB row, encoded by a :mod:`ModelCodec
+        <caching.codecs>`.  We store it like that for 2 reasons:
 
         - It's space efficient
         - It drops things like cached related objects.  This is probably good
@@ -383,11 +995,14 @@ class CacheGroup(object):
                       does not exist in the DB.  This will make get_model()
                       raise a ObjectDoesNotExist exception.
         """
+        self.set(key, self._model_cache_value(instance), timeout)
+
+    def _model_cache_value(self, instance):
+        """Get the value that set_model() stores for an instance."""
         if instance is not None:
-            value = self._model_to_tuple(instance)
+            return self._encode_model(instance)
         else:
-            value = 'does-not-exist'
-        self.set(key, value, timeout)
+            return 'does-not-exist'
 
     def _pack_cache_value(self, value):
         """Combine our version and value together to get a value to store in
@@ -413,16 +1028,62 @@ class CacheGroup(object):
         return (None, None)
 
     @staticmethod
-    def _model_to_tuple(instance):
-        return tuple(getattr(instance, f.column, None)
-                     for f in instance._meta.fields)
+    def _encode_model(instance):
+        return get_model_codec(instance._meta.concrete_model).encode(instance)
 
     @staticmethod
-    def _tuple_to_model(ModelClass, tup):
-        value_dict = dict(
-            (f.column, tup[i])
-            for i, f in enumerate(ModelClass._meta.fields))
-        return ModelClass(**value_dict)
+    def _decode_model(ModelClass, data):
+        return get_model_codec(ModelClass).decode(data)
+
+def get_many_multi_group(cache_groups, keys):
+    """Get values from multiple CacheGroups with 1 get_many() call
+
+    This works like calling get_many() for each cache group, but only makes a
+    single round trip to the cache.  This includes the version keys and the
+    keys from the cache patterns of each group.
+
+    Returns:
+        list of dicts, one for each cache group, like the return value of
+        get_many().
+    """
+    _CacheWrapper.run_get_many_multi([
+        (cache_group.cache_wrapper, cache_group._keys_to_fetch(keys))
+        for cache_group in cache_groups
+    ])
+    # now all the data is stored in the _CacheWrappers and get_many() won't
+    # need to go to the cache
+    return [cache_group.get_many(keys) for cache_group in cache_groups]
+
+def set_many_multi_group(groups_and_values, timeout=None):
+    """Set values for multiple CacheGroups
+
+    We make 1 set_many() call for each timeout used.  If timeout is None, we
+    use the TTLPolicy for each group to pick the timeout for each key.
+
+    Args:
+        groups_and_values: list of (cache_group, values) tuples.  values is a
+            dict mapping keys to values.
+        timeout: timeout to use for all values
+    """
+    # group values by timeout so that we can make 1 set_many() call for
+    # each one.  Only add the jitter once per group for the same reason.
+    values_by_timeout = collections.defaultdict(
+        lambda: collections.defaultdict(dict))
+    policies = {}
+    for cache_group, values in groups_and_values:
+        cache_group.ensure_version()
+        for key, value in values.items():
+            if timeout is not None:
+                key_timeout = timeout
+            else:
+                key_timeout = cache_group.ttl_policy.base_timeout(key)
+            policies.setdefault(key_timeout, cache_group.ttl_policy)
+            values_by_timeout[key_timeout][cache_group.cache_wrapper][key] = \
+                    cache_group._pack_cache_value(value)
+    for key_timeout, wrapper_values in values_by_timeout.items():
+        if timeout is None:
+            key_timeout = policies[key_timeout].add_jitter(key_timeout)
+        _CacheWrapper.run_set_many_multi(wrapper_values.items(), key_timeout)
 
 class ModelCacheManager(object):
     """Manage CacheGroups for a django model.
@@ -440,10 +1101,12 @@ class ModelCacheManager(object):
     .. automethod:: get_cache_group
     .. automethod:: invalidate_by_pk
     .. automethod:: get_instance
+    .. automethod:: get_instances
 
     """
-    def __init__(self, default_cache_pattern=None):
+    def __init__(self, default_cache_pattern=None, ttl_policy=None):
         self.default_cache_pattern = default_cache_pattern
+        self.ttl_policy = ttl_policy
         # we will set in __get__ once the attribute is accessed
         self.model_class = None
 
@@ -460,7 +1123,8 @@ class ModelCacheManager(object):
         """
         if cache_pattern is None:
             cache_pattern = self.default_cache_pattern
-        return CacheGroup(self._make_prefix(pk), cache_pattern)
+        return CacheGroup(self._make_prefix(pk), cache_pattern,
+                          ttl_policy=self.ttl_policy)
 
     def invalidate_by_pk(self, pk):
         """Invalidate a CacheGroup for an instance
@@ -487,6 +1151,53 @@ class ModelCacheManager(object):
         instance._cache_group = cache_group
         return instance
 
+    def get_instances(self, pks, cache_pattern=None):
+        """Get cached instances for multiple primary keys
+
+        This works like get_instance(), but it handles all the pks at once.
+        We fetch all the cached instances with 1 get_many() call, load the
+        cache misses with 1 DB query, then store them with 1 set_many() call.
+
+        Returns:
+            list of instances, in the same order as pks.  pks that don't
+            exist in the DB are skipped.
+        """
+        cache_groups = collections.OrderedDict(
+            (pk, self.get_cache_group(pk, cache_pattern)) for pk in pks)
+        get_many_multi_group(cache_groups.values(), self.batch_keys())
+        instances = {}
+        missing_pks = []
+        for pk, cache_group in cache_groups.items():
+            try:
+                instance = cache_group.get_model(self.model_class, 'self')
+            except self.model_class.DoesNotExist:
+                continue
+            if instance is None:
+                missing_pks.append(pk)
+            else:
+                instances[pk] = instance
+        if missing_pks:
+            loaded = self.model_class.objects.in_bulk(missing_pks)
+            set_many_multi_group([
+                (cache_groups[pk], {
+                    'self': cache_groups[pk]._model_cache_value(
+                        loaded.get(pk)),
+                })
+                for pk in missing_pks
+            ])
+            instances.update(loaded)
+        for pk, instance in instances.items():
+            instance._cache_group = cache_groups[pk]
+        return [instances[pk] for pk in cache_groups if pk in instances]
+
+    def batch_keys(self):
+        """Keys to fetch for each instance in get_instances()
+
+        Subclasses can override this to fetch extra values for the
+        instances.
+        """
+        return ['self']
+
     def __get__(self, instance, owner):
         self.model_class = owner
         if instance is None:
@@ -0,0 +1,146 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+"""
+Model Codecs
+------------
+
+Model codecs convert model instances to strings for
+:meth:`CacheGroup.set_model() <caching.cachegroup.CacheGroup.set_model>` and
+back again for :meth:`CacheGroup.get_model()
+<caching.cachegroup.CacheGroup.get_model>`.
+
+The encoded data looks like this: ``m<schema-hash><flag><payload>``
+
+- **schema-hash** is a hash of the model name and the names/types of the
+  stored fields.  If a migration changes the model, the hash changes and we
+  won't try to decode data stored with the old schema.
+- **flag** is ``p`` for a pickled tuple of field values, or ``z`` for a
+  zlib-compressed one.  We compress the data when the pickled tuple is
+  larger than the codec's compress_threshold.
+
+Storing a string rather than a tuple means the cache backend doesn't have to
+pickle it again, and the binary pickle protocol is much more compact than the
+default one.
+
+By default we store all fields and construct instances by passing the field
+values positionally to the model class, which is the fastest way to create a
+django model.  Use :func:`register_model_codec` to store a subset of fields
+for a model.  In that case, instances are created using a deferred model
+class, so the missing fields get loaded from the DB if they are accessed.
+
+.. autoclass:: ModelCodec
+.. autofunction:: register_model_codec
+.. autofunction:: get_model_codec
+"""
+
+from __future__ import absolute_import
+import cPickle as pickle
+import hashlib
+import zlib
+
+from django.conf import settings
+from django.db.models.query_utils import deferred_class_factory
+
+class ModelCodec(object):
+    """Encode/decode model instances for the cache
+
+    Args:
+        ModelClass: Model class to handle
+        fields: list of field names to store.  None means store all fields.
+        compress_threshold: compress data larger than this many bytes.  None
+            means use the CACHE_MODEL_COMPRESS_THRESHOLD setting.
+    """
+    def __init__(self, ModelClass, fields=None, compress_threshold=None):
+        self.ModelClass = ModelClass
+        all_fields = ModelClass._meta.fields
+        if fields is None:
+            self.fields = list(all_fields)
+            self.construct = self._construct_all_fields
+        else:
+            self.fields = [f for f in all_fields if f.name in fields or
+                           f.attname in fields or f.primary_key]
+            self.attnames = [f.attname for f in self.fields]
+            self.DeferredClass = deferred_class_factory(
+                ModelClass, [f.attname for f in all_fields
+                             if f not in self.fields])
+            self.construct = self._construct_deferred
+        if compress_threshold is None:
+            compress_threshold = getattr(
+                settings, 'CACHE_MODEL_COMPRESS_THRESHOLD', 1024)
+        self.compress_threshold = compress_threshold
+        self.header = 'm' + self.calc_schema_hash()
+
+    def calc_schema_hash(self):
+        schema = [self.ModelClass._meta.db_table]
+        schema.extend('{0}:{1}'.format(f.column, f.get_internal_type())
+                      for f in self.fields)
+        return hashlib.md5(','.join(schema)).hexdigest()[:8]
+
+    def encode(self, instance):
+        data = pickle.dumps(tuple(getattr(instance, f.attname, None)
+                                  for f in self.fields),
+                            pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.compress_threshold:
+            return ''.join((self.header, 'z', zlib.compress(data)))
+        else:
+            return ''.join((self.header, 'p', data))
+
+    def decode(self, data):
+        """Decode a string created with encode()
+
+        Raises:
+            ValueError: data is not valid for this codec.  This happens if the
+                schema changed since the data was encoded.
+        """
+        header_len = len(self.header)
+        if not data.startswith(self.header):
+            raise ValueError("Schema mismatch")
+        flag = data[header_len]
+        payload = data[header_len+1:]
+        if flag == 'z':
+            payload = zlib.decompress(payload)
+        elif flag != 'p':
+            raise ValueError("Invalid flag: {0}".format(flag))
+        return self.construct(pickle.loads(payload))
+
+    def _construct_all_fields(self, values):
+        # passing values positionally avoids django's kwargs handling
+        return self.ModelClass(*values)
+
+    def _construct_deferred(self, values):
+        return self.DeferredClass(**dict(zip(self.attnames, values)))
+
+# map model classes to their codecs
+_model_codecs = {}
+
+def register_model_codec(ModelClass, fields=None, compress_threshold=None):
+    """Customize the codec for a model class
+
+    See ModelCodec for a description of the arguments.
+    """
+    _model_codecs[ModelClass] = ModelCodec(ModelClass, fields,
+                                           compress_threshold)
+
+def get_model_codec(ModelClass):
+    """Get the ModelCodec to use for a model class."""
+    try:
+        return _model_codecs[ModelClass]
+    except KeyError:
+        codec = _model_codecs[ModelClass] = ModelCodec(ModelClass)
+        return codec
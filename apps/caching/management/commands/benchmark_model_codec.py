@@ -0,0 +1,89 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+import cPickle as pickle
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+
+from auth.models import CustomUser as User
+from caching.codecs import get_model_codec
+from teams.models import TeamVideo
+from videos.models import Video
+
+class Command(BaseCommand):
+    help = (u'Compare the size and decode time of cached models for the old '
+            'tuple format and the model codec')
+    option_list = BaseCommand.option_list + (
+        make_option('-c', '--count', dest='count', default=100, type='int',
+                    help='Number of instances of each model to test with'),
+        make_option('-r', '--repeat', dest='repeat', default=100,
+                    type='int', help='Number of times to decode each value'),
+    )
+
+    def handle(self, **options):
+        for ModelClass in (Video, TeamVideo, User):
+            instances = list(ModelClass.objects.all()[:options['count']])
+            if not instances:
+                self.stdout.write("{0}: no instances\n".format(
+                    ModelClass.__name__))
+                continue
+            self.benchmark(ModelClass, instances, options['repeat'])
+
+    def benchmark(self, ModelClass, instances, repeat):
+        codec = get_model_codec(ModelClass)
+        fields = ModelClass._meta.fields
+
+        # The old format: a tuple of values pickled by the cache backend
+        # using pickle protocol 0.
+        def old_encode(instance):
+            return pickle.dumps(tuple(getattr(instance, f.column, None)
+                                      for f in fields), 0)
+
+        def old_decode(data):
+            tup = pickle.loads(data)
+            return ModelClass(**dict((f.column, tup[i])
+                                     for i, f in enumerate(fields)))
+
+        old_data = [old_encode(i) for i in instances]
+        new_data = [codec.encode(i) for i in instances]
+        old_time = self.time_decode(old_decode, old_data, repeat)
+        new_time = self.time_decode(codec.decode, new_data, repeat)
+        old_size = sum(len(d) for d in old_data)
+        new_size = sum(len(d) for d in new_data)
+        count = len(instances)
+        self.stdout.write("{0} ({1} instances)\n".format(ModelClass.__name__,
+                                                         count))
+        self.stdout.write("  bytes/instance: old {0:.0f} new {1:.0f} "
+                          "({2:.1%})\n".format(
+                              float(old_size) / count,
+                              float(new_size) / count,
+                              float(new_size) / old_size))
+        self.stdout.write("  decode usec/instance: old {0:.1f} new {1:.1f} "
+                          "({2:.1%})\n".format(
+                              old_time * 1000000 / (count * repeat),
+                              new_time * 1000000 / (count * repeat),
+                              new_time / old_time))
+
+    def time_decode(self, decode, data_list, repeat):
+        start_time = time.time()
+        for i in xrange(repeat):
+            for data in data_list:
+                decode(data)
+        return time.time() - start_time
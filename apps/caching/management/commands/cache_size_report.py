@@ -0,0 +1,38 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+from django.core.management.base import BaseCommand
+
+from caching.cachegroup import value_size_stats
+
+class Command(BaseCommand):
+    help = (u'Print the size distribution of values stored by CacheGroups '
+            '(requires CACHE_GROUP_SIZE_STATS)')
+
+    def handle(self, *args, **kwargs):
+        report = value_size_stats.report()
+        if not report:
+            self.stdout.write("no data\n")
+            return
+        for group_type in sorted(report):
+            histogram = report[group_type]
+            total = sum(count for bucket, count in histogram)
+            self.stdout.write("{0} ({1} values)\n".format(group_type, total))
+            for bucket, count in histogram:
+                self.stdout.write("  <= {0:>8} bytes: {1:>8} ({2:.1%})\n".format(
+                    bucket, count, float(count) / total))
@@ -25,8 +25,10 @@ from django.test.utils import override_settings
 from nose.tools import *
 import mock
 
-from caching.cachegroup import (CacheGroup, _cache_pattern_memory,
-                                ModelCacheManager)
+from caching.cachegroup import (CacheGroup, _cache_pattern_registry,
+                                ModelCacheManager, _local_cache,
+                                local_cache_stats, TTLPolicy,
+                                value_size_stats)
 from utils import test_utils
 from utils.factories import *
 from videos.models import Video
@@ -169,20 +171,184 @@ class CacheGroupTest(TestCase):
         self.invalidate_group()
         assert_not_equal(cache.get(version_key), None)
 
+class SingleFlightTest(TestCase):
+    def setUp(self):
+        self.work_func = mock.Mock(return_value='value')
+
+    def get_or_calc(self, **kwargs):
+        return make_cache_group().get_or_calc_single_flight(
+            'key', self.work_func, **kwargs)
+
+    def take_lease(self):
+        cache.set('cache-group-prefix:lease:key', 1)
+
+    def test_calc_and_store(self):
+        assert_equal(self.get_or_calc(), 'value')
+        assert_equal(self.get_or_calc(), 'value')
+        assert_equal(self.work_func.call_count, 1)
+
+    def test_lease_released(self):
+        self.get_or_calc()
+        assert_equal(cache.get('cache-group-prefix:lease:key'), None)
+
+    def test_lease_released_on_error(self):
+        self.work_func.side_effect = ValueError()
+        with assert_raises(ValueError):
+            self.get_or_calc()
+        assert_equal(cache.get('cache-group-prefix:lease:key'), None)
+
+    def test_stale_value(self):
+        # If another process is calculating the value, we should return the
+        # value from the previous version
+        self.get_or_calc()
+        make_cache_group().invalidate()
+        self.take_lease()
+        self.work_func.return_value = 'new-value'
+        cache_group = make_cache_group()
+        assert_equal(cache_group.get_or_calc_single_flight(
+            'key', self.work_func), 'value')
+        assert_equal(cache_group.stale_keys, set(['key']))
+        assert_equal(self.work_func.call_count, 1)
+
+    def test_wait_for_value(self):
+        # If another process is calculating the value and there's no
+        # stale value, we should wait for it
+        cache_group = make_cache_group()
+        # simulate the other process having the lease
+        cache_group.cache_wrapper.add = mock.Mock(return_value=False)
+        def other_process_finishes(seconds):
+            make_cache_group().get_or_calc_single_flight(
+                'key', lambda: 'other-value')
+        with mock.patch('time.sleep') as mock_sleep:
+            mock_sleep.side_effect = other_process_finishes
+            result = cache_group.get_or_calc_single_flight('key',
+                                                           self.work_func)
+        assert_equal(result, 'other-value')
+        assert_equal(self.work_func.call_count, 0)
+
+    def test_wait_timeout(self):
+        # If the value doesn't get calculated in time, we should calculate
+        # it ourselves
+        self.take_lease()
+        assert_equal(self.get_or_calc(wait_time=0), 'value')
+        assert_equal(self.work_func.call_count, 1)
+
+    def test_early_refresh(self):
+        with mock.patch('time.time') as mock_time:
+            mock_time.return_value = 1000
+            self.get_or_calc(timeout=100)
+            # far from the expiration time, we shouldn't refresh
+            mock_time.return_value = 1010
+            self.get_or_calc(timeout=100)
+            assert_equal(self.work_func.call_count, 1)
+            # close to the expiration time, we should refresh
+            mock_time.return_value = 1100
+            self.get_or_calc(timeout=100)
+            assert_equal(self.work_func.call_count, 2)
+
+class TTLPolicyTest(TestCase):
+    def test_default(self):
+        assert_equal(TTLPolicy().get_timeout('key'), None)
+        assert_equal(TTLPolicy(100).get_timeout('key'), 100)
+
+    def test_explicit_timeout(self):
+        assert_equal(TTLPolicy(100).get_timeout('key', 50), 50)
+
+    def test_overrides(self):
+        policy = TTLPolicy(100, {
+            'foo': 10,
+            'bar*': 20,
+            'bar-baz*': 30,
+        })
+        assert_equal(policy.get_timeout('foo'), 10)
+        assert_equal(policy.get_timeout('bar-1'), 20)
+        # when multiple patterns match, the longest one should win
+        assert_equal(policy.get_timeout('bar-baz-1'), 30)
+        assert_equal(policy.get_timeout('other'), 100)
+
+    def test_jitter(self):
+        policy = TTLPolicy(100, jitter=0.1)
+        with mock.patch('random.uniform') as mock_uniform:
+            mock_uniform.return_value = 0.05
+            assert_equal(policy.get_timeout('key'), 95)
+            assert_equal(mock_uniform.call_args, mock.call(0, 0.1))
+
+    @override_settings(CACHE_GROUP_TTL_POLICIES={
+        'foo': {'default': 100, 'overrides': {'bar': 10}},
+    })
+    def test_for_cache_pattern(self):
+        policy = make_cache_group(cache_pattern='foo').ttl_policy
+        assert_equal(policy.get_timeout('key'), 100)
+        assert_equal(policy.get_timeout('bar'), 10)
+        policy = make_cache_group(cache_pattern='other').ttl_policy
+        assert_equal(policy.get_timeout('key'), None)
+
+class CacheGroupTimeoutTest(TestCase):
+    def setUp(self):
+        self.cache_group = make_cache_group(
+            ttl_policy=TTLPolicy(100, {'short-*': 10}))
+        self.cache_group.ensure_version()
+        patcher = mock.patch('caching.cachegroup.cache')
+        self.mock_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_set(self):
+        self.cache_group.set('key', 'value')
+        self.cache_group.set('short-key', 'value')
+        self.cache_group.set('other-key', 'value', 50)
+        assert_equal([c[0][2] for c in self.mock_cache.set.call_args_list],
+                     [100, 10, 50])
+
+    def test_set_model(self):
+        self.cache_group.set_model('key', None)
+        assert_equal(self.mock_cache.set.call_args[0][2], 100)
+
+    def test_set_many(self):
+        # we should make 1 set_many() call for each timeout
+        self.cache_group.set_many({
+            'key': 'value',
+            'key2': 'value',
+            'short-key': 'value',
+        })
+        calls = dict((c[0][1], c[0][0].keys())
+                     for c in self.mock_cache.set_many.call_args_list)
+        assert_items_equal(calls.keys(), [100, 10])
+        assert_items_equal(calls[100], ['cache-group-prefix:key',
+                                        'cache-group-prefix:key2'])
+        assert_items_equal(calls[10], ['cache-group-prefix:short-key'])
+
+@override_settings(CACHE_GROUP_SIZE_STATS=True)
+class ValueSizeStatsTest(TestCase):
+    def tearDown(self):
+        value_size_stats.clear()
+
+    def test_report(self):
+        cache_group = CacheGroup('video:1', invalidate_on_deploy=False)
+        cache_group.set('small', 'a')
+        cache_group.set('big', 'a' * 1000)
+        CacheGroup('user:1', invalidate_on_deploy=False).set('key', 'a')
+        value_size_stats.sync()
+        report = value_size_stats.report()
+        # the small values also include the version value that we set when
+        # we created the group
+        assert_equal(report['video'], [(64, 2), (1024, 1)])
+        assert_equal(report['user'], [(64, 2)])
+
 class CacheGroupTest2(CacheGroupTest):
     # test non-string values, which go through a slightly different codepath
     CACHE_VALUE = {'value': 'test'}
 
 class CachePatternTest(TestCase):
     def tearDown(self):
-        _cache_pattern_memory.clear()
+        _cache_pattern_registry.clear()
 
     def test_remember_keys(self):
         # test that we remember fetched keys
         cache_group = make_cache_group(cache_pattern='foo')
         cache_group.get('a')
         cache_group.get_many(['b', 'c'])
-        assert_items_equal(_cache_pattern_memory['foo'], ['a', 'b', 'c'])
+        assert_items_equal(_cache_pattern_registry.keys_to_prefetch('foo'),
+                           ['a', 'b', 'c'])
 
     def test_remember_keys_two_runs(self):
         # test remembering fetched keys after multiple runs
@@ -190,7 +356,65 @@ class CachePatternTest(TestCase):
         cache_group.get('a')
         cache_group2 = make_cache_group(cache_pattern='foo')
         cache_group2.get_many(['b', 'c'])
-        assert_items_equal(_cache_pattern_memory['foo'], ['a', 'b', 'c'])
+        assert_items_equal(_cache_pattern_registry.keys_to_prefetch('foo'),
+                           ['a', 'b', 'c'])
+
+    def remember_keys(self, keys):
+        _cache_pattern_registry.start_group('foo')
+        _cache_pattern_registry.record_keys('foo', keys)
+
+    def simulate_new_process(self):
+        _cache_pattern_registry.sync('foo')
+        _cache_pattern_registry.clear()
+
+    def test_keys_shared_between_processes(self):
+        # test that keys get stored in the cache so that new processes can
+        # use them right away
+        make_cache_group(cache_pattern='foo').get_many(['a', 'b'])
+        self.simulate_new_process()
+        assert_items_equal(_cache_pattern_registry.keys_to_prefetch('foo'),
+                           ['a', 'b'])
+
+    def test_sync_interval(self):
+        # we should sync with the cache after CACHE_PATTERN_SYNC_INTERVAL
+        # seconds
+        with mock.patch('time.time') as mock_time:
+            mock_time.return_value = 1000
+            make_cache_group(cache_pattern='foo').get('a')
+            assert_equal(cache.get('cache-pattern:foo'), None)
+            mock_time.return_value = 1000 + 60
+            make_cache_group(cache_pattern='foo').get('b')
+            assert_items_equal(cache.get('cache-pattern:foo').keys(),
+                               ['a', 'b'])
+
+    def test_unused_keys_get_dropped(self):
+        make_cache_group(cache_pattern='foo').get_many(['a', 'b'])
+        self.simulate_new_process()
+        # after a while of only using a, b should be dropped
+        for i in range(30):
+            make_cache_group(cache_pattern='foo').get('a')
+            self.simulate_new_process()
+        assert_items_equal(_cache_pattern_registry.keys_to_prefetch('foo'),
+                           ['a'])
+
+    def test_rarely_used_keys_get_dropped(self):
+        # keys used by less than CACHE_PATTERN_MIN_USAGE of the cache groups
+        # should never be remembered
+        for i in range(200):
+            make_cache_group(cache_pattern='foo').get('a')
+        make_cache_group(cache_pattern='foo').get('b')
+        self.simulate_new_process()
+        assert_items_equal(_cache_pattern_registry.keys_to_prefetch('foo'),
+                           ['a'])
+
+    @override_settings(CACHE_PATTERN_MAX_KEYS=2)
+    def test_max_keys(self):
+        for i in range(3):
+            make_cache_group(cache_pattern='foo').get_many(['a', 'b'])
+        make_cache_group(cache_pattern='foo').get('c')
+        self.simulate_new_process()
+        assert_items_equal(_cache_pattern_registry.keys_to_prefetch('foo'),
+                           ['a', 'b'])
 
     def make_mocked_cache_group(self):
         cache_group = make_cache_group(cache_pattern='foo')
@@ -203,7 +427,7 @@ class CachePatternTest(TestCase):
     def test_get_with_previous_key(self):
         # test calling get() with previously seen keys.  We should use
         # get_many() to fetch them all at once
-        _cache_pattern_memory['foo'] = set(['a', 'b'])
+        self.remember_keys(['a', 'b'])
         cache_group = self.make_mocked_cache_group()
         cache_group.get('a')
         assert_equal(cache_group.cache_wrapper.get_many.call_args,
@@ -213,7 +437,7 @@ class CachePatternTest(TestCase):
         # test calling get() twice.  On the first call we should fetch the
         # previous keys, but on the second one we should just fetch the new
         # value
-        _cache_pattern_memory['foo'] = set(['a', 'b'])
+        self.remember_keys(['a', 'b'])
         cache_group = self.make_mocked_cache_group()
         cache_group.get('a')
         cache_group.cache_wrapper.get_many.reset_mock()
@@ -224,7 +448,7 @@ class CachePatternTest(TestCase):
     def test_get_with_new_key(self):
         # test calling get() with a key not previously seen.  We should fetch
         # that value plus the previously seen ones
-        _cache_pattern_memory['foo'] = set(['a', 'b'])
+        self.remember_keys(['a', 'b'])
         cache_group = self.make_mocked_cache_group()
         cache_group.get('c')
         assert_equal(cache_group.cache_wrapper.get_many.call_args,
@@ -234,17 +458,78 @@ class CachePatternTest(TestCase):
         # test calling get_many() with some previous keys and some new keys.
         # We should fetch all the previous keys and also any new keys passed
         # to get_many()
-        _cache_pattern_memory['foo'] = set(['a', 'b'])
+        self.remember_keys(['a', 'b'])
         cache_group = self.make_mocked_cache_group()
         cache_group.get_many(['b', 'c'])
         assert_equal(cache_group.cache_wrapper.get_many.call_args,
                      mock.call(set(['a', 'b', 'c', cache_group.version_key])))
 
+@override_settings(CACHE_GROUP_LOCAL_CACHE_SIZE=1024 * 1024)
+class LocalCacheTest(TestCase):
+    def setUp(self):
+        self.now = 1000
+        patcher = mock.patch('time.time', lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        _local_cache.clear()
+        _cache_pattern_registry.clear()
+        local_cache_stats.clear()
+
+    def populate_key(self, key, value):
+        make_cache_group(cache_pattern='foo').set(key, value)
+
+    def test_get_from_local_cache(self):
+        self.populate_key('key', 'value')
+        cache_group = make_cache_group(cache_pattern='foo')
+        with mock.patch('caching.cachegroup.cache') as mock_cache:
+            assert_equal(cache_group.get('key'), 'value')
+            assert_equal(mock_cache.get_many.call_count, 0)
+        assert_equal(local_cache_stats['foo'].round_trips_saved, 1)
+
+    def test_local_cache_returns_copies(self):
+        self.populate_key('key', {'a': 1})
+        make_cache_group(cache_pattern='foo').get('key')['a'] = 2
+        assert_equal(make_cache_group(cache_pattern='foo').get('key'),
+                     {'a': 1})
+
+    def test_no_cache_pattern(self):
+        # without a cache pattern we shouldn't use the local cache
+        make_cache_group().set('key', 'value')
+        with mock.patch('caching.cachegroup.cache') as mock_cache:
+            mock_cache.get_many.return_value = {}
+            make_cache_group().get('key')
+            assert_equal(mock_cache.get_many.call_count, 1)
+
+    def test_invalidate_in_other_process(self):
+        self.populate_key('key', 'value')
+        # simulate another process invalidating the group by changing the
+        # version key in memcached directly
+        cache.set('cache-group-prefix:version', 'new-version')
+        assert_equal(make_cache_group(cache_pattern='foo').get('key'),
+                     'value')
+        # once the staleness window passes, we should see the new version
+        self.now += 10
+        assert_equal(make_cache_group(cache_pattern='foo').get('key'), None)
+
+    def test_invalidate_in_this_process(self):
+        self.populate_key('key', 'value')
+        make_cache_group(cache_pattern='foo').invalidate()
+        assert_equal(make_cache_group(cache_pattern='foo').get('key'), None)
+
+    def test_size_limit(self):
+        with self.settings(CACHE_GROUP_LOCAL_CACHE_SIZE=100):
+            self.populate_key('key1', 'a' * 60)
+            self.populate_key('key2', 'b' * 60)
+            assert_true(_local_cache.size <= 100)
+            assert_false('cache-group-prefix:key1' in _local_cache.data)
+
 class ModelCachingTest(TestCase):
-    def test_model_to_tuple(self):
+    def test_encode_model(self):
         video = VideoFactory()
-        pickled = CacheGroup._model_to_tuple(video)
-        assert_equal(video, CacheGroup._tuple_to_model(Video, pickled))
+        encoded = CacheGroup._encode_model(video)
+        assert_equal(video, CacheGroup._decode_model(Video, encoded))
 
     def test_get_model_cache_miss(self):
         cache_group = make_cache_group()
@@ -332,6 +617,44 @@ class ModelCacheManagerTest(TestCase):
         # Check this by seeing if current_version is set
         assert_not_equal(instance._cache_group.current_version, None)
 
+    def test_get_instances(self):
+        other = User.objects.create_user('test-user2')
+        with self.assertNumQueries(1):
+            instances = self.model_cache_manager.get_instances(
+                [other.pk, self.pk])
+        assert_equal(instances, [other, self.instance])
+        # the second time around, everything should be cached and we should
+        # only make 1 round trip to the cache
+        with self.assertNumQueries(0):
+            with mock.patch('caching.cachegroup.cache') as mock_cache:
+                mock_cache.get_many.side_effect = cache.get_many
+                instances = self.model_cache_manager.get_instances(
+                    [other.pk, self.pk])
+        assert_equal(instances, [other, self.instance])
+        assert_equal(mock_cache.get_many.call_count, 1)
+        assert_equal(mock_cache.get.call_count, 0)
+
+    def test_get_instances_partial_cache_hit(self):
+        other = User.objects.create_user('test-user2')
+        self.model_cache_manager.get_instance(self.pk)
+        with self.assertNumQueries(1):
+            instances = self.model_cache_manager.get_instances(
+                [self.pk, other.pk])
+        assert_equal(instances, [self.instance, other])
+
+    def test_get_instances_missing_pk(self):
+        missing_pk = self.pk + 100
+        assert_equal(self.model_cache_manager.get_instances(
+            [self.pk, missing_pk]), [self.instance])
+        # we should also cache the fact that the pk doesn't exist
+        with self.assertNumQueries(0):
+            assert_equal(self.model_cache_manager.get_instances(
+                [self.pk, missing_pk]), [self.instance])
+
+    def test_get_instances_saves_cache_group(self):
+        instances = self.model_cache_manager.get_instances([self.pk])
+        assert_not_equal(instances[0]._cache_group.current_version, None)
+
     # Test implementation of the python descriptor protocol (AKA __get__)
     def test_descriptor_class_access(self):
         # When accessed via a class, the descriptor should just return the
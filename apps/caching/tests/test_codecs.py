@@ -0,0 +1,70 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program. If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+from __future__ import absolute_import
+
+from django.test import TestCase
+from nose.tools import *
+
+from caching.codecs import ModelCodec
+from teams.models import TeamVideo
+from utils.factories import *
+from videos.models import Video
+
+class ModelCodecTest(TestCase):
+    def check_round_trip(self, codec, instance):
+        decoded = codec.decode(codec.encode(instance))
+        assert_equal(decoded, instance)
+        for field in instance._meta.fields:
+            assert_equal(getattr(decoded, field.attname),
+                         getattr(instance, field.attname))
+        return decoded
+
+    def test_round_trip(self):
+        self.check_round_trip(ModelCodec(Video), VideoFactory())
+        self.check_round_trip(ModelCodec(TeamVideo), TeamVideoFactory())
+
+    def test_compression(self):
+        video = VideoFactory(description='a' * 5000)
+        codec = ModelCodec(Video, compress_threshold=1024)
+        encoded = codec.encode(video)
+        assert_equal(encoded[len(codec.header)], 'z')
+        assert_true(len(encoded) < 1024)
+        self.check_round_trip(codec, video)
+
+    def test_no_compression_for_small_values(self):
+        codec = ModelCodec(Video, compress_threshold=1024 * 1024)
+        encoded = codec.encode(VideoFactory())
+        assert_equal(encoded[len(codec.header)], 'p')
+
+    def test_schema_change(self):
+        # if the schema changes, we shouldn't try to decode the old data
+        video = VideoFactory()
+        encoded = ModelCodec(Video, fields=['title']).encode(video)
+        with assert_raises(ValueError):
+            ModelCodec(Video).decode(encoded)
+
+    def test_field_subset(self):
+        video = VideoFactory(title='title', description='description')
+        codec = ModelCodec(Video, fields=['title'])
+        decoded = codec.decode(codec.encode(video))
+        assert_equal(decoded.id, video.id)
+        assert_equal(decoded.title, 'title')
+        # fields not stored should be loaded from the DB
+        with self.assertNumQueries(1):
+            assert_equal(decoded.description, 'description')
@@ -0,0 +1,330 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+
+"""Search backends
+
+VideoQueryset.search() hands the query off to the backend named by the
+SEARCH_BACKEND setting:
+
+    - MySQLFulltextBackend (the default) uses the FULLTEXT index on
+      VideoIndex.text.
+    - InvertedIndexBackend keeps its own inverted index in a sqlite database
+      at SEARCH_INDEX_PATH and ranks results with BM25.
+
+Backends get the text from VideoIndex.calc_text() each time a VideoIndex row
+is written, and videos are removed when they get deleted.  Use the
+rebuild_search_index command to populate a backend from the existing
+VideoIndex rows.
+
+The InvertedIndexBackend database is a local file, so each host has its own
+copy.  Either point SEARCH_INDEX_PATH at storage that all the hosts share, or
+run rebuild_search_index on each host.  Index updates only get written on
+the host that handles them, so per-host copies will drift apart over time.
+"""
+
+from __future__ import division
+
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import math
+import os
+import re
+import sqlite3
+import threading
+
+from django.conf import settings
+from django.utils.importlib import import_module
+
+from utils.searching import get_terms
+
+DEFAULT_BACKEND = 'search.backends.MySQLFulltextBackend'
+
+_backends = {}
+
+def get_backend():
+    """Get the search backend to use, based on the SEARCH_BACKEND setting."""
+    path = getattr(settings, 'SEARCH_BACKEND', DEFAULT_BACKEND)
+    if path not in _backends:
+        module_name, class_name = path.rsplit('.', 1)
+        _backends[path] = getattr(import_module(module_name), class_name)()
+    return _backends[path]
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(text):
+    """Split text into lowercase tokens."""
+    return TOKEN_RE.findall(text.lower())
+
+def parse_query(query):
+    """Parse a search query into a list of (token, is_prefix) tuples.
+
+    Every token must match for a video to be returned.  A term that ends
+    with "*" is a prefix search.
+    """
+    clauses = []
+    for term in get_terms(query):
+        tokens = tokenize(term)
+        if not tokens:
+            continue
+        clauses.extend((token, False) for token in tokens[:-1])
+        clauses.append((tokens[-1], term.endswith('*')))
+    return clauses
+
+class SearchBackend(object):
+    """Base class for search backends."""
+
+    def search(self, query):
+        """Search for videos
+
+        Returns a list of video ids, with the best matches first.
+        """
+        raise NotImplementedError()
+
+    def filter_queryset(self, qs, query):
+        """Filter a Video queryset to the videos that match query.
+
+        Only the best SEARCH_MAX_RESULTS matches in qs are returned.  We
+        intersect the ranked ids with qs in batches of that size, so matches
+        that rank below the cap still get found for filtered querysets.  The
+        queryset is ordered by rank, callers can use order_by() to override
+        that.
+        """
+        max_results = getattr(settings, 'SEARCH_MAX_RESULTS', 1000)
+        ranked_ids = self.search(query)
+        video_ids = []
+        for start in xrange(0, len(ranked_ids), max_results):
+            batch = ranked_ids[start:start+max_results]
+            in_qs = set(qs.filter(id__in=batch).order_by()
+                        .values_list('id', flat=True))
+            video_ids.extend(video_id for video_id in batch
+                             if video_id in in_qs)
+            if len(video_ids) >= max_results:
+                break
+        video_ids = video_ids[:max_results]
+        if not video_ids:
+            return qs.none()
+        rank_sql = 'CASE {0}.id {1} END'.format(
+            qs.model._meta.db_table,
+            ' '.join('WHEN {0} THEN {1}'.format(int(video_id), i)
+                     for i, video_id in enumerate(video_ids)))
+        return (qs.filter(id__in=video_ids)
+                .extra(select={'search_rank': rank_sql},
+                       order_by=['search_rank']))
+
+    def index_texts(self, texts):
+        """Update the index
+
+        texts is a list of (video_id, text) tuples.  The text replaces any
+        text that was previously indexed for the video.
+        """
+        pass
+
+    def remove_videos(self, video_ids):
+        """Remove videos from the index."""
+        pass
+
+    def clear(self):
+        """Remove all videos from the index."""
+        pass
+
+class MySQLFulltextBackend(SearchBackend):
+    """Search using MySQL's FULLTEXT index on VideoIndex.text
+
+    The VideoIndex table is the index, so there's nothing to do when it gets
+    updated.  MySQL doesn't index terms with less than 3 chars, so we drop
+    those from the query.
+    """
+    def filter_queryset(self, qs, query):
+        terms = [t for t in get_terms(query) if len(t) > 2]
+        query = u' '.join(u'+"{}"'.format(t) for t in terms)
+        return qs.filter(index__text__search=query)
+
+    def search(self, query):
+        # boolean mode doesn't rank the results, so these are in id order
+        from videos.models import Video
+        qs = self.filter_queryset(Video.objects.all(), query)
+        return list(qs.order_by('id').values_list('id', flat=True))
+
+class InvertedIndexBackend(SearchBackend):
+    """Search using an inverted index stored in a local sqlite database
+
+    We store a posting list for each token, with the number of times the
+    token appears in each video's text.  All tokens are indexed, including
+    short ones, and there's no stemming, so this works the same way for all
+    languages.
+
+    Queries match videos that contain every token in the query and are
+    ranked using BM25.  Terms that end with "*" match any token with that
+    prefix.
+    """
+    # BM25 parameters
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, path=None):
+        if path is None:
+            path = getattr(settings, 'SEARCH_INDEX_PATH',
+                           os.path.join(settings.PROJECT_ROOT,
+                                        'search-index.sqlite'))
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        # sqlite connections can't be shared between threads or across a
+        # fork, so keep one per thread and re-connect if the pid changes.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            connection = sqlite3.connect(self.path, timeout=30,
+                                         isolation_level=None)
+            self._create_tables(connection)
+            self._local.connection = connection
+            self._local.pid = pid
+        return self._local.connection
+
+    def _create_tables(self, connection):
+        connection.executescript("""
+CREATE TABLE IF NOT EXISTS documents (
+    video_id INTEGER PRIMARY KEY,
+    length INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    video_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, video_id));
+CREATE INDEX IF NOT EXISTS postings_video_id ON postings (video_id);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    doc_count INTEGER NOT NULL,
+    total_length INTEGER NOT NULL);
+INSERT OR IGNORE INTO stats (id, doc_count, total_length) VALUES (0, 0, 0);
+""")
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except:
+            connection.execute('ROLLBACK')
+            raise
+        else:
+            connection.execute('COMMIT')
+
+    def index_texts(self, texts):
+        with self._transaction() as connection:
+            for video_id, text in texts:
+                self._remove_video(connection, video_id)
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                connection.execute(
+                    'INSERT INTO documents (video_id, length) VALUES (?, ?)',
+                    (video_id, length))
+                connection.executemany(
+                    'INSERT INTO postings (term, video_id, tf) '
+                    'VALUES (?, ?, ?)',
+                    [(term, video_id, tf) for term, tf in counts.iteritems()])
+                connection.execute(
+                    'UPDATE stats SET doc_count=doc_count+1, '
+                    'total_length=total_length+?', (length,))
+
+    def remove_videos(self, video_ids):
+        with self._transaction() as connection:
+            for video_id in video_ids:
+                self._remove_video(connection, video_id)
+
+    def _remove_video(self, connection, video_id):
+        row = connection.execute(
+            'SELECT length FROM documents WHERE video_id=?',
+            (video_id,)).fetchone()
+        if row is None:
+            return
+        connection.execute('DELETE FROM postings WHERE video_id=?',
+                           (video_id,))
+        connection.execute('DELETE FROM documents WHERE video_id=?',
+                           (video_id,))
+        connection.execute(
+            'UPDATE stats SET doc_count=doc_count-1, '
+            'total_length=total_length-?', row)
+
+    def clear(self):
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM postings')
+            connection.execute('DELETE FROM documents')
+            connection.execute('UPDATE stats SET doc_count=0, total_length=0')
+
+    def search(self, query):
+        clauses = parse_query(query)
+        if not clauses:
+            return []
+        connection = self._connection()
+        doc_count, total_length = connection.execute(
+            'SELECT doc_count, total_length FROM stats').fetchone()
+        if doc_count == 0:
+            return []
+        avg_length = total_length / doc_count
+        scores = None
+        for token, is_prefix in clauses:
+            clause_scores = self._score_clause(connection, token, is_prefix,
+                                               doc_count, avg_length)
+            if scores is None:
+                scores = clause_scores
+            else:
+                scores = dict(
+                    (video_id, score + clause_scores[video_id])
+                    for video_id, score in scores.iteritems()
+                    if video_id in clause_scores)
+            if not scores:
+                return []
+        return sorted(scores, key=lambda video_id: (-scores[video_id],
+                                                    video_id))
+
+    def _score_clause(self, connection, token, is_prefix, doc_count,
+                      avg_length):
+        """Calculate the BM25 score for a single query token
+
+        Returns a dict mapping video ids to scores.  For prefix searches, we
+        add up the scores for all matching tokens.
+        """
+        sql = ('SELECT p.term, p.video_id, p.tf, d.length '
+               'FROM postings p JOIN documents d ON d.video_id = p.video_id '
+               'WHERE p.term {} ?')
+        if is_prefix:
+            # tokens only contain word characters, so there's nothing to
+            # escape for GLOB
+            cursor = connection.execute(sql.format('GLOB'), (token + u'*',))
+        else:
+            cursor = connection.execute(sql.format('='), (token,))
+        postings = defaultdict(list)
+        for term, video_id, tf, length in cursor:
+            postings[term].append((video_id, tf, length))
+        scores = defaultdict(float)
+        for term_postings in postings.itervalues():
+            idf = self.idf(len(term_postings), doc_count)
+            for video_id, tf, length in term_postings:
+                scores[video_id] += idf * self.tf_weight(tf, length,
+                                                         avg_length)
+        return scores
+
+    def idf(self, doc_freq, doc_count):
+        return math.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def tf_weight(self, tf, length, avg_length):
+        return (tf * (self.K1 + 1) /
+                (tf + self.K1 * (1 - self.B + self.B * length / avg_length)))
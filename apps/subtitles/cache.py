@@ -16,6 +16,16 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+import collections
+import copy
+import hashlib
+import threading
+import time
+import zlib
+
+from babelsubs.storage import SubtitleSet
+import babelsubs
+from django.conf import settings
 from django.core.cache import cache
 
 TIMEOUT = 60 * 60 * 24 * 5 # 5 days
@@ -38,3 +48,202 @@ def get_is_synced(language, public):
 def set_is_synced(language, public, value):
     cache_key = _lang_is_synced_id(language, public)
     cache.set(cache_key, value, TIMEOUT)
+
+# Parsed subtitle caching.
+#
+# SubtitleVersions are immutable, so we can cache the parsed SubtitleSet for
+# them.  We use 2 levels of caching:
+#   - A per-process LRU cache that stores SubtitleSet objects.  We return
+#     copies of these so that callers can't modify our data.
+#   - The shared cache, where we store the normalized DFXP as zipped XML.
+#     Creating a SubtitleSet from this skips the base64 decoding and the
+#     DFXP loading/normalizing work, but it still parses the XML.
+#
+# Only local hits avoid XML parsing completely.  SubtitleSet wraps an lxml
+# tree, which can't be pickled, and converting it to a list of subtitle
+# items would lose styling and metadata, so the shared tier stores XML.
+#
+# Keys contain both the version pk and a hash of serialized_subtitles, so
+# even if the subtitles got updated we would never return stale data.
+
+# Don't store subtitles above this size in the shared cache (memcached has a
+# 1MB limit)
+MAX_SHARED_CACHE_SIZE = 900 * 1024
+
+class ParsedSubtitleStats(object):
+    """Track usage of the parsed subtitle cache.
+
+    Attributes:
+        local_hits: subtitles found in the per-process cache
+        shared_hits: subtitles found in the shared cache
+        misses: subtitles we needed to parse
+        parse_time: total time spent parsing subtitles for misses
+        time_saved: estimated time saved by the cache hits
+    """
+    def __init__(self):
+        self.local_hits = self.shared_hits = self.misses = 0
+        self.parse_time = self.time_saved = 0.0
+
+    def __repr__(self):
+        return ('<ParsedSubtitleStats local_hits: {0} shared_hits: {1} '
+                'misses: {2} time_saved: {3:.3f}>'.format(
+                    self.local_hits, self.shared_hits, self.misses,
+                    self.time_saved))
+
+parsed_subtitle_stats = ParsedSubtitleStats()
+
+class _LocalSubtitleCache(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            # map cache keys to (subtitle_set, parse_time) tuples
+            self.data = collections.OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                return None
+            self.data[key] = value
+            return value
+
+    def set(self, key, subtitle_set, parse_time):
+        max_size = getattr(settings, 'PARSED_SUBTITLE_CACHE_SIZE', 200)
+        if max_size <= 0:
+            return
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = (subtitle_set, parse_time)
+            while len(self.data) > max_size:
+                self.data.popitem(last=False)
+
+_local_subtitle_cache = _LocalSubtitleCache()
+
+def _subtitles_hash(version):
+    return hashlib.md5(version.serialized_subtitles).hexdigest()
+
+def _parsed_subtitles_key(version):
+    return 'parsed-subtitles:{0}:{1}'.format(version.pk,
+                                             _subtitles_hash(version))
+
+def get_parsed_subtitles(version, parse_func):
+    """Get the parsed SubtitleSet for a SubtitleVersion
+
+    Args:
+        version: SubtitleVersion to get the subtitles for
+        parse_func: function to call to parse the subtitles on a cache miss
+    Returns:
+        SubtitleSet for the version.  This is always a new object that the
+        caller can modify.
+
+    Local hits return a copy of a parsed SubtitleSet.  Shared hits skip
+    parse_func(), but still parse the stored XML.
+    """
+    if version.pk is None:
+        return parse_func()
+    start_time = time.time()
+    key = _parsed_subtitles_key(version)
+    cached = _local_subtitle_cache.get(key)
+    if cached is not None:
+        subtitle_set, parse_time = cached
+        subtitle_set = copy.deepcopy(subtitle_set)
+        parsed_subtitle_stats.local_hits += 1
+        _record_time_saved(parse_time, start_time)
+        return subtitle_set
+
+    cached = cache.get(key)
+    if cached is not None:
+        xml, parse_time = cached
+        subtitle_set = SubtitleSet(version.language_code,
+                                   initial_data=zlib.decompress(xml))
+        _local_subtitle_cache.set(key, copy.deepcopy(subtitle_set),
+                                  parse_time)
+        parsed_subtitle_stats.shared_hits += 1
+        _record_time_saved(parse_time, start_time)
+        return subtitle_set
+
+    subtitle_set = parse_func()
+    parse_time = time.time() - start_time
+    parsed_subtitle_stats.misses += 1
+    parsed_subtitle_stats.parse_time += parse_time
+    _local_subtitle_cache.set(key, copy.deepcopy(subtitle_set), parse_time)
+    xml = zlib.compress(subtitle_set.to_xml())
+    if len(xml) <= MAX_SHARED_CACHE_SIZE:
+        cache.set(key, (xml, parse_time), TIMEOUT)
+    return subtitle_set
+
+def _record_time_saved(parse_time, start_time):
+    parsed_subtitle_stats.time_saved += max(
+        parse_time - (time.time() - start_time), 0)
+
+# Rendered subtitle caching.
+#
+# We also cache the output of babelsubs.to() for each version and format.  On
+# a hit we don't need to parse the version at all.
+
+def _rendered_subtitles_key(version, sub_format):
+    return 'rendered-subtitles:{0}:{1}:{2}'.format(
+        version.pk, sub_format, _subtitles_hash(version))
+
+def get_rendered_subtitles(version, sub_format):
+    """Get the subtitles for a version rendered to a subtitle format
+
+    This is equivalent to babelsubs.to(version.get_subtitles(), sub_format),
+    but uses the cache when possible.
+    """
+    if version.pk is None:
+        return babelsubs.to(version.get_subtitles(), sub_format)
+    key = _rendered_subtitles_key(version, sub_format)
+    rendered = cache.get(key)
+    if rendered is None:
+        rendered = babelsubs.to(version.get_subtitles(), sub_format)
+        if len(rendered) <= MAX_SHARED_CACHE_SIZE:
+            cache.set(key, rendered, TIMEOUT)
+    return rendered
+
+def rendered_subtitles_etag(version, sub_format):
+    """Get an ETag value for the rendered subtitles of a version."""
+    return '"{0}-{1}-{2}"'.format(version.pk, sub_format,
+                                  _subtitles_hash(version)[:16])
+
+# Language change times
+#
+# The subtitles API uses these for the Last-Modified header.  The tip
+# version's created time doesn't work for that, since the tip can go back to
+# an older version when a newer one gets deleted.  Instead, we record the
+# time whenever a language or one of its versions is saved or deleted (see
+# subtitles.signalhandlers).  Times are stored as UNIX timestamps and always
+# increase, even when there are several changes in one second.
+#
+# If the time isn't in the cache, we use the current time.  That's never
+# earlier than the actual change, so clients never get a wrong 304 response.
+
+def _language_changed_key(language_id):
+    return 'language-changed:{0}'.format(language_id)
+
+def mark_language_changed(language_id):
+    key = _language_changed_key(language_id)
+    changed = int(time.time())
+    previous = cache.get(key)
+    if previous is not None and previous >= changed:
+        changed = previous + 1
+    cache.set(key, changed, TIMEOUT)
+
+def get_language_changed(language_id):
+    """Get the last time a language or its versions changed
+
+    Returns:
+        UNIX timestamp
+    """
+    key = _language_changed_key(language_id)
+    changed = cache.get(key)
+    if changed is None:
+        changed = int(time.time())
+        if not cache.add(key, changed, TIMEOUT):
+            # Someone else set the value at the same time
+            changed = cache.get(key) or changed
+    return changed
@@ -0,0 +1,89 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+from optparse import make_option
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from subtitles.models import SubtitleVersion, compress_subtitles
+from utils.compress import decompress, get_format
+
+class Command(BaseCommand):
+    help = (u'Re-encode serialized_subtitles using SUBTITLE_STORAGE_METHOD '
+            'and SUBTITLE_STORAGE_LEVEL')
+    option_list = BaseCommand.option_list + (
+        make_option('-b', '--batch-size', dest='batch-size', default=100,
+                    type='int', help='Number of versions to handle at once'),
+        make_option('-s', '--start-id', dest='start-id', default=0,
+                    type='int', help='Start with versions after this ID'),
+        make_option('-l', '--rate-limit', dest='rate-limit', default=None,
+                    type='float', metavar='COUNT',
+                    help='Only update COUNT versions per second'),
+        make_option('-a', '--all', dest='all', action='store_true',
+                    default=False,
+                    help=('Re-encode all versions, not just the ones using '
+                          'a different method')),
+    )
+
+    def handle(self, **options):
+        batch_size = options['batch-size']
+        rate_limit = options['rate-limit']
+        method = getattr(settings, 'SUBTITLE_STORAGE_METHOD', 'zlib')
+        last_id = options['start-id']
+        start_time = time.time()
+        count = updated = bytes_before = bytes_after = 0
+        while True:
+            versions = list(SubtitleVersion.objects
+                            .filter(id__gt=last_id)
+                            .order_by('id')
+                            .values_list('id', 'serialized_subtitles')
+                            [:batch_size])
+            if not versions:
+                break
+            for version_id, serialized_subtitles in versions:
+                last_id = version_id
+                count += 1
+                if (not options['all'] and
+                        get_format(serialized_subtitles) == method):
+                    continue
+                new_value = compress_subtitles(
+                    decompress(serialized_subtitles))
+                # use update() so that we don't send any signals or change
+                # any other fields
+                SubtitleVersion.objects.filter(id=version_id).update(
+                    serialized_subtitles=new_value)
+                updated += 1
+                bytes_before += len(serialized_subtitles)
+                bytes_after += len(new_value)
+            rate = count / (time.time() - start_time)
+            self.stdout.write(
+                'checked {0} versions, updated {1} ({2:.2f} versions/sec '
+                'last_id: {3}) bytes saved: {4}\n'.format(
+                    count, updated, rate, last_id,
+                    bytes_before - bytes_after))
+            if rate_limit is not None and rate > rate_limit:
+                time.sleep((count / rate_limit) -
+                           (time.time() - start_time))
+        if bytes_before:
+            self.stdout.write('done. {0} bytes -> {1} bytes ({2:.1%})\n'.format(
+                bytes_before, bytes_after,
+                float(bytes_after) / bytes_before))
+        else:
+            self.stdout.write('done. no versions updated\n')
@@ -24,6 +24,7 @@ import json
 import logging
 from datetime import datetime, date, timedelta
 
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.db import models
@@ -35,7 +36,7 @@ from subtitles import cache
 from subtitles import shims
 from auth.models import CustomUser as User
 from videos import metadata
-from videos.models import Video
+from videos.models import Video, VideoCompletedLanguage
 from babelsubs.storage import SubtitleSet
 from babelsubs.storage import calc_changes
 from babelsubs.generators.html import HTMLGenerator
@@ -432,6 +433,9 @@ class SubtitleLanguage(models.Model):
         self._tip_cache = {}
         self._translation_source_version_cache = {}
         self._frozen = False
+        # Use __dict__ to avoid loading subtitles_complete if it's deferred
+        self._saved_subtitles_complete = self.__dict__.get(
+            'subtitles_complete')
 
     # Writelocking
     @property
@@ -565,7 +569,15 @@ class SubtitleLanguage(models.Model):
         if creating and not self.created:
             self.created = dates.now()
 
+        if creating:
+            complete_changed = self.subtitles_complete
+        else:
+            complete_changed = (self.subtitles_complete !=
+                                self._saved_subtitles_complete)
         super(SubtitleLanguage, self).save(*args, **kwargs)
+        self._saved_subtitles_complete = self.subtitles_complete
+        if complete_changed:
+            VideoCompletedLanguage.update_for_videos([self.video_id])
 
     def title_display(self):
         tip = self.get_tip()
@@ -1352,6 +1364,15 @@ SUBTITLE_VERSION_ORIGINS = (
     (ORIGIN_WEB_EDITOR, _("Through web editor")),
 )
 
+def compress_subtitles(xml):
+    """Compress subtitle XML to store in SubtitleVersion.serialized_subtitles
+
+    This uses the SUBTITLE_STORAGE_METHOD and SUBTITLE_STORAGE_LEVEL settings.
+    """
+    return compress(xml,
+                    getattr(settings, 'SUBTITLE_STORAGE_METHOD', 'zlib'),
+                    getattr(settings, 'SUBTITLE_STORAGE_LEVEL', 6))
+
 class SubtitleVersion(models.Model):
     """SubtitleVersions are the equivalent of a 'changeset' in a VCS.
 
@@ -1433,9 +1454,10 @@ class SubtitleVersion(models.Model):
     meta_2_content = metadata.MetadataContentField()
     meta_3_content = metadata.MetadataContentField()
 
-    # Subtitles are stored in a text blob, serialized as base64'ed zipped XML
-    # (oh the joys of Django).  Use the subtitles property to get and set them.
-    # You shouldn't be touching this field.
+    # Subtitles are stored in a text blob, serialized as base64'ed compressed
+    # XML (oh the joys of Django).  See utils.compress for the format.  Use
+    # the subtitles property to get and set them.  You shouldn't be touching
+    # this field.
     serialized_subtitles = models.TextField()
 
     # Lineage is stored as a blob of JSON to save on DB rows.  You shouldn't
@@ -1463,16 +1485,21 @@ class SubtitleVersion(models.Model):
         subtitles.
 
         """
-        # We cache the parsed subs for speed.
+        # We cache the parsed subs for speed.  Versions are immutable, so we
+        # can also share the parsed subs between instances and processes.
         if self._subtitles == None:
-            self._subtitles = load_from(decompress(self.serialized_subtitles),
-                    type='dfxp').to_internal()
+            self._subtitles = cache.get_parsed_subtitles(
+                self, self._parse_subtitles)
             # force the subtitles to have the correct language code.  For a
             # while we had a bug where we always set to to "en"
             self._subtitles.set_language(self.language_code)
 
         return self._subtitles
 
+    def _parse_subtitles(self):
+        return load_from(decompress(self.serialized_subtitles),
+                         type='dfxp').to_internal()
+
     def set_subtitles(self, subtitles):
         """Set the SubtitleSet for this version.
 
@@ -1501,7 +1528,7 @@ class SubtitleVersion(models.Model):
                                 % str(type(subtitles)))
 
         self.subtitle_count = len(subtitles)
-        self.serialized_subtitles = compress(subtitles.to_xml())
+        self.serialized_subtitles = compress_subtitles(subtitles.to_xml())
 
         # We cache the parsed subs for speed.
         self._subtitles = subtitles
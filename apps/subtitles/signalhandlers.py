@@ -0,0 +1,33 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+
+from subtitles import cache
+from subtitles.models import SubtitleLanguage, SubtitleVersion
+
+@receiver(post_save, sender=SubtitleLanguage)
+@receiver(post_delete, sender=SubtitleLanguage)
+def on_language_change(sender, instance, **kwargs):
+    cache.mark_language_changed(instance.id)
+
+@receiver(post_save, sender=SubtitleVersion)
+@receiver(post_delete, sender=SubtitleVersion)
+def on_version_change(sender, instance, **kwargs):
+    cache.mark_language_changed(instance.subtitle_language_id)
@@ -26,16 +26,20 @@ from django.db import IntegrityError
 from django.test import TestCase
 from nose.tools import *
 
+from babelsubs import load_from
 from babelsubs.storage import SubtitleSet
+import mock
 
 from auth.models import CustomUser as User
 from subtitles import pipeline
+from subtitles import cache as subtitle_cache
 from subtitles.models import SubtitleLanguage, SubtitleVersion
 from subtitles.tests.utils import (
     make_video, make_video_2, make_video_3, make_sl, refresh, ids, parent_ids,
     ancestor_ids
 )
 from teams.models import Team, TeamMember, TeamVideo
+from utils.compress import compress
 from utils.factories import *
 
 class TestSubtitleLanguage(TestCase):
@@ -598,6 +602,72 @@ class TestSubtitleVersion(TestCase):
         self.assertRaises(ValidationError, lambda: crazy.full_clean())
 
 
+class TestParsedSubtitleCache(TestCase):
+    def setUp(self):
+        self.video = VideoFactory()
+        self.version = pipeline.add_subtitles(self.video, 'en',
+                                              SubtitleSetFactory(num_subs=3))
+        self.pk = self.version.pk
+        self.subtitles = self.version.get_subtitles()
+        subtitle_cache._local_subtitle_cache.clear()
+
+    def tearDown(self):
+        subtitle_cache._local_subtitle_cache.clear()
+
+    def load_version(self):
+        return SubtitleVersion.objects.get(pk=self.pk)
+
+    def check_get_subtitles(self, should_parse):
+        with mock.patch('subtitles.models.load_from',
+                        wraps=load_from) as mock_load_from:
+            subtitles = self.load_version().get_subtitles()
+        assert_equal(mock_load_from.called, should_parse)
+        assert_equal(subtitles.to_xml(), self.subtitles.to_xml())
+        return subtitles
+
+    def test_cache_miss(self):
+        self.check_get_subtitles(should_parse=True)
+
+    def test_local_cache_hit(self):
+        self.check_get_subtitles(should_parse=True)
+        self.check_get_subtitles(should_parse=False)
+
+    def test_shared_cache_hit(self):
+        self.check_get_subtitles(should_parse=True)
+        # simulate a different process
+        subtitle_cache._local_subtitle_cache.clear()
+        self.check_get_subtitles(should_parse=False)
+
+    def count_xml_parses(self):
+        return mock.patch('subtitles.cache.SubtitleSet',
+                          wraps=subtitle_cache.SubtitleSet)
+
+    def test_parse_counts(self):
+        self.check_get_subtitles(should_parse=True)
+        # local hits don't parse the XML at all
+        with self.count_xml_parses() as mock_subtitle_set:
+            self.check_get_subtitles(should_parse=False)
+        assert_equal(mock_subtitle_set.call_count, 0)
+        # shared hits skip parse_func(), but parse the stored XML once
+        subtitle_cache._local_subtitle_cache.clear()
+        with self.count_xml_parses() as mock_subtitle_set:
+            self.check_get_subtitles(should_parse=False)
+        assert_equal(mock_subtitle_set.call_count, 1)
+
+    def test_returns_copies(self):
+        self.check_get_subtitles(should_parse=True)
+        subtitles = self.check_get_subtitles(should_parse=False)
+        subtitles.append_subtitle(100000, 101000, 'new subtitle')
+        self.check_get_subtitles(should_parse=False)
+
+    def test_key_changes_with_subtitles(self):
+        self.check_get_subtitles(should_parse=True)
+        new_subtitles = SubtitleSetFactory(num_subs=5)
+        SubtitleVersion.objects.filter(pk=self.pk).update(
+            serialized_subtitles=compress(new_subtitles.to_xml()))
+        self.subtitles = new_subtitles
+        self.check_get_subtitles(should_parse=True)
+
 class TestHistory(TestCase):
     def setUp(self):
         self.video = make_video()
@@ -759,7 +759,8 @@ class RemoveProjectManagerForm(forms.Form):
 
     def clean_member(self):
         member = self.cleaned_data['member']
-        if not member.is_project_manager(self.project):
+        snapshot = self.team.get_permission_snapshot(member.user)
+        if not snapshot.is_project_manager(self.project):
             raise forms.ValidationError(_(u'%(user)s is not a manager'),
                                         user=username)
         return member
@@ -800,7 +801,8 @@ class RemoveLanguageManagerForm(forms.Form):
 
     def clean_member(self):
         member = self.cleaned_data['member']
-        if not member.is_language_manager(self.language_code):
+        snapshot = self.team.get_permission_snapshot(member.user)
+        if not snapshot.is_language_manager(self.language_code):
             raise forms.ValidationError(_(u'%(user)s is not a manager'),
                                         user=username)
         return member
@@ -1080,14 +1082,11 @@ class VideoFiltersForm(forms.Form):
             except Project.DoesNotExist:
                 pass
 
-        if sort in ('subs', '-subs'):
-            qs = qs.add_num_completed_languages()
-
         qs = qs.order_by({
              'name':  'title',
             '-name': '-title',
-             'subs':  'num_completed_languages',
-            '-subs': '-num_completed_languages',
+             'subs':  'completed_languages_count',
+            '-subs': '-completed_languages_count',
              'time':  'created',
             '-time': '-created',
         }.get(sort or '-time'))
@@ -0,0 +1,108 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+import datetime
+from optparse import make_option
+import resource
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from auth.models import CustomUser as User
+from subtitles import pipeline
+from teams.models import BillingReport, Task, Team, TeamVideo
+from videos.models import Video
+
+class Command(BaseCommand):
+    help = (u'Time billing report generation using a synthetic dataset.  '
+            'The data is created inside a transaction that gets rolled '
+            'back afterwards.')
+    option_list = BaseCommand.option_list + (
+        make_option('-t', '--tasks', dest='tasks', default=100000,
+                    type='int', help='Number of approved tasks to create'),
+        make_option('-v', '--videos', dest='videos', default=100,
+                    type='int', help='Number of videos to spread tasks over'),
+        make_option('--type', dest='type', default=BillingReport.TYPE_APPROVAL,
+                    type='int', help='BillingReport type to generate'),
+    )
+
+    def handle(self, **options):
+        with transaction.commit_manually():
+            try:
+                report = self.create_data(options['tasks'],
+                                          options['videos'], options['type'])
+                # The first run calculates minutes for each version, the
+                # second uses the stored BillingVersionMinutes
+                self.run_report(report, 'first run')
+                self.run_report(report, 'second run')
+            finally:
+                transaction.rollback()
+
+    def create_data(self, task_count, video_count, report_type):
+        self.stdout.write("creating data...\n")
+        suffix = str(int(time.time()))
+        team = Team.objects.create(name='Billing benchmark ' + suffix,
+                                   slug='billing-benchmark-' + suffix)
+        user = User.objects.create(username='billing-benchmark-' + suffix)
+        team_videos_and_versions = []
+        for i in xrange(video_count):
+            video = Video.objects.create(title='Billing benchmark %s' % i)
+            version = pipeline.add_subtitles(video, 'en', [
+                (j * 1000, j * 1000 + 900, 'subtitle %s' % j)
+                for j in xrange(60)
+            ], author=user)
+            team_video = TeamVideo.objects.create(team=team, video=video,
+                                                  added_by=user)
+            team_videos_and_versions.append((team_video, version))
+
+        completed = datetime.datetime(2015, 1, 1)
+        for start in xrange(0, task_count, 1000):
+            tasks = []
+            for i in xrange(start, min(start + 1000, task_count)):
+                team_video, version = team_videos_and_versions[
+                    i % len(team_videos_and_versions)]
+                for type in ('Subtitle', 'Review', 'Approve'):
+                    tasks.append(Task(
+                        type=Task.TYPE_IDS[type], team=team,
+                        team_video=team_video, language='en',
+                        assignee=user, new_subtitle_version=version,
+                        approved=Task.APPROVED_IDS['Approved'],
+                        completed=completed))
+            Task.objects.bulk_create(tasks)
+
+        report = BillingReport.objects.create(
+            start_date=datetime.date(2014, 12, 1),
+            end_date=datetime.date(2015, 2, 1), type=report_type)
+        report.teams.add(team)
+        return report
+
+    def run_report(self, report, label):
+        start_time = time.time()
+        start_queries = len(connection.queries)
+        row_count = 0
+        for row in report.generate_rows():
+            row_count += 1
+        elapsed = time.time() - start_time
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        self.stdout.write("{0}: {1} rows in {2:.2f}s ({3:.0f} rows/s)\n"
+                          .format(label, row_count, elapsed,
+                                  row_count / elapsed))
+        # Queries are only recorded when DEBUG is enabled
+        self.stdout.write("  queries: {0}  max RSS: {1} KB\n".format(
+            len(connection.queries) - start_queries, max_rss))
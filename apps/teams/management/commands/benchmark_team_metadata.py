@@ -0,0 +1,95 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+import datetime
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from teams.models import Team, TeamVideo
+from teams.tasks import UPDATE_PUBLIC_FIELD_CHUNK_SIZE
+from utils import codes
+from videos import metadata_manager
+from videos.models import Video
+
+class Command(BaseCommand):
+    help = (u'Time updating the video metadata for a team using a synthetic '
+            'dataset.  The data is created inside a transaction that gets '
+            'rolled back afterwards.')
+    option_list = BaseCommand.option_list + (
+        make_option('-v', '--videos', dest='videos', default=50000,
+                    type='int', help='Number of team videos to create'),
+        make_option('-s', '--sample', dest='sample', default=200,
+                    type='int', help=('Number of videos to time the '
+                                      'per-video update_metadata() with')),
+    )
+
+    def handle(self, **options):
+        with transaction.commit_manually():
+            try:
+                team = self.create_data(options['videos'])
+                self.run_benchmark(team, options['sample'])
+            finally:
+                transaction.rollback()
+
+    def create_data(self, video_count):
+        self.stdout.write("creating data...\n")
+        suffix = str(int(time.time()))
+        team = Team.objects.create(name='Metadata benchmark ' + suffix,
+                                   slug='metadata-benchmark-' + suffix)
+        project = team.default_project
+        now = datetime.datetime.now()
+        for start in xrange(0, video_count, 1000):
+            count = min(1000, video_count - start)
+            video_ids = [codes.make_code(72) for i in xrange(count)]
+            Video.objects.bulk_create([
+                Video(video_id=video_id, title='Metadata benchmark',
+                      created=now)
+                for video_id in video_ids
+            ])
+            TeamVideo.objects.bulk_create([
+                TeamVideo(team=team, video_id=pk, project=project,
+                          created=now)
+                for pk in Video.objects.filter(video_id__in=video_ids)
+                .values_list('id', flat=True)
+            ])
+        return team
+
+    def run_benchmark(self, team, sample_size):
+        video_pks = list(team.teamvideo_set.order_by('video')
+                         .values_list('video_id', flat=True))
+        total = len(video_pks)
+
+        start_time = time.time()
+        for pk in video_pks[:sample_size]:
+            metadata_manager.update_metadata(pk)
+        per_video = (time.time() - start_time) / max(1, sample_size)
+        self.stdout.write("update_metadata(): {0:.1f}ms/video "
+                          "({1:.0f}s estimated for {2} videos)\n".format(
+                              per_video * 1000, per_video * total, total))
+
+        start_time = time.time()
+        for start in xrange(0, total, UPDATE_PUBLIC_FIELD_CHUNK_SIZE):
+            metadata_manager.update_metadata_for_videos(
+                video_pks[start:start+UPDATE_PUBLIC_FIELD_CHUNK_SIZE])
+        elapsed = time.time() - start_time
+        self.stdout.write("update_metadata_for_videos(): {0:.2f}ms/video "
+                          "({1:.1f}s for {2} videos)\n".format(
+                              elapsed * 1000 / max(1, total), elapsed, total))
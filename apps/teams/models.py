@@ -16,11 +16,14 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 from collections import defaultdict
-from itertools import groupby
+from itertools import groupby, islice
 from math import ceil
+import cPickle as pickle
 import csv
 import datetime
+import heapq
 import logging
+import tempfile
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
@@ -28,9 +31,9 @@ from django.contrib.sites.models import Site
 from django.core.exceptions import ValidationError
 from django.core.urlresolvers import reverse
 from django.core.files import File
-from django.db import connection
+from django.db import connection, IntegrityError, transaction
 from django.db import models
-from django.db.models import query, Q, Count, Sum
+from django.db.models import query, Q, Count, Sum, F, Max
 from django.db.models.signals import post_save, post_delete, pre_delete
 from django.http import Http404
 from django.template.loader import render_to_string
@@ -47,7 +50,7 @@ from subtitles.signals import language_deleted
 from teams.moderation_const import WAITING_MODERATION, UNMODERATED, APPROVED
 from teams.permissions_const import (
     TEAM_PERMISSIONS, PROJECT_PERMISSIONS, ROLE_OWNER, ROLE_ADMIN, ROLE_MANAGER,
-    ROLE_CONTRIBUTOR
+    ROLE_CONTRIBUTOR, ROLE_OUTSIDER
 )
 from teams import tasks
 from teams import workflows
@@ -62,6 +65,7 @@ from utils.panslugify import pan_slugify
 from utils.text import fmt
 from videos.models import Video, VideoUrl, SubtitleVersion, SubtitleLanguage
 from videos.tasks import video_changed_tasks
+from widget import video_cache
 from subtitles.models import (
     SubtitleVersion as NewSubtitleVersion,
     SubtitleLanguage as NewSubtitleLanguage,
@@ -158,7 +162,7 @@ class TeamManager(models.Manager):
     def needs_new_video_notification(self, notify_interval):
         return (self.filter(
             notify_interval=notify_interval,
-            teamvideo__created__gt=models.F('last_notification_time'))
+            teamvideo__created__gt=F('last_notification_time'))
             .distinct())
 
 class Team(models.Model):
@@ -297,6 +301,7 @@ class Team(models.Model):
     def __init__(self, *args, **kwargs):
         models.Model.__init__(self, *args, **kwargs)
         self._member_cache = {}
+        self._permission_snapshots = {}
 
     def save(self, *args, **kwargs):
         creating = self.pk is None
@@ -516,17 +521,26 @@ class Team(models.Model):
         return None
 
     def user_is_member(self, user):
-        members = self.cache.get('members')
-        if members is None:
-            members = list(self.members.values_list('user_id', flat=True))
-            self.cache.set('members', members)
-        return user.id in members
+        return self.get_permission_snapshot(user).is_member
+
+    def get_permission_snapshot(self, user):
+        """Get a TeamPermissionSnapshot for a user.
+
+        Snapshots are stored in our cache group, which gets invalidated when
+        the team's memberships change.  We also keep them on this object, so
+        a request only looks each user up once per team.
+        """
+        if not user or not user.is_authenticated() or self.pk is None:
+            return TeamPermissionSnapshot(ROLE_OUTSIDER)
+        if user.id not in self._permission_snapshots:
+            self._permission_snapshots[user.id] = self.cache.get_or_calc(
+                'permissions:{0}'.format(user.id),
+                TeamPermissionSnapshot.build, self, user)
+        return self._permission_snapshots[user.id]
 
     def uncache_member(self, user):
-        try:
-            del self._member_cache[user.id]
-        except KeyError:
-            pass
+        self._member_cache.pop(user.id, None)
+        self._permission_snapshots.pop(user.id, None)
 
     def user_is_admin(self, user):
         member = self.get_member(user)
@@ -560,15 +574,12 @@ class Team(models.Model):
 
         If no role is given, simply return whether the user is a member of this team at all.
 
-        TODO: Change this to use the stuff in teams.permissions.
-
         """
-        if not user or not user.is_authenticated():
-            return False
-        qs = self.members.filter(user=user)
+        snapshot = self.get_permission_snapshot(user)
         if role:
-            qs = qs.filter(role=role)
-        return qs.exists()
+            return snapshot.role == role
+        else:
+            return snapshot.is_member
 
     def can_bulk_approve(self, user):
         return self.is_owner(user) or self.is_admin(user)
@@ -1072,6 +1083,9 @@ class TeamVideo(models.Model):
                     "%s: Team (%s) is not equal to project's (%s) team (%s)"\
                          % (self, self.team, self.project, self.project.team)
         super(TeamVideo, self).save(*args, **kwargs)
+        if not within_team:
+            # The widget cache namespace for the video depends on its team
+            video_cache.invalidate_cache(self.video.video_id)
         if within_team:
             if __old_project is not None and self.project != __old_project:
                 video_moved_from_project_to_project.send(sender=self,
@@ -1209,6 +1223,107 @@ class TeamVideoMigration(models.Model):
         # Make now a function so we can patch it in the unittests
         return datetime.datetime.now()
 
+class TeamVideoImport(models.Model):
+    """Progress of a bulk video import into a team.
+
+    add_team_videos() splits the rows into chunks that separate tasks
+    import.  Each task records its progress here, and the one that finishes
+    the last chunk sends the summary email.
+    """
+    team = models.ForeignKey(Team)
+    user = models.ForeignKey(User)
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(null=True, blank=True)
+    total_rows = models.PositiveIntegerField()
+    processed_rows = models.PositiveIntegerField(default=0)
+    num_added = models.PositiveIntegerField(default=0)
+
+    def __unicode__(self):
+        return u'Import for {0} ({1}/{2})'.format(self.team, self.processed_rows,
+                                                  self.total_rows)
+
+    def progress(self):
+        """Get the fraction of the rows that have been processed."""
+        if not self.total_rows:
+            return 1.0
+        return float(self.processed_rows) / self.total_rows
+
+    def record_chunk(self, start_row, num_rows, num_added, messages):
+        """Record that a chunk of rows was processed.
+
+        Chunk tasks can be delivered more than once, so we only count each
+        chunk the first time it gets recorded.
+
+        :param start_row: row number of the first row in the chunk
+        :param num_rows: number of rows in the chunk
+        :param num_added: number of videos added to the team
+        :param messages: list of (row_number, message) tuples
+        :returns: True if this finished the import.  This is only returned
+            to one caller, even if chunks finish concurrently.
+        """
+        try:
+            with transaction.atomic():
+                TeamVideoImportChunk.objects.create(
+                    team_video_import_id=self.id, start_row=start_row)
+                if messages:
+                    TeamVideoImportMessage.objects.bulk_create([
+                        TeamVideoImportMessage(team_video_import_id=self.id,
+                                               row=row_number,
+                                               message=message)
+                        for (row_number, message) in messages
+                    ])
+                TeamVideoImport.objects.filter(id=self.id).update(
+                    processed_rows=F('processed_rows') + num_rows,
+                    num_added=F('num_added') + num_added)
+        except IntegrityError:
+            # The chunk was already recorded
+            return False
+        return self.finish_if_complete()
+
+    def chunk_recorded(self, start_row):
+        return self.chunks.filter(start_row=start_row).exists()
+
+    def finish_if_complete(self):
+        """Set finished if all rows have been processed.
+
+        :returns: True if we set finished
+        """
+        now = TeamVideoImport.now()
+        finished = TeamVideoImport.objects.filter(
+            id=self.id, finished__isnull=True,
+            processed_rows__gte=F('total_rows')).update(finished=now)
+        fresh = TeamVideoImport.objects.get(id=self.id)
+        self.processed_rows = fresh.processed_rows
+        self.num_added = fresh.num_added
+        self.finished = fresh.finished
+        return finished == 1
+
+    def message_list(self):
+        return [m.message for m in self.messages.all()]
+
+    @staticmethod
+    def now():
+        # Make now a function so we can patch it in the unittests
+        return datetime.datetime.now()
+
+class TeamVideoImportChunk(models.Model):
+    """Chunk of a TeamVideoImport that has been recorded."""
+    team_video_import = models.ForeignKey(TeamVideoImport,
+                                          related_name='chunks')
+    start_row = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ('team_video_import', 'start_row')
+
+class TeamVideoImportMessage(models.Model):
+    team_video_import = models.ForeignKey(TeamVideoImport,
+                                          related_name='messages')
+    row = models.IntegerField()
+    message = models.TextField()
+
+    class Meta:
+        ordering = ('row', 'id')
+
 def _create_translation_tasks(team_video, subtitle_version=None):
     """Create any translation tasks that should be autocreated for this video.
 
@@ -1384,11 +1499,20 @@ class TeamMember(models.Model):
 
     def save(self, *args, **kwargs):
         super(TeamMember, self).save(*args, **kwargs)
-        Team.cache.invalidate_by_pk(self.team_id)
+        self.invalidate_team_caches()
 
     def delete(self):
         super(TeamMember, self).delete()
+        self.invalidate_team_caches()
+
+    def invalidate_team_caches(self):
         Team.cache.invalidate_by_pk(self.team_id)
+        # If we have the Team object loaded, the caller is probably still
+        # using it.  Clear its in-object caches for our user as well.
+        team = getattr(self, '_team_cache', None)
+        if team is not None:
+            team._member_cache.pop(self.user_id, None)
+            team._permission_snapshots.pop(self.user_id, None)
 
     def leave_team(self):
         member_leave.send(sender=self)
@@ -1545,11 +1669,87 @@ class MembershipNarrowing(models.Model):
             assert not duplicate_exists, "Duplicate project narrowing detected!"
 
         super(MembershipNarrowing, self).save(*args, **kwargs)
-        Team.cache.invalidate_by_pk(self.member.team_id)
+        self.member.invalidate_team_caches()
 
     def delete(self):
         super(MembershipNarrowing, self).delete()
-        Team.cache.invalidate_by_pk(self.member.team_id)
+        self.member.invalidate_team_caches()
+
+class TeamPermissionSnapshot(object):
+    """A user's role, narrowings and managed projects/languages for a team
+
+    teams.permissions checks these instead of querying TeamMember and
+    MembershipNarrowing for each check.  Use Team.get_permission_snapshot()
+    to get one.
+
+    Attributes:
+        role: the user's role, or ROLE_OUTSIDER for non-members
+        project_narrowings: ids of the projects the role is narrowed to
+        language_narrowings: language codes the role is narrowed to
+        projects_managed: ids of the projects the user manages
+        languages_managed: language codes the user manages
+    """
+    def __init__(self, role, project_narrowings=(), language_narrowings=(),
+                 projects_managed=(), languages_managed=()):
+        self.role = role
+        self.project_narrowings = frozenset(project_narrowings)
+        self.language_narrowings = frozenset(language_narrowings)
+        self.projects_managed = frozenset(projects_managed)
+        self.languages_managed = frozenset(languages_managed)
+
+    @classmethod
+    def build(cls, team, user):
+        member = team.get_member(user)
+        if member is None:
+            return cls(ROLE_OUTSIDER)
+        narrowings = list(member.narrowings.values_list('project_id',
+                                                        'language'))
+        return cls(
+            member.role,
+            [project_id for (project_id, language) in narrowings
+             if project_id],
+            [language for (project_id, language) in narrowings if language],
+            member.projects_managed.values_list('id', flat=True),
+            member.languages_managed.values_list('code', flat=True))
+
+    def __repr__(self):
+        return '<TeamPermissionSnapshot {0}>'.format(self.role)
+
+    @property
+    def is_member(self):
+        return self.role != ROLE_OUTSIDER
+
+    @property
+    def is_narrowed(self):
+        return bool(self.project_narrowings or self.language_narrowings)
+
+    def role_for_target(self, project=None, language_code=None):
+        """Get the role the user effectively has for a project/language.
+
+        Users with narrowings only have their role for the projects and
+        languages that they're narrowed to, for everything else they are
+        contributors.
+        """
+        if not self.is_narrowed:
+            return self.role
+        # The default project is the same as "no project".
+        if project and project.is_default_project:
+            project = None
+        project_id = project.id if project else None
+        if self.project_narrowings and project_id not in self.project_narrowings:
+            return ROLE_CONTRIBUTOR
+        if (self.language_narrowings and
+                language_code not in self.language_narrowings):
+            return ROLE_CONTRIBUTOR
+        return self.role
+
+    def is_project_manager(self, project):
+        if isinstance(project, Project):
+            project = project.id
+        return project in self.projects_managed
+
+    def is_language_manager(self, language_code):
+        return language_code in self.languages_managed
 
 class TeamSubtitleNote(SubtitleNoteBase):
     team = models.ForeignKey(Team, related_name='+')
@@ -3116,6 +3316,11 @@ class BillingReport(models.Model):
     type = models.IntegerField(choices=TYPE_CHOICES,
                                default=TYPE_BILLING_RECORD)
 
+    # Number of approve tasks to load at once when generating approval
+    # reports.  Related tasks, versions and minutes are fetched in bulk for
+    # each chunk.
+    CHUNK_SIZE = 1000
+
     def __unicode__(self):
         if hasattr(self, 'id') and self.id is not None:
             team_count = self.teams.all().count()
@@ -3131,11 +3336,140 @@ class BillingReport(models.Model):
             team__in=self.teams.all(),
             completed__range=(self.start_date, self.end_date))
 
+    def _iter_approved_tasks(self, use_new_subtitle_version=False):
+        """Iterate through the approved tasks for this report.
+
+        Tasks are loaded CHUNK_SIZE at a time, using the id to page through
+        them.  For each chunk we fetch the related objects that the reports
+        need with a handful of queries, then set these attributes on each
+        approve task:
+
+          - subtitle_task: the last completed subtitle/translate task for the
+            video/language, or None
+          - review_task: the last completed review task for the
+            video/language, or None
+          - version: new_subtitle_version if use_new_subtitle_version is
+            True, otherwise the version returned by get_subtitle_version()
+          - minutes: get_minutes_for_version() for the version
+
+        Tasks that don't have a version are skipped.
+        """
+        qs = (self._get_approved_tasks()
+              .select_related('team', 'assignee', 'team_video__video',
+                              'team_video__project',
+                              'new_subtitle_version__subtitle_language')
+              .order_by('id'))
+        last_id = 0
+        while True:
+            chunk = list(qs.filter(id__gt=last_id)[:self.CHUNK_SIZE])
+            if not chunk:
+                return
+            last_id = chunk[-1].id
+            for approve_task in self._prefetch_for_tasks(
+                    chunk, use_new_subtitle_version):
+                yield approve_task
+
+    def _prefetch_for_tasks(self, approve_tasks, use_new_subtitle_version):
+        """Fetch the related objects for a chunk of approve tasks
+
+        Returns the tasks that have a version to report on.
+        """
+        keys = set((t.team_video_id, t.language) for t in approve_tasks)
+        subtitle_tasks = self._last_completed_tasks(
+            Task.objects.complete_subtitle_or_translate(), keys)
+        review_tasks = self._last_completed_tasks(
+            Task.objects.complete_review(), keys)
+        if not use_new_subtitle_version:
+            self._prefetch_tip_versions(approve_tasks)
+        rv = []
+        for approve_task in approve_tasks:
+            if use_new_subtitle_version:
+                approve_task.version = approve_task.new_subtitle_version
+            else:
+                approve_task.version = approve_task.get_subtitle_version()
+            if approve_task.version is None:
+                logger.warn("Billing report: skipping approve task without "
+                            "a subtitle version (id: %s)", approve_task.id)
+                continue
+            key = (approve_task.team_video_id, approve_task.language)
+            approve_task.subtitle_task = subtitle_tasks.get(key)
+            approve_task.review_task = review_tasks.get(key)
+            video = approve_task.team_video.video
+            language = approve_task.version.subtitle_language
+            if language.video_id == video.id:
+                # avoid a query in is_primary_audio_language()
+                language.video = video
+            rv.append(approve_task)
+        minutes = get_minutes_for_versions(t.version for t in rv)
+        for approve_task in rv:
+            approve_task.minutes = minutes[approve_task.version.id]
+        return rv
+
+    def _prefetch_tip_versions(self, approve_tasks):
+        """Prefetch the versions that get_subtitle_version() looks up
+
+        When a task's new_subtitle_version isn't for the task's language,
+        get_subtitle_version() falls back to the tip of the video's language.
+        Fetch those languages and their tips for the whole chunk at once and
+        store them where get_subtitle_version() will find them.
+        """
+        need_tip = [
+            t for t in approve_tasks
+            if not (t.new_subtitle_version and
+                    t.new_subtitle_version.language_code == t.language)
+        ]
+        if not need_tip:
+            return
+        languages = (NewSubtitleLanguage.objects
+                     .filter(video__in=set(t.team_video.video_id
+                                           for t in need_tip),
+                             language_code__in=set(t.language
+                                                   for t in need_tip))
+                     .fetch_and_join(private_tips=True))
+        language_map = dict(((l.video_id, l.language_code), l)
+                            for l in languages)
+        for approve_task in need_tip:
+            language = language_map.get((approve_task.team_video.video_id,
+                                         approve_task.language))
+            approve_task._subtitle_version = (language.get_tip(public=False)
+                                              if language else None)
+
+    def _last_completed_tasks(self, qs, keys):
+        """Get the last completed task for each video/language.
+
+        keys is a set of (team_video_id, language_code) tuples.  We find the
+        last completed time for each pair in SQL, then only load the tasks
+        completed at those times, rather than each video's whole task
+        history.
+
+        Returns a dict mapping (team_video_id, language_code) to tasks.
+        """
+        qs = qs.filter(team_video__in=set(k[0] for k in keys),
+                       language__in=set(k[1] for k in keys))
+        last_completed = {}
+        for row in (qs.values('team_video', 'language')
+                    .annotate(last_completed=Max('completed'))
+                    .order_by()):
+            key = (row['team_video'], row['language'])
+            if key in keys:
+                last_completed[key] = row['last_completed']
+        if not last_completed:
+            return {}
+        rv = {}
+        tasks = (qs.filter(completed__in=set(last_completed.values()))
+                 .select_related('assignee')
+                 .order_by('completed', 'id'))
+        for task in tasks:
+            key = (task.team_video_id, task.language)
+            if last_completed.get(key) == task.completed:
+                rv[key] = task
+        return rv
+
     def _report_date(self, datetime):
         return datetime.strftime('%Y-%m-%d %H:%M:%S')
 
     def generate_rows_type_approval(self):
-        header = (
+        yield (
             'Team',
             'Video Title',
             'Video ID',
@@ -3147,32 +3481,28 @@ class BillingReport(models.Model):
             'Approver',
             'Date',
         )
-        rows = [header]
-        for approve_task in self._get_approved_tasks():
+        for approve_task in self._iter_approved_tasks(
+                use_new_subtitle_version=True):
             video = approve_task.team_video.video
             project = approve_task.team_video.project.name if approve_task.team_video.project else 'none'
-            version = approve_task.new_subtitle_version
-            language = version.subtitle_language
-            subtitle_task = (Task.objects.complete_subtitle_or_translate()
-                             .filter(team_video=approve_task.team_video,
-                                     language=approve_task.language)
-                             .order_by('-completed'))[0]
-            rows.append((
+            language = approve_task.version.subtitle_language
+            subtitle_task = approve_task.subtitle_task
+            yield (
                 approve_task.team.name,
                 video.title_display(),
                 video.video_id,
                 project,
                 approve_task.language,
-                get_minutes_for_version(version, False),
+                approve_task.minutes,
                 language.is_primary_audio_language(),
-                subtitle_task.type==Task.TYPE_IDS['Translate'],
+                (subtitle_task is not None and
+                 subtitle_task.type == Task.TYPE_IDS['Translate']),
                 unicode(approve_task.assignee),
                 self._report_date(approve_task.completed),
-            ))
-        return rows
+            )
 
     def generate_rows_type_approval_for_users(self):
-        header = (
+        yield (
             'User',
             'Task Type',
             'Team',
@@ -3187,34 +3517,27 @@ class BillingReport(models.Model):
             'Date',
             'Pay Rate',
         )
-        data_rows = []
-        for approve_task in self._get_approved_tasks():
+        for row in _external_sort(self._approval_for_users_data_rows(),
+                                  key=lambda row: row[0],
+                                  run_size=self.CHUNK_SIZE * 10):
+            yield row
+
+    def _approval_for_users_data_rows(self):
+        for approve_task in self._iter_approved_tasks():
             video = approve_task.team_video.video
             project = approve_task.team_video.project.name if approve_task.team_video.project else 'none'
-            version = approve_task.get_subtitle_version()
-            language = version.subtitle_language
+            language = approve_task.version.subtitle_language
 
             all_tasks = [approve_task]
-            try:
-                all_tasks.append((Task.objects.complete_subtitle_or_translate()
-                                  .filter(team_video=approve_task.team_video,
-                                          language=approve_task.language)
-                                  .order_by('-completed'))[0])
-            except IndexError:
-                # no subtitling task, probably the review task was manually
-                # created.
-                pass
-            try:
-                all_tasks.append((Task.objects.complete_review()
-                                  .filter(team_video=approve_task.team_video,
-                                          language=approve_task.language)
-                                  .order_by('-completed'))[0])
-            except IndexError:
-                # review not enabled
-                pass
+            # subtitle_task can be None if the review task was manually
+            # created.  review_task is None if review is not enabled
+            if approve_task.subtitle_task is not None:
+                all_tasks.append(approve_task.subtitle_task)
+            if approve_task.review_task is not None:
+                all_tasks.append(approve_task.review_task)
 
             for task in all_tasks:
-                data_rows.append((
+                yield (
                     unicode(task.assignee),
                     task.get_type_display(),
                     approve_task.team.name,
@@ -3222,25 +3545,27 @@ class BillingReport(models.Model):
                     video.video_id,
                     project,
                     language.language_code,
-                    get_minutes_for_version(version, False),
+                    approve_task.minutes,
                     language.is_primary_audio_language(),
                     unicode(approve_task.assignee),
                     unicode(task.body),
                     self._report_date(task.completed),
                     task.assignee.pay_rate_code,
-                ))
-
-        data_rows.sort(key=lambda row: row[0])
-        return [header] + data_rows
+                )
 
     def generate_rows_type_billing_record(self):
-        rows = []
         for i,team in enumerate(self.teams.all()):
-            rows = rows + BillingRecord.objects.csv_report_for_team(team,
+            rows = BillingRecord.objects.csv_report_for_team(team,
                 self.start_date, self.end_date, add_header=i == 0)
-        return rows
+            for row in rows:
+                yield row
 
     def generate_rows(self):
+        """Generate the rows for the report (including headers).
+
+        This returns an iterator that creates the rows as they're needed,
+        which keeps memory usage down for big reports.
+        """
         if self.type == BillingReport.TYPE_BILLING_RECORD:
             rows = self.generate_rows_type_billing_record()
         elif self.type == BillingReport.TYPE_APPROVAL:
@@ -3257,7 +3582,7 @@ class BillingReport(models.Model):
                 return value.encode("utf-8")
             else:
                 return value
-        return [tuple(_convert(v) for v in row) for row in rows]
+        return (tuple(_convert(v) for v in row) for row in rows)
 
     def process(self):
         """
@@ -3266,24 +3591,24 @@ class BillingReport(models.Model):
         storage will take care of exporting it to s3.
         """
         try:
-            rows = self.generate_rows()
+            # rows are generated lazily, so errors can happen while we are
+            # writing the file
+            self.csv_file = self.make_csv_file(self.generate_rows())
         except StandardError:
             logger.error("Error generating billing report: (id: %s)", self.id)
             self.csv_file = None
-        else:
-            self.csv_file = self.make_csv_file(rows)
         self.processed = datetime.datetime.utcnow()
         self.save()
 
     def make_csv_file(self, rows):
-        rows = self.convert_unicode_to_utf8(rows)
         fn = '/tmp/bill-%s-teams-%s-%s-%s-%s.csv' % (
             self.teams.all().count(),
             self.start_str, self.end_str,
             self.get_type_display(), self.pk)
         with open(fn, 'w') as f:
             writer = csv.writer(f)
-            writer.writerows(rows)
+            for row in self.convert_unicode_to_utf8(rows):
+                writer.writerow(row)
 
         return File(open(fn, 'r'))
 
@@ -3519,6 +3844,96 @@ def get_minutes_for_version(version, round_up_to_integer):
         minutes = int(ceil(minutes))
     return minutes
 
+class BillingVersionMinutes(models.Model):
+    """Stores get_minutes_for_version() results for billing reports.
+
+    Calculating the minutes means parsing the subtitles, which is slow for
+    big reports.  Versions don't change once they are created, so we only
+    need to do it once per version.
+    """
+    subtitle_version = models.OneToOneField(NewSubtitleVersion,
+                                            primary_key=True,
+                                            related_name='+')
+    minutes = models.FloatField()
+
+def get_minutes_for_versions(versions):
+    """
+    Get the minutes for multiple versions.
+
+    This works like get_minutes_for_version(), but uses BillingVersionMinutes
+    to avoid recalculating the minutes for versions that we've seen before.
+
+    Returns a dict mapping version ids to minutes (not rounded)
+    """
+    versions = list(versions)
+    rv = dict(BillingVersionMinutes.objects
+              .filter(subtitle_version__in=[v.id for v in versions])
+              .values_list('subtitle_version_id', 'minutes'))
+    to_create = []
+    for version in versions:
+        if version.id not in rv:
+            rv[version.id] = get_minutes_for_version(version, False)
+            to_create.append(BillingVersionMinutes(
+                subtitle_version_id=version.id, minutes=rv[version.id]))
+    if to_create:
+        try:
+            with transaction.atomic():
+                BillingVersionMinutes.objects.bulk_create(to_create)
+        except IntegrityError:
+            # Another report calculated some of the same versions at the same
+            # time.  Fall back to adding the rows one-by-one, skipping the
+            # ones that already exist.
+            for row in to_create:
+                BillingVersionMinutes.objects.get_or_create(
+                    subtitle_version_id=row.subtitle_version_id,
+                    defaults={'minutes': row.minutes})
+    return rv
+
+def _external_sort(rows, key, run_size):
+    """Sort rows without storing them all in memory.
+
+    rows is sorted in runs of run_size rows, each of which gets written to a
+    temporary file.  Then we merge the runs back together.  The sort is
+    stable, like sorted().  rows must be picklable.
+    """
+    rows = iter(rows)
+    run = list(islice(rows, run_size))
+    if len(run) < run_size:
+        # everything fits in a single run
+        run.sort(key=key)
+        for row in run:
+            yield row
+        return
+
+    run_files = []
+    try:
+        position = 0
+        while run:
+            decorated = []
+            for row in run:
+                decorated.append((key(row), position, row))
+                position += 1
+            decorated.sort()
+            f = tempfile.TemporaryFile()
+            for item in decorated:
+                pickle.dump(item, f, pickle.HIGHEST_PROTOCOL)
+            f.seek(0)
+            run_files.append(f)
+            run = list(islice(rows, run_size))
+        for key_value, position, row in heapq.merge(
+                *[_read_pickled_items(f) for f in run_files]):
+            yield row
+    finally:
+        for f in run_files:
+            f.close()
+
+def _read_pickled_items(f):
+    while True:
+        try:
+            yield pickle.load(f)
+        except EOFError:
+            return
+
 class BillingRecord(models.Model):
     # The billing record should still exist if the video is deleted
     video = models.ForeignKey(Video, blank=True, null=True, on_delete=models.SET_NULL)
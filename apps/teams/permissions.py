@@ -89,35 +89,17 @@ def get_role(member):
     else:
         return member.role
 
+def get_permission_snapshot(user, team):
+    """Return the TeamPermissionSnapshot for the given user/team."""
+    return team.get_permission_snapshot(user)
+
 def get_role_for_target(user, team, project=None, lang=None):
     """Return the role the given user effectively has for the given target.
 
     `lang` should be a string (the language code).
 
     """
-    member = get_member(user, team)
-    role = get_role(member)
-    narrowings = get_narrowings(member)
-
-    # If the user has no narrowings, just return their overall role.
-    if not narrowings:
-        return role
-
-    # Otherwise the narrowings must match the target.
-    project_narrowings = [n.project for n in narrowings if n.project]
-    lang_narrowings = [n.language for n in narrowings if n.language]
-
-    # The default project is the same as "no project".
-    if project and project.is_default_project:
-        project = None
-
-    if project_narrowings and project not in project_narrowings:
-        return ROLE_CONTRIBUTOR
-
-    if lang_narrowings and lang not in lang_narrowings:
-        return ROLE_CONTRIBUTOR
-
-    return role
+    return get_permission_snapshot(user, team).role_for_target(project, lang)
 
 
 def roles_user_can_assign(team, user, to_user=None):
@@ -136,7 +118,7 @@ def roles_user_can_assign(team, user, to_user=None):
         return ROLES_ORDER[1:]
     elif user_role == ROLE_ADMIN:
         if to_user:
-            if get_role(get_member(to_user, team)) == ROLE_OWNER or get_role(get_member(to_user, team)) == ROLE_ADMIN:
+            if get_permission_snapshot(to_user, team).role in (ROLE_OWNER, ROLE_ADMIN):
                 return []
         return ROLES_ORDER[2:]
     else:
@@ -277,6 +259,7 @@ def set_narrowings(member, project_pks, languages, author=None):
 
     _add_language_narrowings(member, languages_to_create, author)
     _del_language_narrowings(member, languages_to_delete)
+    member.team.uncache_member(member.user)
 
 
 # Roles
@@ -290,12 +273,14 @@ def add_role(team, cuser, added_by, role, project=None, lang=None):
 
     if project or lang:
         add_narrowing_to_member(member, project, lang, added_by)
+    team.uncache_member(cuser)
 
     return member
 
 def remove_role(team, user, role, project=None, lang=None):
     role = role or ROLE_CONTRIBUTOR
     team.members.filter(user=user, role=role).delete()
+    team.uncache_member(user)
 
 
 # Various permissions
@@ -313,10 +298,10 @@ def can_assign_role(team, user, role, to_user):
     return role in roles_user_can_assign(team, user, to_user)
 
 def can_change_project_managers(team, user):
-    return team.get_member(user).is_admin()
+    return get_permission_snapshot(user, team).role in (ROLE_OWNER, ROLE_ADMIN)
 
 def can_change_language_managers(team, user):
-    return team.get_member(user).is_admin()
+    return get_permission_snapshot(user, team).role in (ROLE_OWNER, ROLE_ADMIN)
 
 def can_join_team(team, user):
     """Return whether the given user can join a team.
@@ -381,13 +366,11 @@ def can_add_member(team, user, role):
     else:
         roles_allowed = [ROLE_ADMIN, ROLE_OWNER]
 
-    return TeamMember.objects.filter(
-        team=team, user=user, role__in=roles_allowed
-    ).exists()
+    return get_permission_snapshot(user, team).role in roles_allowed
 
 def can_remove_member(team, user):
-    member = team.get_member(user)
-    return can_add_member(team, user, member.role)
+    return can_add_member(team, user,
+                          get_permission_snapshot(user, team).role)
 
 def can_move_videos(team, user):
     role = get_role_for_target(user, team, None, None)
@@ -535,10 +518,7 @@ def can_view_tasks_tab(team, user):
     Only team members can see the tasks tab.
 
     """
-    if not user or not user.is_authenticated():
-        return False
-
-    return team.members.filter(user=user).exists()
+    return get_permission_snapshot(user, team).is_member
 
 def can_view_notifications(team, user):
     """Return whether a user can view notifications for a team.
@@ -804,7 +784,7 @@ def can_view_private_versions(user, language):
     if team_video is None:
         return True
     else:
-        return get_member(user, team_video.team) != None
+        return get_permission_snapshot(user, team_video.team).is_member
 
 # Task permissions
 def can_create_tasks(team, user, project=None):
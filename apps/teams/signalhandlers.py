@@ -17,10 +17,11 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
 from django.dispatch import receiver
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, m2m_changed
 
 from auth.models import CustomUser as User
-from teams.models import TeamVideo, TeamMember, MembershipNarrowing
+from teams.models import (Team, TeamVideo, TeamMember, MembershipNarrowing,
+                          LanguageManager)
 from teams.signals import api_teamvideo_new
 from videos.signals import feed_imported
 
@@ -34,11 +35,30 @@ def on_feed_imported(signal, sender, new_videos, **kwargs):
 @receiver(post_delete, sender=TeamMember)
 def on_team_member_change(sender, instance, **kwargs):
     User.cache.invalidate_by_pk(instance.user_id)
+    # TeamMember.save() and delete() do this too, but they don't get called
+    # for queryset deletes
+    Team.cache.invalidate_by_pk(instance.team_id)
 
 @receiver(post_save, sender=MembershipNarrowing)
 @receiver(post_delete, sender=MembershipNarrowing)
 def on_membership_narrowing_change(sender, instance, **kwargs):
     try:
         User.cache.invalidate_by_pk(instance.member.user_id)
+        Team.cache.invalidate_by_pk(instance.member.team_id)
     except TeamMember.DoesNotExist:
         pass
+
+@receiver(post_save, sender=LanguageManager)
+@receiver(post_delete, sender=LanguageManager)
+def on_language_manager_change(sender, instance, **kwargs):
+    try:
+        Team.cache.invalidate_by_pk(instance.member.team_id)
+    except TeamMember.DoesNotExist:
+        pass
+
+@receiver(m2m_changed, sender=TeamMember.projects_managed.through)
+def on_projects_managed_change(sender, instance, action, **kwargs):
+    # instance is either a TeamMember or a Project (if reverse is set).
+    # Both have the team_id that we need.
+    if action.startswith('post_'):
+        Team.cache.invalidate_by_pk(instance.team_id)
@@ -9,34 +9,20 @@ from django.conf import settings
 from django.contrib.sites.models import Site
 from django.db.models import F
 from django.utils.translation import ugettext_lazy as _
-import requests
 from utils import send_templated_email
-from utils.panslugify import pan_slugify
-from utils.translation import get_language_choices
-from widget.video_cache import (
-    invalidate_cache as invalidate_video_cache,
-    invalidate_video_moderation,
-    invalidate_video_visibility
-)
+from widget.video_cache import invalidate_team_cache, invalidate_team_namespace
 
 from utils.text import fmt
-from videos.tasks import video_changed_tasks
-
-LANGUAGE_CHOICES = [l[0] for l in get_language_choices(flat=True)]
 
 @task()
 def invalidate_video_caches(team_id):
     """Invalidate all TeamVideo caches for all the given team's videos."""
-    from teams.models import Team
-    team = Team.objects.get(pk=team_id)
-    for video_id in team.teamvideo_set.values_list('video__video_id', flat=True):
-        invalidate_video_cache(video_id)
+    invalidate_team_cache(team_id)
 
 @task()
 def invalidate_video_moderation_caches(team):
     """Invalidate the moderation status caches for all the given team's videos."""
-    for video_id in team.teamvideo_set.values_list('video__video_id', flat=True):
-        invalidate_video_moderation(video_id)
+    invalidate_team_namespace(team.id)
 
 @task()
 def update_video_moderation(team):
@@ -48,20 +34,35 @@ def update_video_moderation(team):
 
 @task()
 def invalidate_video_visibility_caches(team):
-    for video_id in team.teamvideo_set.values_list("video__video_id", flat=True):
-        invalidate_video_visibility(video_id)
+    invalidate_team_namespace(team.id)
+
+# Number of videos to handle at once in update_video_public_field()
+UPDATE_PUBLIC_FIELD_CHUNK_SIZE = 1000
 
 @task()
 def update_video_public_field(team_id):
-    from teams.models import Team
+    """Update is_public and the other metadata for a team's videos.
 
-    team = Team.objects.get(pk=team_id)
-
-    for team_video in team.teamvideo_set.all():
-        video = team_video.video
-        video.is_public = team.is_visible
-        video.save()
-        video_changed_tasks(video.id)
+    This runs after a team's visibility changes.  We update the videos in
+    chunks using metadata_manager.update_metadata_for_videos(), which also
+    invalidates Video.cache for each video in the chunk.  We queue the
+    search index updates for each chunk, then invalidate the widget caches
+    for the whole team at once.
+    """
+    from teams.models import TeamVideo
+    from videos import metadata_manager
+    from videos.tasks import update_search_index_for_videos
+
+    video_pks = list(TeamVideo.objects.filter(team_id=team_id)
+                     .order_by('video').values_list('video_id', flat=True))
+    total = len(video_pks)
+    for start in xrange(0, total, UPDATE_PUBLIC_FIELD_CHUNK_SIZE):
+        chunk = video_pks[start:start+UPDATE_PUBLIC_FIELD_CHUNK_SIZE]
+        metadata_manager.update_metadata_for_videos(chunk)
+        update_search_index_for_videos.delay(chunk)
+        logger.info('update_video_public_field (team: %s): %s/%s videos',
+                    team_id, start + len(chunk), total)
+    invalidate_team_cache(team_id)
 
 @task
 def expire_tasks():
@@ -173,78 +174,65 @@ def process_billing_report(billing_report_pk):
 
 @task()
 def add_team_videos(team_pk, user_pk, videos):
+    """Add videos to a team in bulk.
+
+    :param videos: list of dicts with the data for each video.  See
+        teams.video_import.TeamVideoImporter for the format.
+
+    The rows get imported in chunks of TEAM_VIDEO_IMPORT_CHUNK_SIZE by
+    import_team_videos_chunk tasks.  Once all chunks are done, we email the
+    user a summary.
+    """
     from .permissions import can_add_videos_bulk
-    from teams.models import Team, Project, TeamVideo
-    from videos.models import Video
-    from videos.types import video_type_registrar
+    from teams.models import Team, TeamVideoImport
     from auth.models import CustomUser as User
-    from utils.subtitles import load_subtitles
-    from subtitles.pipeline import add_subtitles
     user = User.objects.get(pk=int(user_pk))
     team = Team.objects.get(pk=int(team_pk))
-    num_successful_videos = 0
-    messages = []
-    if can_add_videos_bulk(user):
-        for video_item in videos:
-            video_url = video_item['url']
-            try:
-                video_type = video_type_registrar.video_type_for_url(video_url)
-                video_url = video_type.convert_to_video_url()
-            except:
-                messages.append(fmt(_(u"Unknown video type: %(url)s\n"), url=video_url))
-                continue
+    if not can_add_videos_bulk(user):
+        send_videos_added_email(user, team, [
+            fmt(_(u'You are not authorized to perform such action\n')),
+        ], 0)
+        return
+    team_video_import = TeamVideoImport.objects.create(
+        team=team, user=user, total_rows=len(videos))
+    if not videos:
+        team_video_import.finish_if_complete()
+        send_videos_added_email(user, team, [], 0)
+        return
+    chunk_size = getattr(settings, 'TEAM_VIDEO_IMPORT_CHUNK_SIZE', 100)
+    for start in xrange(0, len(videos), chunk_size):
+        import_team_videos_chunk.delay(team_video_import.pk, start,
+                                       videos[start:start+chunk_size])
 
-            def setup_video(video, video_url):
-                video.is_public = team.is_visible
-                if video_item.get('title'):
-                    video.title = video_item['title']
-                if video_item.get('description'):
-                    video.description = video_item['description']
-                if video_item.get('language'):
-                    language = video_item['language'].lower()
-                    if language in LANGUAGE_CHOICES:
-                        video.primary_audio_language_code = language
-                    else:
-                        messages.append(fmt(_(u"Badly formated language for %(url)s: %(language)s, ignoring it."), url=video_url, language=video_item['language']))
-                if video_item.get('duration') and not video.duration:
-                    try:
-                        video.duration = int(video_item['duration'])
-                    except:
-                        messages.append(fmt(_(u"Badly formated duration for %(url)s: %(duration)s, ignoring it."), url=video_url, duration=video_item['duration']))
-                if video_item.get('project'):
-                    project, created = Project.objects.get_or_create(team=team, slug=pan_slugify(video_item['project']), defaults={'name': video_item['project']})
-                else:
-                    project = team.default_project
-                team_video = TeamVideo.objects.create(video=video, team=team,
-                                                      project=project, added_by=user)
-
-            try:
-                video, video_url = Video.add(video_type, user, setup_video)
-            except Video.UrlAlreadyAdded, e:
-                if e.video.get_team_video() is not None:
-                    messages.append(fmt(_(u"Video is already part of a team: %(url)s\n"), url=video_url))
-                    continue
-                else:
-                    setup_video(e.video, e.video_url)
-                    e.video.save()
-                    video = e.video
-
-            if 'transcript' in video_item and len(video_item['transcript']) > 0 and video.primary_audio_language_code:
-                try:
-                    sub_type = video_item['transcript'].split(".")[-1]
-                    r = requests.get(video_item['transcript'])
-                    if r.ok:
-                        subs = load_subtitles(video.primary_audio_language_code, r.text, sub_type)
-                        version = add_subtitles(video, video.primary_audio_language_code, subs)
-                    else:
-                        raise Exception("Request not successful")
-                except Exception, e:
-                    logger.error("Error while importing transcript file: {}".format(str(e)))
-                    messages.append(fmt(_(u"Invalid transcript file or language code for video %(url)s\n"), url=video_url))
-            num_successful_videos += 1
-    else:
-        messages.append(fmt(_(u'You are not authorized to perform such action\n')))
-    messages.append(fmt(_(u"Number of videos added to team: %(num)i\n"), num=num_successful_videos))
+@task()
+def import_team_videos_chunk(team_video_import_pk, start_row, videos):
+    from teams.models import TeamVideoImport
+    from teams.video_import import TeamVideoImporter
+    team_video_import = (TeamVideoImport.objects
+                         .select_related('team', 'user')
+                         .get(pk=team_video_import_pk))
+    if team_video_import.chunk_recorded(start_row):
+        # The task was delivered more than once
+        return
+    importer = TeamVideoImporter(team_video_import.team,
+                                 team_video_import.user)
+    try:
+        importer.import_rows(videos, start_row)
+    finally:
+        # Record the chunk even if something unexpected happened, otherwise
+        # the import never finishes.
+        finished = team_video_import.record_chunk(
+            start_row, len(videos), importer.num_added, importer.messages)
+    if finished:
+        send_videos_added_email(team_video_import.user,
+                                team_video_import.team,
+                                team_video_import.message_list(),
+                                team_video_import.num_added)
+
+def send_videos_added_email(user, team, messages, num_added):
+    messages = messages + [
+        fmt(_(u"Number of videos added to team: %(num)i\n"), num=num_added),
+    ]
     domain = Site.objects.get_current().domain
     context = {
         'domain': domain,
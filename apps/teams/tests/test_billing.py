@@ -3,9 +3,12 @@ import collections
 from datetime import datetime, timedelta
 import itertools
 
+from django.db import IntegrityError
 from django.test import TestCase
+import mock
 
-from teams.models import BillingRecord, BillingReport, Task
+from teams.models import (BillingRecord, BillingReport, Task,
+                          BillingVersionMinutes, _external_sort)
 from subtitles.pipeline import add_subtitles
 from teams.permissions_const import (ROLE_CONTRIBUTOR, ROLE_MANAGER,
                                      ROLE_ADMIN)
@@ -46,6 +49,7 @@ def convert_rows_to_dicts(report_rows):
     Converts each row into a dict, with the keys being the keys from the
     header row.
     """
+    report_rows = list(report_rows)
     header_row = report_rows[0]
     rv = []
     for row in report_rows[1:]:
@@ -376,6 +380,71 @@ class ApprovalTest(ApprovalTestBase):
         self.check_language_columns(report_data)
         self.check_minutes(report_data)
 
+    def test_report_in_chunks(self):
+        # Use a small chunk size to test that we handle the related tasks for
+        # each chunk correctly
+        with mock.patch('teams.models.BillingReport.CHUNK_SIZE', 2):
+            report_data = self.get_report_data(self.date_maker.start_date(),
+                                               self.date_maker.end_date())
+        self.check_report_rows(report_data)
+        self.check_approver(report_data)
+        self.check_language_columns(report_data)
+        self.check_minutes(report_data)
+
+    def test_minutes_stored(self):
+        self.get_report_data(self.date_maker.start_date(),
+                             self.date_maker.end_date())
+        self.assertEquals(BillingVersionMinutes.objects.count(),
+                          len(self.approved_languages))
+        # The next report should use the stored minutes rather than
+        # calculating them again
+        with mock.patch('teams.models.get_minutes_for_version') as \
+                mock_get_minutes:
+            report_data = self.get_report_data(self.date_maker.start_date(),
+                                               self.date_maker.end_date())
+        self.assertEquals(mock_get_minutes.call_count, 0)
+        self.check_minutes(report_data)
+
+    def test_minutes_stored_after_integrity_error(self):
+        # If another report stores some of the minutes at the same time,
+        # bulk_create() fails and we should add the rows one-by-one
+        with mock.patch('teams.models.BillingVersionMinutes.objects.'
+                        'bulk_create') as mock_bulk_create:
+            mock_bulk_create.side_effect = IntegrityError()
+            report_data = self.get_report_data(self.date_maker.start_date(),
+                                               self.date_maker.end_date())
+        self.check_minutes(report_data)
+        self.assertEquals(BillingVersionMinutes.objects.count(),
+                          len(self.approved_languages))
+
+    def test_task_without_subtitle_task(self):
+        # If there's no completed subtitle task (for example the review task
+        # was created manually), the row should still be in the report
+        video_id, language_code = self.approved_languages[0]
+        team_video = self.videos[video_id].get_team_video()
+        (Task.objects.complete_subtitle_or_translate()
+         .filter(team_video=team_video, language=language_code)
+         .update(deleted=True))
+        report_data = self.get_report_data(self.date_maker.start_date(),
+                                           self.date_maker.end_date())
+        self.check_report_rows(report_data)
+        self.assertEquals(
+            report_data[video_id, language_code]['Translation?'], False)
+
+    def test_task_without_version(self):
+        # Tasks without a version should be skipped rather than breaking the
+        # whole report
+        approve_task = (Task.objects.complete_approve()
+                        .filter(approved=Task.APPROVED_IDS['Approved'])
+                        .select_related('team_video__video')[0])
+        Task.objects.filter(pk=approve_task.pk).update(
+            new_subtitle_version=None)
+        report_data = self.get_report_data(self.date_maker.start_date(),
+                                           self.date_maker.end_date())
+        self.assertEquals(len(report_data), len(self.approved_languages) - 1)
+        self.assertNotIn((approve_task.team_video.video.video_id,
+                          approve_task.language), report_data)
+
 class ApprovalForUsersTest(ApprovalTestBase):
     def get_report_data(self, start_date, end_date):
         """Get report data in an easy to test way.
@@ -465,6 +534,16 @@ class ApprovalForUsersTest(ApprovalTestBase):
         self.check_minutes(report_data)
         self.check_pay_rates(report_data)
 
+    def test_fallback_to_language_tip(self):
+        # Without new_subtitle_version, we should use the tip of the language
+        # like get_subtitle_version() does
+        Task.objects.complete_approve().update(new_subtitle_version=None)
+        report_data = self.get_report_data(self.date_maker.start_date(),
+                                           self.date_maker.end_date())
+        self.check_report_rows(report_data)
+        self.check_videos_and_languages(report_data)
+        self.check_minutes(report_data)
+
 class SimpleApprovalTestCase(TestCase):
     @test_utils.patch_for_test('teams.models.Task.now')
     def setUp(self, mock_now):
@@ -538,3 +617,26 @@ class ApprovalReportSubtitleWithNoTimingTest(SimpleApprovalTestCase):
             (None, 200, 'subtitle with no start time'),
             (300, 400, 'subtitle with timing'),
         ])
+
+class ExternalSortTest(TestCase):
+    def check_sort(self, rows, run_size):
+        key = lambda row: row[0]
+        self.assertEquals(list(_external_sort(rows, key, run_size)),
+                          sorted(rows, key=key))
+
+    def test_single_run(self):
+        self.check_sort([(3, 'a'), (1, 'b'), (2, 'c')], 10)
+
+    def test_multiple_runs(self):
+        rows = [(i % 7, i) for i in xrange(100)]
+        self.check_sort(rows, 10)
+        self.check_sort(rows, 3)
+
+    def test_stable(self):
+        rows = [(i % 2, i) for i in xrange(20)]
+        self.assertEquals(list(_external_sort(rows, lambda r: r[0], 3)),
+                          [(0, i) for i in xrange(0, 20, 2)] +
+                          [(1, i) for i in xrange(1, 20, 2)])
+
+    def test_empty(self):
+        self.check_sort([], 10)
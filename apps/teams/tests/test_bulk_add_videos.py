@@ -18,8 +18,10 @@
 
 
 from django.test import TestCase
+from django.test.utils import override_settings
 
 from teams import tasks
+from teams.models import TeamVideoImport
 from utils.factories import *
 from utils.test_utils import *
 from videos.models import Video, make_title_from_url
@@ -271,3 +273,101 @@ class BulkAddVideosTest(TestCase):
             "Badly formated language for http://example.com/video3.mp4: abcdef, ignoring it.",
             'Number of videos added to team: 3',
         )
+
+    @override_settings(TEAM_VIDEO_IMPORT_CHUNK_SIZE=2)
+    def test_chunks(self):
+        # test imports that get split into multiple chunks
+        urls = ['http://example.com/video{0}.mp4'.format(i)
+                for i in xrange(5)]
+        self.run_add_team_videos([
+            {'url': url, 'language': 'abcdef' if i in (0, 3) else 'en'}
+            for i, url in enumerate(urls)
+        ])
+        for url in urls:
+            self.check_video(url, primary_audio_language_code=(
+                '' if url in (urls[0], urls[3]) else 'en'))
+        # We should send 1 email for all chunks, with the messages in row
+        # order
+        assert_equal(self.mock_send_templated_email.call_count, 1)
+        self.check_email(
+            "Badly formated language for {0}: abcdef, ignoring it.".format(
+                urls[0]),
+            "Badly formated language for {0}: abcdef, ignoring it.".format(
+                urls[3]),
+            'Number of videos added to team: 5')
+        team_video_import = TeamVideoImport.objects.get()
+        assert_equal(team_video_import.processed_rows, 5)
+        assert_equal(team_video_import.num_added, 5)
+        assert_not_equal(team_video_import.finished, None)
+        assert_equal(team_video_import.progress(), 1.0)
+
+    @override_settings(TEAM_VIDEO_IMPORT_CHUNK_SIZE=2)
+    def test_redelivered_chunk(self):
+        # If a chunk task gets delivered twice, we should only count it once
+        video_info_list = [
+            {'url': 'http://example.com/video{0}.mp4'.format(i),
+             'title': '', 'description': ''}
+            for i in xrange(3)
+        ]
+        self.run_add_team_videos(video_info_list)
+        team_video_import = TeamVideoImport.objects.get()
+        tasks.import_team_videos_chunk(team_video_import.pk, 0,
+                                       video_info_list[:2])
+        team_video_import = TeamVideoImport.objects.get()
+        assert_equal(team_video_import.processed_rows, 3)
+        assert_equal(team_video_import.num_added, 3)
+        assert_equal(team_video_import.messages.count(), 0)
+        assert_equal(self.mock_send_templated_email.call_count, 1)
+
+    def test_record_chunk_twice(self):
+        # Recording the same chunk twice shouldn't finish the import early
+        team_video_import = TeamVideoImport.objects.create(
+            team=self.team, user=self.user, total_rows=4)
+        for i in xrange(2):
+            assert_false(team_video_import.record_chunk(
+                0, 2, 1, [(0, 'message')]))
+        team_video_import = TeamVideoImport.objects.get()
+        assert_equal(team_video_import.processed_rows, 2)
+        assert_equal(team_video_import.num_added, 1)
+        assert_equal(team_video_import.finished, None)
+        assert_equal(team_video_import.message_list(), ['message'])
+        assert_true(team_video_import.record_chunk(2, 2, 2, []))
+
+    def test_duplicate_url(self):
+        # test the same URL twice in one import
+        self.run_add_team_videos([
+            {'url': self.url, 'title': 'title 1'},
+            {'url': self.url, 'title': 'title 2'},
+        ])
+        self.check_video(self.url, title='title 1')
+        self.check_email(
+            "Video is already part of a team: {url}",
+            'Number of videos added to team: 1')
+
+    def test_unknown_video_type(self):
+        self.url = 'http://example.com/not-a-video'
+        self.run_add_team_videos([{
+            'url': self.url,
+        }])
+        self.check_email(
+            "Unknown video type: {url}",
+            'Number of videos added to team: 0')
+
+    @patch_for_test('teams.video_import.TeamVideoImporter.get_project')
+    def test_row_error(self, mock_get_project):
+        # errors for one row shouldn't stop the rest of the import
+        url2 = 'http://example.com/video2.mp4'
+        default_project = self.team.default_project
+        def get_project(row):
+            if row['url'] == self.url:
+                raise ValueError()
+            return default_project
+        mock_get_project.side_effect = get_project
+        self.run_add_team_videos([
+            {'url': self.url},
+            {'url': url2},
+        ])
+        self.check_video(url2)
+        self.check_email(
+            "Error importing video: {url}",
+            'Number of videos added to team: 1')
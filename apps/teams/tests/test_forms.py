@@ -123,6 +123,31 @@ def test_thumbnail_file():
     content = open(p).read()
     return SimpleUploadedFile('thumb.png', content)
 
+class RemoveManagerFormTest(TestCase):
+    def setUp(self):
+        self.team = TeamFactory()
+        self.project = ProjectFactory(team=self.team)
+        self.member = TeamMemberFactory(team=self.team, role=ROLE_MANAGER)
+        self.member.make_project_manager(self.project)
+        self.member.make_language_manager('en')
+
+    def test_project_manager_check_uses_snapshot(self):
+        form = forms.RemoveProjectManagerForm(
+            self.team, self.project,
+            data={'member': self.member.user.username})
+        with mock.patch.object(self.team, 'get_permission_snapshot',
+                               wraps=self.team.get_permission_snapshot) as m:
+            assert_true(form.is_valid(), form.errors)
+        m.assert_called_once_with(self.member.user)
+
+    def test_language_manager_check_uses_snapshot(self):
+        form = forms.RemoveLanguageManagerForm(
+            self.team, 'en', data={'member': self.member.user.username})
+        with mock.patch.object(self.team, 'get_permission_snapshot',
+                               wraps=self.team.get_permission_snapshot) as m:
+            assert_true(form.is_valid(), form.errors)
+        m.assert_called_once_with(self.member.user)
+
 class AddTeamVideoFormTest(TestCase):
     def setUp(self):
         self.team = TeamFactory()
@@ -38,7 +38,8 @@ from teams.permissions import (
     can_create_task_translate, can_join_team, can_edit_video, can_approve,
     roles_user_can_invite, can_add_video_somewhere, can_assign_tasks,
     can_create_and_edit_translations, save_role, can_remove_video,
-    can_delete_team, can_delete_video, can_post_edit_subtitles
+    can_delete_team, can_delete_video, can_post_edit_subtitles,
+    set_narrowings
 )
 
 
@@ -1175,3 +1176,100 @@ class TestViews(BaseTestPermission):
         save_role(self.team, member, role, [], [], owner.user)
         self.team.uncache_member(member.user)
         self.assertEquals(self.team.get_member(member.user).role, role)
+
+class TeamPermissionSnapshotTest(TestCase):
+    def setUp(self):
+        self.team = TeamFactory()
+        self.user = UserFactory()
+        self.member = TeamMemberFactory(team=self.team, user=self.user,
+                                        role=ROLE_ADMIN)
+        self.project = ProjectFactory(team=self.team)
+
+    def reload_team(self):
+        return Team.objects.get(pk=self.team.pk)
+
+    def test_snapshot(self):
+        snapshot = self.reload_team().get_permission_snapshot(self.user)
+        self.assertEquals(snapshot.role, ROLE_ADMIN)
+        self.assertTrue(snapshot.is_member)
+        self.assertFalse(snapshot.is_narrowed)
+        outsider_snapshot = self.reload_team().get_permission_snapshot(
+            UserFactory())
+        self.assertEquals(outsider_snapshot.role, ROLE_OUTSIDER)
+        self.assertFalse(outsider_snapshot.is_member)
+
+    def test_checks_use_snapshot(self):
+        team = self.reload_team()
+        team.get_permission_snapshot(self.user)
+        # once we have a snapshot, role checks shouldn't need any queries
+        with self.assertNumQueries(0):
+            self.assertTrue(team.is_admin(self.user))
+            self.assertFalse(team.is_owner(self.user))
+            self.assertTrue(team.is_member(self.user))
+            self.assertTrue(team.user_is_member(self.user))
+            self.assertFalse(can_rename_team(team, self.user))
+            self.assertTrue(can_view_tasks_tab(team, self.user))
+
+    def test_cached_between_team_objects(self):
+        self.reload_team().get_permission_snapshot(self.user)
+        team = self.reload_team()
+        with self.assertNumQueries(0):
+            self.assertEquals(team.get_permission_snapshot(self.user).role,
+                              ROLE_ADMIN)
+
+    def test_role_change(self):
+        team = self.reload_team()
+        self.assertFalse(team.is_owner(self.user))
+        member = team.get_member(self.user)
+        member.role = ROLE_OWNER
+        member.save()
+        self.assertTrue(team.is_owner(self.user))
+        self.assertTrue(self.reload_team().is_owner(self.user))
+
+    def test_remove_member(self):
+        self.reload_team().get_permission_snapshot(self.user)
+        remove_role(self.team, self.user, ROLE_ADMIN)
+        self.assertFalse(self.reload_team().is_member(self.user))
+
+    def test_remove_member_same_team_object(self):
+        team = self.reload_team()
+        self.assertTrue(team.is_member(self.user))
+        remove_role(team, self.user, ROLE_ADMIN)
+        self.assertFalse(team.is_member(self.user))
+
+    def test_set_narrowings_same_team_object(self):
+        member = TeamMember.objects.select_related('team').get(
+            pk=self.member.pk)
+        team = member.team
+        self.assertFalse(team.get_permission_snapshot(self.user).is_narrowed)
+        set_narrowings(member, [self.project.pk], [])
+        self.assertEquals(team.get_permission_snapshot(self.user)
+                          .project_narrowings, frozenset([self.project.id]))
+
+    def test_narrowings(self):
+        self.reload_team().get_permission_snapshot(self.user)
+        add_role(self.team, self.user, None, ROLE_ADMIN, project=self.project)
+        add_role(self.team, self.user, None, ROLE_ADMIN, lang='fr')
+        snapshot = self.reload_team().get_permission_snapshot(self.user)
+        self.assertEquals(snapshot.project_narrowings,
+                          frozenset([self.project.id]))
+        self.assertEquals(snapshot.language_narrowings, frozenset(['fr']))
+        self.assertEquals(snapshot.role_for_target(self.project, 'fr'),
+                          ROLE_ADMIN)
+        self.assertEquals(snapshot.role_for_target(self.project, 'de'),
+                          ROLE_CONTRIBUTOR)
+        self.assertEquals(snapshot.role_for_target(None, 'fr'),
+                          ROLE_CONTRIBUTOR)
+
+    def test_managed_projects_and_languages(self):
+        self.reload_team().get_permission_snapshot(self.user)
+        self.member.make_project_manager(self.project)
+        self.member.make_language_manager('fr')
+        snapshot = self.reload_team().get_permission_snapshot(self.user)
+        self.assertTrue(snapshot.is_project_manager(self.project))
+        self.assertTrue(snapshot.is_language_manager('fr'))
+        self.member.remove_project_manager(self.project)
+        self.member.remove_language_manager('fr')
+        snapshot = self.reload_team().get_permission_snapshot(self.user)
+        self.assertFalse(snapshot.is_project_manager(self.project))
+        self.assertFalse(snapshot.is_language_manager('fr'))
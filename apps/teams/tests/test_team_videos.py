@@ -24,7 +24,8 @@ from django.test import TestCase
 import mock
 
 from caching.tests.utils import assert_invalidates_model_cache
-from teams.models import Project, TeamVideoMigration
+from teams import tasks
+from teams.models import Project, Team, TeamVideoMigration
 from utils import test_utils
 from utils.factories import *
 
@@ -83,3 +84,23 @@ class TeamMoveTest(TestCase):
         self.check_migration(migrations[2], datetime(2013, 01, 03),
                              self.team, self.team2, self.project2)
 
+
+class UpdateVideoPublicFieldTest(TestCase):
+    def setUp(self):
+        self.team = TeamFactory()
+        self.videos = [TeamVideoFactory(team=self.team).video
+                       for i in range(3)]
+
+    @mock.patch('teams.tasks.UPDATE_PUBLIC_FIELD_CHUNK_SIZE', 2)
+    @mock.patch('videos.tasks.update_search_index_for_videos')
+    def test_update(self, mock_update_search_index):
+        Team.objects.filter(pk=self.team.pk).update(is_visible=False)
+        tasks.update_video_public_field(self.team.id)
+        for video in self.videos:
+            self.assertFalse(test_utils.reload_obj(video).is_public)
+        # We should queue a search index update for each chunk of videos
+        video_pks = sorted(v.pk for v in self.videos)
+        self.assertEquals(mock_update_search_index.delay.call_args_list, [
+            mock.call(video_pks[:2]),
+            mock.call(video_pks[2:]),
+        ])
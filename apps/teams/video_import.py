@@ -0,0 +1,252 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+
+"""teams.video_import -- bulk import videos into a team
+
+add_team_videos() splits the rows from a CSV file or API request into
+chunks, and a TeamVideoImporter processes each chunk.  The importer does
+the per-chunk work in bulk:
+
+    - It looks up the existing VideoUrls for the chunk with 1 query.
+    - It caches the team's projects.
+    - It downloads transcripts with a thread pool once all the videos in
+      the chunk are created.
+
+Videos are still created with Video.add(), since lots of code depends on
+the signals and tasks that it triggers.
+"""
+
+from multiprocessing.pool import ThreadPool
+import logging
+
+from django.conf import settings
+from django.utils.translation import ugettext_lazy as _
+import requests
+
+from subtitles.pipeline import add_subtitles
+from teams.models import Project, TeamVideo
+from utils.panslugify import pan_slugify
+from utils.subtitles import load_subtitles
+from utils.text import fmt
+from utils.translation import get_language_choices
+from videos.models import Video, VideoUrl
+
+logger = logging.getLogger('teams.video_import')
+
+LANGUAGE_CHOICES = set(l[0] for l in get_language_choices(flat=True))
+
+class TeamVideoImporter(object):
+    """Import a chunk of rows into a team.
+
+    Each row is a dict with these keys:
+        url, title, description, language, duration, project, transcript
+
+    Only url is required.  After import_rows() runs, messages contains
+    (row_number, message) tuples and num_added contains the number of
+    videos added to the team.
+    """
+    def __init__(self, team, user):
+        self.team = team
+        self.user = user
+        self.projects = dict((p.slug, p) for p in team.project_set.all())
+        self.messages = []
+        self.num_added = 0
+
+    def add_message(self, row_number, message):
+        self.messages.append((row_number, message))
+
+    def import_rows(self, rows, start_row=0):
+        """Import rows.
+
+        :param rows: list of row dicts
+        :param start_row: row number of the first row, used to sort messages
+        """
+        # import here so that tests can mock the registrar
+        from videos.types import video_type_registrar
+        items = []
+        for row_number, row in enumerate(rows, start_row):
+            try:
+                video_type = video_type_registrar.video_type_for_url(
+                    row['url'])
+                video_url = video_type.convert_to_video_url()
+            except Exception:
+                self.add_message(row_number, fmt(
+                    _(u"Unknown video type: %(url)s\n"), url=row['url']))
+                continue
+            items.append((row_number, row, video_type, video_url))
+
+        existing_urls = self.lookup_existing_urls(
+            [item[3] for item in items])
+        transcripts = []
+        for row_number, row, video_type, video_url in items:
+            try:
+                video = self.import_row(row_number, row, video_type,
+                                        existing_urls.get(video_url))
+            except Exception:
+                logger.exception("Error importing %s", video_url)
+                self.add_message(row_number, fmt(
+                    _(u"Error importing video: %(url)s\n"), url=video_url))
+                continue
+            if video is None:
+                continue
+            self.num_added += 1
+            if row.get('transcript') and video.primary_audio_language_code:
+                transcripts.append((row_number, video, video_url,
+                                    row['transcript']))
+        self.import_transcripts(transcripts)
+
+    def lookup_existing_urls(self, urls):
+        """Look up the VideoUrls that already exist for urls.
+
+        :returns: dict mapping URLs to (video_url, in_team) tuples, where
+            in_team is True if the video is already part of a team.
+        """
+        if not urls:
+            return {}
+        video_urls = list(VideoUrl.objects
+                          .filter(url__in=urls)
+                          .select_related('video'))
+        video_ids_in_teams = set(TeamVideo.objects
+                                 .filter(video__in=[vu.video_id
+                                                    for vu in video_urls])
+                                 .values_list('video_id', flat=True))
+        return dict((vu.url, (vu, vu.video_id in video_ids_in_teams))
+                    for vu in video_urls)
+
+    def import_row(self, row_number, row, video_type, existing):
+        """Import a single row.
+
+        :param existing: (video_url, in_team) tuple from
+            lookup_existing_urls() or None if the URL is new
+        :returns: the Video that we added to the team, or None
+        """
+        def setup_video(video, video_url):
+            self.setup_video(row_number, row, video, video_url)
+
+        if existing is None:
+            try:
+                video, video_url = Video.add(video_type, self.user,
+                                             setup_video)
+                return video
+            except Video.UrlAlreadyAdded, e:
+                # The URL was added since we looked it up, most likely
+                # because it's in the chunk twice.
+                existing = (e.video_url, e.video.get_team_video() is not None)
+        video_url, in_team = existing
+        if in_team:
+            self.add_message(row_number, fmt(
+                _(u"Video is already part of a team: %(url)s\n"),
+                url=video_url.url))
+            return None
+        video = video_url.video
+        setup_video(video, video_url)
+        video.save()
+        return video
+
+    def setup_video(self, row_number, row, video, video_url):
+        video.is_public = self.team.is_visible
+        if row.get('title'):
+            video.title = row['title']
+        if row.get('description'):
+            video.description = row['description']
+        if row.get('language'):
+            language = row['language'].lower()
+            if language in LANGUAGE_CHOICES:
+                video.primary_audio_language_code = language
+            else:
+                self.add_message(row_number, fmt(
+                    _(u"Badly formated language for %(url)s: %(language)s, "
+                      "ignoring it."),
+                    url=video_url.url, language=row['language']))
+        if row.get('duration') and not video.duration:
+            try:
+                video.duration = int(row['duration'])
+            except (ValueError, TypeError):
+                self.add_message(row_number, fmt(
+                    _(u"Badly formated duration for %(url)s: %(duration)s, "
+                      "ignoring it."),
+                    url=video_url.url, duration=row['duration']))
+        TeamVideo.objects.create(video=video, team=self.team,
+                                 project=self.get_project(row),
+                                 added_by=self.user)
+
+    def get_project(self, row):
+        if not row.get('project'):
+            return self.team.default_project
+        slug = pan_slugify(row['project'])
+        if slug not in self.projects:
+            self.projects[slug], created = Project.objects.get_or_create(
+                team=self.team, slug=slug,
+                defaults={'name': row['project']})
+        return self.projects[slug]
+
+    def import_transcripts(self, transcripts):
+        """Download transcripts and add them as subtitles.
+
+        :param transcripts: list of (row_number, video, video_url,
+            transcript_url) tuples
+        """
+        if not transcripts:
+            return
+        contents = fetch_transcripts([t[3] for t in transcripts])
+        for (row_number, video, video_url, transcript_url), content in zip(
+                transcripts, contents):
+            try:
+                if content is None:
+                    raise ValueError("Request not successful")
+                sub_type = transcript_url.split(".")[-1]
+                language_code = video.primary_audio_language_code
+                subs = load_subtitles(language_code, content, sub_type)
+                add_subtitles(video, language_code, subs)
+            except Exception, e:
+                logger.error("Error while importing transcript file: {}".format(
+                    str(e)))
+                self.add_message(row_number, fmt(
+                    _(u"Invalid transcript file or language code for video "
+                      "%(url)s\n"), url=video_url))
+
+def fetch_transcript(url):
+    """Download a transcript.
+
+    :returns: the response text or None if the request failed
+    """
+    try:
+        response = requests.get(url, timeout=getattr(
+            settings, 'TEAM_VIDEO_IMPORT_TRANSCRIPT_TIMEOUT', 30))
+    except requests.RequestException, e:
+        logger.warn("Error fetching transcript %s: %s", url, e)
+        return None
+    if not response.ok:
+        return None
+    return response.text
+
+def fetch_transcripts(urls):
+    """Download several transcripts concurrently.
+
+    :returns: list of results from fetch_transcript() for each URL
+    """
+    concurrency = getattr(settings, 'TEAM_VIDEO_IMPORT_FETCH_CONCURRENCY', 8)
+    if concurrency <= 1 or len(urls) == 1:
+        return [fetch_transcript(url) for url in urls]
+    pool = ThreadPool(min(concurrency, len(urls)))
+    try:
+        return pool.map(fetch_transcript, urls)
+    finally:
+        pool.close()
+        pool.join()
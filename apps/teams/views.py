@@ -492,8 +492,8 @@ def _get_videos_for_detail_page(team, user, query, project, language_code,
     qs = qs.order_by({
          'name':  'title',
         '-name': '-title',
-         'subs':  'num_completed_languages',
-        '-subs': '-num_completed_languages',
+         'subs':  'completed_languages_count',
+        '-subs': '-completed_languages_count',
          'time':  'created',
         '-time': '-created',
     }.get(sort or '-time'))
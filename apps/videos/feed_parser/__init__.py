@@ -18,3 +18,4 @@
 
 from .parser import FeedParser
 from .importer import VideoImporter
+from .fetcher import fetch_feed, fetch_feeds
@@ -0,0 +1,109 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2013 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+
+"""videos.feed_parser.fetcher -- Download feeds for VideoFeed.update()
+
+Downloads send conditional-GET headers so that servers can reply with
+"304 Not Modified" for feeds that haven't changed.  fetch_feeds() runs the
+downloads for a batch of feeds in a thread pool, since that phase is almost
+all time spent waiting on the network.
+"""
+
+from multiprocessing.pool import ThreadPool
+import logging
+
+from django.conf import settings
+import requests
+
+logger = logging.getLogger('videos.feed_parser.fetcher')
+
+class FeedResponse(object):
+    """Result of downloading a feed.
+
+    :attribute status: HTTP status code, or None if the request failed
+    :attribute content: response body
+    :attribute etag: ETag header from the response
+    :attribute last_modified: Last-Modified header from the response
+    :attribute error: exception raised for the request, if any
+    """
+    def __init__(self, url, status=None, content=None, etag=None,
+                 last_modified=None, error=None):
+        self.url = url
+        self.status = status
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.error = error
+
+    @property
+    def not_modified(self):
+        return self.status == 304
+
+    @property
+    def ok(self):
+        return (self.error is None and self.status is not None and
+                200 <= self.status < 300)
+
+def fetch_feed(url, etag=None, last_modified=None):
+    """Download a feed.
+
+    :param etag: ETag from the last download, sent as If-None-Match
+    :param last_modified: Last-Modified from the last download, sent as
+        If-Modified-Since
+    :returns: FeedResponse
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    timeout = getattr(settings, 'VIDEO_FEED_FETCH_TIMEOUT', 30)
+    try:
+        response = requests.get(url, headers=headers, timeout=timeout)
+    except requests.RequestException, e:
+        logger.warn('Error fetching feed %s: %s', url, e)
+        return FeedResponse(url, error=e)
+    return FeedResponse(url, status=response.status_code,
+                        content=response.content,
+                        etag=response.headers.get('etag'),
+                        last_modified=response.headers.get('last-modified'))
+
+def fetch_feeds(feeds, concurrency=None):
+    """Download several VideoFeeds concurrently.
+
+    :param feeds: list of VideoFeed objects
+    :param concurrency: max number of downloads to run at once.  Defaults
+        to the VIDEO_FEED_FETCH_CONCURRENCY setting.
+    :returns: list of (feed, FeedResponse) tuples
+    """
+    if not feeds:
+        return []
+    if concurrency is None:
+        concurrency = getattr(settings, 'VIDEO_FEED_FETCH_CONCURRENCY', 8)
+    def fetch(feed):
+        return fetch_feed(feed.url, feed.etag, feed.last_modified)
+    if concurrency <= 1 or len(feeds) == 1:
+        return [(feed, fetch(feed)) for feed in feeds]
+    pool = ThreadPool(min(concurrency, len(feeds)))
+    try:
+        responses = pool.map(fetch, feeds)
+    finally:
+        pool.close()
+        pool.join()
+    return zip(feeds, responses)
@@ -34,10 +34,24 @@ class VideoImporter(object):
         self.team = team
         self.checked_entries = 0
         self.last_link = ''
+        self.entries_hash = None
 
-    def import_videos(self, import_next=False):
+    def import_videos(self, import_next=False, data=None,
+                      last_entries_hash=None):
+        """Import videos from the feed.
+
+        :param import_next: Also import videos from the "next" links of
+            youtube feeds
+        :param data: Feed contents, if they have already been downloaded
+        :param last_entries_hash: entries_hash from the last import.  If
+            the feed's entries are the same, we don't look for new videos.
+        :returns: list of created videos
+        """
+        feed_parser = FeedParser(self.url, data)
+        self.entries_hash = feed_parser.entries_hash()
+        if self.entries_hash == last_entries_hash:
+            return []
         self._created_videos = []
-        feed_parser = FeedParser(self.url)
         # the link at the top of the feed should be the latest link
         try:
             self.last_link = feed_parser.feed.entries[0]['link']
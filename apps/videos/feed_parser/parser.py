@@ -16,6 +16,8 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+import hashlib
+
 from videos.types import video_type_registrar, VideoTypeError
 import feedparser
 from socket import gaierror
@@ -41,11 +43,32 @@ class FeedParser(object):
     See videos.tests.TestFeedParser for details.
     """
 
-    def __init__(self, feed_url):
+    def __init__(self, feed_url, data=None):
+        """Create a FeedParser
+
+        :param feed_url: URL of the feed
+        :param data: feed contents, if they have already been downloaded.
+            If not given, we download feed_url.
+        """
         self.feed_url = feed_url
-        self.feed = feedparser.parse(feed_url)
+        if data is None:
+            self.feed = feedparser.parse(feed_url)
+        else:
+            self.feed = feedparser.parse(data, response_headers={
+                'content-location': feed_url,
+            })
         self.parser = None
 
+    def entries_hash(self):
+        """Get a hash of the ids of the entries in the feed
+
+        This changes when entries are added to or removed from the feed,
+        but not when other data like the build date changes.
+        """
+        entry_ids = [entry.get('id') or entry.get('link') or u''
+                     for entry in self.feed['entries']]
+        return hashlib.sha1(u'\n'.join(entry_ids).encode('utf-8')).hexdigest()
+
     def items(self, reverse=False, until=False, since=False, ignore_error=False):
         """
         Iterator witch parse every entry and return VideoType instance if possible and
@@ -0,0 +1,105 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+
+from videos.types import video_type_registrar
+
+# URLs in the forms we see from users, feeds and the API for each provider,
+# plus some that don't match any type.
+URL_CORPUS = [
+    'http://www.youtube.com/watch?v=UOtJUmiUZ08',
+    'https://www.youtube.com/watch?v=Ug3ZxDV3ZgE&feature=youtu.be',
+    'http://youtube.com/v/UOtJUmiUZ08',
+    'http://youtu.be/UOtJUmiUZ08',
+    'https://www.youtube.com/embed/UOtJUmiUZ08?rel=0',
+    ('http://cdnbakmi.kaltura.com/p/1492321/sp/149232100/serveFlavor/'
+     'entryId/1_zr7niumr/flavorId/1_djpnqf7y/name/a.mp4'),
+    'http://example.com/videos/lecture-01.ogv',
+    'https://media.example.org/2014/05/talk.mp4',
+    'http://cdn.example.net/clips/intro.webm?token=abc123',
+    'http://www.dailymotion.com/video/x7u2ww_juliette-ne-pas-faire-la-cuisine_music',
+    'http://www.dailymotion.com/video/xb4c2b',
+    'http://vimeo.com/15786066',
+    'https://vimeo.com/channels/staffpicks/22439234',
+    'http://player.vimeo.com/15786066',
+    'http://amara.wistia.com/medias/yyw0x4jvgn',
+    'https://fast.wistia.net/embed/iframe/2o6lvxyvmb',
+    'http://wi.st/medias/2o6lvxyvmb',
+    'http://example.com/old/recording.flv',
+    'http://link.brightcove.com/services/link/bcpid1234/bctid5678',
+    'http://link.brightcove.com/services/link/bcpid1234?bckey=foo&bctid=5678',
+    'http://example.com/podcast/episode-12.mp3',
+    'http://example.com/',
+    'http://www.example.com/watch?v=UOtJUmiUZ08',
+    'https://www.ted.com/talks/some_talk',
+    'http://www.youtube.com/user/amaraorg',
+    'http://vimeo.com/amara',
+    'some url',
+]
+
+class Command(BaseCommand):
+    help = (u'Compare the time to find the video type for a corpus of URLs '
+            'by checking every type and with the dispatch index')
+    option_list = BaseCommand.option_list + (
+        make_option('-r', '--repeat', dest='repeat', default=1000,
+                    type='int', help='Number of times to look up each URL'),
+    )
+
+    def handle(self, **options):
+        repeat = options['repeat']
+        registrar = video_type_registrar
+        type_list = registrar.type_list
+
+        def scan(url):
+            return registrar._find_video_type(url, type_list)[0]
+
+        def indexed(url):
+            return registrar._find_video_type(url,
+                                              registrar._candidates(url))[0]
+
+        def memoized(url):
+            return registrar.video_type_class_for_url(url)
+
+        for url in URL_CORPUS:
+            if scan(url) is not indexed(url):
+                self.stdout.write("Mismatch for {0}\n".format(url))
+        registrar.clear_memo()
+        scan_time = self.time_lookups(scan, repeat)
+        indexed_time = self.time_lookups(indexed, repeat)
+        memoized_time = self.time_lookups(memoized, repeat)
+        count = len(URL_CORPUS) * repeat
+        self.stdout.write("{0} URLs x {1}\n".format(len(URL_CORPUS), repeat))
+        self.stdout.write("  usec/lookup: scan {0:.1f} indexed {1:.1f} "
+                          "({2:.1%}) memoized {3:.1f} ({4:.1%})\n".format(
+                              scan_time * 1000000 / count,
+                              indexed_time * 1000000 / count,
+                              indexed_time / scan_time,
+                              memoized_time * 1000000 / count,
+                              memoized_time / scan_time))
+
+    def time_lookups(self, lookup, repeat):
+        start_time = time.time()
+        for i in xrange(repeat):
+            for url in URL_CORPUS:
+                lookup(url)
+        return time.time() - start_time
@@ -17,43 +17,116 @@
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
 from optparse import make_option
+import os
+import subprocess
+import sys
+import time
 
 from django.core.management.base import BaseCommand
+from django.db.models import Max
 
 from videos.models import Video, VideoIndex
-import time
 
 class Command(BaseCommand):
-    help = "Adds indexes that have to be defined with raw SQL commands"
+    help = "Rebuild the search index for videos"
     option_list = BaseCommand.option_list + (
         make_option('-b', '--batch-size', dest='batch-size', default=100,
-                    help='Set amount of videos to update at once'),
+                    type='int', help='Set amount of videos to update at once'),
         make_option('-l', '--rate-limit', dest='rate-limit', metavar='COUNT',
+                    type='float',
                     help='Only update COUNT videos per second'),
+        make_option('-p', '--processes', dest='processes', default=1,
+                    type='int',
+                    help='Split the work between this many processes'),
+        make_option('--worker-index', dest='worker-index', default=0,
+                    type='int', help=('Which part of the videos to index '
+                                      '(0 to worker-count - 1)')),
+        make_option('--worker-count', dest='worker-count', default=1,
+                    type='int', help='Number of parts to split videos into'),
+        make_option('-c', '--checkpoint', dest='checkpoint', metavar='PATH',
+                    help=('Store the last indexed video id in PATH and '
+                          'resume from it on the next run.  Each worker '
+                          'uses PATH with its index appended')),
     )
 
     def handle(self, **options):
+        if options['processes'] > 1:
+            self.run_processes(options['processes'])
+        else:
+            self.index_videos(options)
+
+    def run_processes(self, count):
+        """Run count copies of this command, each indexing part of the
+        videos."""
+        args = []
+        skip_next = False
+        for arg in sys.argv:
+            if skip_next:
+                skip_next = False
+            elif arg in ('-p', '--processes'):
+                skip_next = True
+            elif not arg.startswith(('-p', '--processes=')):
+                args.append(arg)
+        processes = [
+            subprocess.Popen([sys.executable] + args + [
+                '--processes=1',
+                '--worker-index={}'.format(i),
+                '--worker-count={}'.format(count),
+            ])
+            for i in xrange(count)
+        ]
+        for process in processes:
+            process.wait()
+
+    def index_videos(self, options):
         batch_size = options['batch-size']
-        rate_limit = float(options['rate-limit'])
+        rate_limit = options['rate-limit']
+        worker_index = options['worker-index']
+        worker_count = options['worker-count']
+        # Split the videos into contiguous id ranges, one for each worker
+        max_id = Video.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+        first_id = max_id * worker_index // worker_count
+        last_id = max_id * (worker_index + 1) // worker_count
+        if options['checkpoint']:
+            checkpoint_path = '{}.{}-of-{}'.format(options['checkpoint'],
+                                                  worker_index, worker_count)
+            first_id = max(first_id, self.read_checkpoint(checkpoint_path))
+        else:
+            checkpoint_path = None
+
         start_time = time.time()
-        last_id = -1
-        count = 0
+        count = written = 0
         while True:
-            if last_id:
-                qs = Video.objects.filter(id__gt=last_id)
-            else:
-                qs = Video.objects.all()
-            qs = qs.order_by('id')[:batch_size]
-            videos = list(qs)
+            videos = list(Video.objects
+                          .filter(id__gt=first_id, id__lte=last_id)
+                          .order_by('id')[:batch_size])
             if not videos:
                 break
-            for video in videos:
-                VideoIndex.index_video(video)
-                last_id = max(last_id, video.id)
-                count += 1
+            written += VideoIndex.index_videos(videos)
+            first_id = videos[-1].id
+            count += len(videos)
+            if checkpoint_path:
+                self.write_checkpoint(checkpoint_path, first_id)
             current_time = time.time()
             rate = count / (current_time - start_time)
-            self.stdout.write('indexed {} videos ({:.2f} videos/sec last_id: {})\n'.format(
-                count, rate, last_id))
+            self.stdout.write('[{}/{}] indexed {} videos, {} changed '
+                              '({:.2f} videos/sec last_id: {})\n'.format(
+                                  worker_index + 1, worker_count, count,
+                                  written, rate, first_id))
             if rate_limit is not None and rate > rate_limit:
                 time.sleep((count / rate_limit) - (current_time - start_time))
+
+    def read_checkpoint(self, path):
+        try:
+            with open(path) as f:
+                return int(f.read().strip())
+        except (IOError, ValueError):
+            return 0
+
+    def write_checkpoint(self, path, last_id):
+        # Write to a temp file then rename, so that we never leave a partly
+        # written checkpoint
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(last_id))
+        os.rename(tmp_path, path)
@@ -0,0 +1,50 @@
+# Amara, universalsubtitles.org
+#
+# Copyright (C) 2016 Participatory Culture Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see
+# http://www.gnu.org/licenses/agpl-3.0.html.
+
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from search import backends as search_backends
+from videos.models import VideoIndex
+
+class Command(BaseCommand):
+    help = "Rebuild the search backend's index from the VideoIndex table"
+    option_list = BaseCommand.option_list + (
+        make_option('-b', '--batch-size', dest='batch-size', default=1000,
+                    type='int', help='Set amount of videos to index at once'),
+    )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch-size']
+        backend = search_backends.get_backend()
+        backend.clear()
+        last_video_id = 0
+        count = 0
+        while True:
+            rows = list(VideoIndex.objects
+                        .filter(video_id__gt=last_video_id)
+                        .order_by('video_id')
+                        .values_list('video_id', 'text')[:batch_size])
+            if not rows:
+                break
+            backend.index_texts(rows)
+            count += len(rows)
+            last_video_id = rows[-1][0]
+            self.stdout.write('indexed {} videos\n'.format(count))
@@ -16,58 +16,183 @@
 # along with this program.  If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+from collections import defaultdict
 from datetime import datetime
 
+from django.db.models import Count, F
+
+class MetadataStats(object):
+    """Tracks the database writes that update_metadata() makes
+
+    writes_saved counts the writes that we avoided compared to saving the
+    video once for each field that we update, like we used to.
+    """
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.updates = 0
+        self.writes = 0
+        self.writes_saved = 0
+
+metadata_stats = MetadataStats()
+
 def update_metadata(video_pk):
+    """Recalculate the derived fields for a video
+
+    We calculate all the fields first, then write the ones that changed with
+    a single UPDATE statement.
+    """
     from videos.models import Video
     video = Video.objects.get(pk=video_pk)
-    video.edited = datetime.now()
-    video.save()
-    _update_is_public(video)
-    _update_is_was_subtitled(video)
-    _update_languages_count(video)
-    _update_complete_date(video)
+    now = datetime.now()
+    new_values = {
+        'edited': now,
+        'is_public': _calc_is_public(video),
+    }
+    language_codes = list(video.newsubtitlelanguage_set.having_nonempty_tip()
+                          .values_list('language_code', flat=True))
+    new_values['languages_count'] = len(language_codes)
+    if video.primary_audio_language_code in language_codes:
+        new_values['is_subtitled'] = new_values['was_subtitled'] = True
+    else:
+        new_values['is_subtitled'] = False
+    if _calc_is_complete(video):
+        if video.complete_date is None:
+            new_values['complete_date'] = now
+    else:
+        new_values['complete_date'] = None
+
+    changed = dict((name, value) for name, value in new_values.items()
+                   if getattr(video, name) != value)
+    Video.objects.filter(pk=video.pk).update(**changed)
+    for name, value in changed.items():
+        setattr(video, name, value)
+    if changed:
+        # update() skips the post_save handler, so we need to invalidate the
+        # cached Video ourselves
+        video.cache.invalidate()
+
+    # We used to save the video once at the start, once each for is_public
+    # and languages_count, then once each if is_subtitled or complete_date
+    # changed.
+    old_writes = 3
+    if 'is_subtitled' in changed or 'was_subtitled' in changed:
+        old_writes += 1
+    if 'complete_date' in changed:
+        old_writes += 1
+    metadata_stats.updates += 1
+    metadata_stats.writes += 1
+    metadata_stats.writes_saved += old_writes - 1
+
     _invalidate_cache(video)
 
-def _update_is_was_subtitled(video):
-    from subtitles.models import SubtitleLanguage
-    language_code = video.primary_audio_language_code
-    has_version = (SubtitleLanguage.objects.having_nonempty_tip()
-                                           .filter(video=video, 
-                                                   language_code=language_code)
-                                           .exists())
-
-    if not has_version:
-        if video.is_subtitled:
-            video.is_subtitled = False
-            video.save()
+def _calc_is_public(video):
+    team_video = video.get_team_video()
+    if team_video:
+        return team_video.team.is_visible
     else:
-        if not video.is_subtitled or not video.was_subtitled:
-            video.is_subtitled = True
-            video.was_subtitled = True
-            video.save()
-
-def _update_languages_count(video):
-    video.languages_count = video.newsubtitlelanguage_set.having_nonempty_tip().count()
-    video.save()
-
-def _update_complete_date(video):
-    is_complete = video.is_complete
-    if is_complete and video.complete_date is None:
-        video.complete_date = datetime.now()
-        video.save()
-    elif not is_complete and video.complete_date is not None:
-        video.complete_date = None
-        video.save()
+        return True
+
+def _calc_is_complete(video):
+    """Calculate Video.is_complete
+
+    This only loads the languages that are marked complete, since those are
+    the only ones that can pass is_complete_and_synced().
+    """
+    for sl in video.newsubtitlelanguage_set.filter(subtitles_complete=True):
+        if sl.is_complete_and_synced():
+            return True
+    return False
 
 def _invalidate_cache(video):
     from widget import video_cache
-    video_cache.invalidate_cache(video.video_id)
+    video_cache.invalidate_cache(video.video_id, video)
 
-def _update_is_public(video):
-    team_video = video.get_team_video()
-    if team_video:
-        video.is_public = team_video.team.is_visible
-    else:
-        video.is_public = True
-    video.save()
+def update_metadata_for_videos(video_pks):
+    """Bulk version of update_metadata()
+
+    This calculates the same fields as update_metadata() for a list of
+    videos, but uses a handful of set-based queries for the whole list rather
+    than saving each video several times.
+
+    Like update_metadata(), this invalidates Video.cache for each video,
+    since the bulk UPDATEs skip the post_save handler.  It doesn't
+    invalidate the widget cache for the videos though.  Callers should
+    handle that, normally with something like
+    video_cache.invalidate_team_cache().
+    """
+    from videos.models import Video
+
+    video_pks = list(video_pks)
+    if not video_pks:
+        return
+    now = datetime.now()
+    Video.objects.filter(pk__in=video_pks).update(edited=now)
+    _bulk_update_is_public(video_pks)
+    _bulk_update_is_was_subtitled(video_pks)
+    _bulk_update_languages_count(video_pks)
+    _bulk_update_complete_date(video_pks, now)
+    for pk in video_pks:
+        Video.cache.invalidate_by_pk(pk)
+
+def _bulk_update_is_public(video_pks):
+    from teams.models import TeamVideo
+    from videos.models import Video
+    team_visibility = dict(TeamVideo.objects
+                           .filter(video__in=video_pks)
+                           .values_list('video_id', 'team__is_visible'))
+    by_value = defaultdict(list)
+    for pk in video_pks:
+        by_value[team_visibility.get(pk, True)].append(pk)
+    for is_public, pks in by_value.items():
+        Video.objects.filter(pk__in=pks).update(is_public=is_public)
+
+def _bulk_update_is_was_subtitled(video_pks):
+    from subtitles.models import SubtitleLanguage
+    from videos.models import Video
+    subtitled = set(SubtitleLanguage.objects.having_nonempty_tip()
+                    .filter(video__in=video_pks,
+                            language_code=F('video__primary_audio_language_code'))
+                    .values_list('video_id', flat=True))
+    not_subtitled = [pk for pk in video_pks if pk not in subtitled]
+    if subtitled:
+        (Video.objects.filter(pk__in=subtitled)
+         .update(is_subtitled=True, was_subtitled=True))
+    if not_subtitled:
+        (Video.objects.filter(pk__in=not_subtitled, is_subtitled=True)
+         .update(is_subtitled=False))
+
+def _bulk_update_languages_count(video_pks):
+    from subtitles.models import SubtitleLanguage
+    from videos.models import Video
+    counts = dict(SubtitleLanguage.objects.having_nonempty_tip()
+                  .filter(video__in=video_pks)
+                  .values_list('video_id')
+                  .annotate(Count('id')))
+    # Run 1 UPDATE for each distinct count
+    by_count = defaultdict(list)
+    for pk in video_pks:
+        by_count[counts.get(pk, 0)].append(pk)
+    for count, pks in by_count.items():
+        Video.objects.filter(pk__in=pks).update(languages_count=count)
+
+def _bulk_update_complete_date(video_pks, now):
+    from subtitles.models import SubtitleLanguage
+    from videos.models import Video
+    # Checking if the subtitles are fully synced means parsing them, so we
+    # can't do it in SQL.  We can use SQL to find the languages that might be
+    # complete though.
+    complete = set()
+    candidates = SubtitleLanguage.objects.filter(video__in=video_pks,
+                                                 subtitles_complete=True)
+    for language in candidates:
+        if (language.video_id not in complete and
+                language.is_complete_and_synced()):
+            complete.add(language.video_id)
+    if complete:
+        (Video.objects.filter(pk__in=complete, complete_date__isnull=True)
+         .update(complete_date=now))
+    (Video.objects.filter(pk__in=video_pks, complete_date__isnull=False)
+     .exclude(pk__in=complete)
+     .update(complete_date=None))
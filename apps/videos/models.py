@@ -18,6 +18,7 @@
 
 from collections import defaultdict
 from datetime import datetime, date, timedelta
+import hashlib
 import logging
 import json
 import string
@@ -25,6 +26,7 @@ import random
 import time
 import re
 import urlparse
+import uuid
 
 from django.utils.safestring import mark_safe
 from django.core.cache import cache
@@ -43,21 +45,21 @@ from django.core.exceptions import ValidationError
 from django.forms.forms import NON_FIELD_ERRORS
 
 from auth.models import CustomUser as User, Awards
-from caching import ModelCacheManager
+from caching import ModelCacheManager, set_many_multi_group
 from videos import behaviors
 from videos import metadata
 from videos import signals
 from videos.types import (video_type_registrar, video_type_choices,
                           VideoTypeError)
-from videos.feed_parser import VideoImporter
+from videos.feed_parser import VideoImporter, fetch_feed
 from comments.models import Comment
+from search import backends as search_backends
 from widget import video_cache
 from utils import codes
 from utils import dates
 from utils import translation
 from utils.amazon import S3EnabledImageField
 from utils.panslugify import pan_slugify
-from utils.searching import get_terms
 from utils.subtitles import create_new_subtitles, dfxp_merge
 from utils.text import fmt
 from teams.moderation_const import MODERATION_STATUSES, UNMODERATED
@@ -159,47 +161,27 @@ EXISTS(
         return self.extra({ '_has_public_version': sql })
 
     def search(self, query):
-        # only use terms with 3 or more chars.  Terms with less chars are not indexed, so they will never match anything.
-        terms = [t for t in get_terms(query) if len(t) > 2]
-        query = u' '.join(u'+"{}"'.format(t) for t in terms)
-        return self.filter(index__text__search=query)
+        return search_backends.get_backend().filter_queryset(self, query)
 
     def add_num_completed_languages(self):
-        sql = ("""
-               (SELECT COUNT(*) FROM subtitles_subtitlelanguage sl
-               WHERE sl.video_id=videos_video.id AND
-               sl.subtitles_complete)""")
+        # completed_languages_count is kept up to date by
+        # VideoCompletedLanguage.update_for_videos().  Order by that field
+        # rather than num_completed_languages so that the index gets used.
         return self.extra(select={
-            'num_completed_languages': sql
+            'num_completed_languages': 'videos_video.completed_languages_count'
         })
 
     def any_completed_languages(self):
-        sql = ("""
-               EXISTS (SELECT * FROM subtitles_subtitlelanguage sl
-               WHERE sl.video_id=videos_video.id AND
-               sl.subtitles_complete)""")
-        return self.extra(where=[sql])
+        return self.filter(completed_languages_count__gt=0)
 
     def no_completed_languages(self):
-        sql = ("""
-               NOT EXISTS (SELECT * FROM subtitles_subtitlelanguage sl
-               WHERE sl.video_id=videos_video.id AND
-               sl.subtitles_complete)""")
-        return self.extra(where=[sql])
+        return self.filter(completed_languages_count=0)
 
     def has_completed_language(self, language_code):
-        sql = ("""
-               EXISTS (SELECT * FROM subtitles_subtitlelanguage sl
-               WHERE sl.video_id=videos_video.id AND
-               sl.language_code=%s AND sl.subtitles_complete)""")
-        return self.extra(where=[sql], params=[language_code])
+        return self.filter(completed_languages__language_code=language_code)
 
     def missing_completed_language(self, language_code):
-        sql = ("""
-               NOT EXISTS (SELECT * FROM subtitles_subtitlelanguage sl
-               WHERE sl.video_id=videos_video.id AND
-               sl.language_code=%s AND sl.subtitles_complete)""")
-        return self.extra(where=[sql], params=[language_code])
+        return self.exclude(completed_languages__language_code=language_code)
 
 class SubtitleLanguageFetcher(object):
     """Fetches/caches subtitle languages for videos."""
@@ -263,6 +245,45 @@ class VideoCacheManager(ModelCacheManager):
         video._cached_teamvideo = self._get_team_video_from_cache(video)
         return video
 
+    def get_instances(self, pks, cache_pattern=None):
+        from teams.models import TeamVideo
+        videos = super(VideoCacheManager, self).get_instances(pks,
+                                                              cache_pattern)
+        # 'teamvideo' was fetched along with 'self', so this doesn't hit the
+        # cache again.  Load all the misses with 1 query.
+        missing = []
+        for video in videos:
+            try:
+                team_video = video.cache.get_model(TeamVideo, 'teamvideo')
+            except TeamVideo.DoesNotExist:
+                video._cached_teamvideo = None
+                continue
+            if team_video is None:
+                missing.append(video)
+            else:
+                team_video.video = video
+                video._cached_teamvideo = team_video
+        if missing:
+            team_videos = dict(
+                (tv.video_id, tv) for tv in TeamVideo.objects.filter(
+                    video_id__in=[v.id for v in missing]))
+            for video in missing:
+                team_video = team_videos.get(video.id)
+                if team_video is not None:
+                    team_video.video = video
+                video._cached_teamvideo = team_video
+            set_many_multi_group([
+                (video.cache, {
+                    'teamvideo': video.cache._model_cache_value(
+                        video._cached_teamvideo),
+                })
+                for video in missing
+            ])
+        return videos
+
+    def batch_keys(self):
+        return ['self', 'teamvideo']
+
     def _get_team_video_from_cache(self, video):
         from teams.models import TeamVideo
         try:
@@ -379,6 +400,10 @@ class Video(models.Model):
     # Denormalizing the subtitles(had_version) count, in order to get faster joins
     # updated from update_languages_count()
     languages_count = models.PositiveIntegerField(default=0, db_index=True, editable=False)
+    # Denormalized count of the languages with subtitles_complete set.
+    # updated from VideoCompletedLanguage.update_for_videos()
+    completed_languages_count = models.PositiveIntegerField(
+        default=0, db_index=True, editable=False)
     moderated_by = models.ForeignKey("teams.Team", blank=True, null=True, related_name="moderating")
 
     # denormalized convenience from VideoVisibility, should not be set
@@ -713,7 +738,7 @@ class Video(models.Model):
             if user and user.notify_by_message:
                 video.followers.add(user)
         # Run post-creation code
-        video_cache.invalidate_cache(video.video_id)
+        video_cache.invalidate_cache(video.video_id, video)
         video.cache.invalidate()
         signals.video_added.send(sender=video, video_url=video_url)
         signals.video_url_added.send(sender=video_url, video=video,
@@ -742,7 +767,7 @@ class Video(models.Model):
         """
         vt, video_url = self._add_video_url(url, user, False)
 
-        video_cache.invalidate_cache(self.video_id)
+        video_cache.invalidate_cache(self.video_id, self)
         self.cache.invalidate()
         signals.video_url_added.send(sender=video_url, video=self,
                                      new_video=False)
@@ -1195,7 +1220,7 @@ def create_video_id(sender, instance, **kwargs):
     instance.video_id = ''.join([random.choice(alphanum) for i in xrange(12)])
 
 def video_delete_handler(sender, instance, **kwargs):
-    video_cache.invalidate_cache(instance.video_id)
+    video_cache.invalidate_cache(instance.video_id, instance)
 
 models.signals.pre_save.connect(create_video_id, sender=Video)
 models.signals.pre_delete.connect(video_delete_handler, sender=Video)
@@ -1204,8 +1229,14 @@ models.signals.m2m_changed.connect(User.video_followers_change_handler, sender=V
 class VideoIndex(models.Model):
     video = models.OneToOneField(Video, primary_key=True, related_name='index')
     text = models.TextField()
+    # md5 hash of text.  This lets us skip writing rows that haven't changed
+    # when we re-index videos.
+    text_hash = models.CharField(max_length=32, blank=True, default='')
 
     MAX_TEXT_LENGTH = 10 * 1000 * 1000
+    # SubtitleVersion fields that we include in the text
+    TIP_FIELDS = ('title', 'description', 'meta_1_content', 'meta_2_content',
+                  'meta_3_content')
 
     @classmethod
     def index_video(cls, video):
@@ -1216,15 +1247,102 @@ class VideoIndex(models.Model):
         # innodb locks still open.
         with transaction.atomic():
             text = cls.calc_text(video, max_length=cls.MAX_TEXT_LENGTH)
-        index, created = cls.objects.get_or_create(video=video,
-                                                   defaults={'text': text})
-        if not created:
-            index.text = text
-            index.save()
+        text_hash = cls.hash_text(text)
+        index, created = cls.objects.get_or_create(video=video, defaults={
+            'text': text,
+            'text_hash': text_hash,
+        })
+        if created or index.text_hash != text_hash:
+            if not created:
+                index.text = text
+                index.text_hash = text_hash
+                index.save()
+            search_backends.get_backend().index_texts([(video.id, text)])
         return index
 
+    @classmethod
+    def index_videos(cls, videos):
+        """Index a batch of videos
+
+        This works like calling index_video() for each video, but we fetch
+        the URLs and public tips for the whole batch at once, skip videos
+        where the text is unchanged, and write the rest with a couple of bulk
+        queries.
+
+        Returns the number of index rows written.
+        """
+        from subtitles.models import SubtitleVersion as NewSubtitleVersion
+
+        videos = list(videos)
+        if not videos:
+            return 0
+        video_ids = [v.id for v in videos]
+        # See index_video() for why we use a transaction here
+        with transaction.atomic():
+            urls = defaultdict(list)
+            for video_id, url in (VideoUrl.objects.filter(video__in=video_ids)
+                                  .values_list('video_id', 'url')):
+                urls[video_id].append(url)
+            tips = defaultdict(list)
+            tip_qs = (NewSubtitleVersion.objects.public_tips()
+                      .filter(video__in=video_ids)
+                      .order_by('id')
+                      .values_list('video_id', *cls.TIP_FIELDS))
+            for row in tip_qs:
+                tips[row[0]].append(row[1:])
+            texts = [
+                (video.id, cls._calc_text(video, urls[video.id],
+                                          tips[video.id],
+                                          cls.MAX_TEXT_LENGTH))
+                for video in videos
+            ]
+
+        current_hashes = dict(cls.objects.filter(video__in=video_ids)
+                              .values_list('video_id', 'text_hash'))
+        to_write = []
+        for video_id, text in texts:
+            text_hash = cls.hash_text(text)
+            if current_hashes.get(video_id) != text_hash:
+                to_write.append(cls(video_id=video_id, text=text,
+                                    text_hash=text_hash))
+        cls._write_rows(to_write, [
+            row.video_id for row in to_write if row.video_id in current_hashes
+        ])
+        if to_write:
+            search_backends.get_backend().index_texts([
+                (row.video_id, row.text) for row in to_write
+            ])
+        return len(to_write)
+
+    @classmethod
+    def _write_rows(cls, rows, existing_ids):
+        # Django doesn't have an upsert, so we delete the existing rows and
+        # insert new ones.  The index table is MyISAM, so there are no
+        # foreign keys to worry about.
+        with transaction.atomic():
+            if existing_ids:
+                cursor = connection.cursor()
+                cursor.execute('DELETE FROM {} WHERE video_id IN ({})'.format(
+                    cls._meta.db_table, ', '.join(['%s'] * len(existing_ids))),
+                    existing_ids)
+            if rows:
+                cls.objects.bulk_create(rows)
+
+    @staticmethod
+    def hash_text(text):
+        return hashlib.md5(text.encode('utf-8')).hexdigest()
+
     @staticmethod
     def calc_text(video, max_length=None):
+        urls = [vurl.url for vurl in video.get_video_urls()]
+        tips = [
+            tuple(getattr(tip, name) for name in VideoIndex.TIP_FIELDS)
+            for tip in video.newsubtitleversion_set.public_tips().order_by('id')
+        ]
+        return VideoIndex._calc_text(video, urls, tips, max_length)
+
+    @staticmethod
+    def _calc_text(video, urls, tips, max_length):
         parts = [
             video.title_display(),
             video.description,
@@ -1232,18 +1350,251 @@ class VideoIndex(models.Model):
             video.meta_2_content,
             video.meta_3_content,
         ]
-        parts.extend(vurl.url for vurl in video.get_video_urls())
-        for tip in video.newsubtitleversion_set.public_tips():
-            parts.extend([
-                tip.title, tip.description,
-                tip.meta_1_content, tip.meta_2_content, tip.meta_3_content,
-            ])
+        parts.extend(urls)
+        for tip_values in tips:
+            parts.extend(tip_values)
 
         text = '\n'.join(p for p in parts if p is not None)
         if max_length is not None:
             text = text[:max_length]
         return text
 
+class VideoCompletedLanguage(models.Model):
+    """Denormalized set of the completed languages for a video
+
+    There's a row here for each SubtitleLanguage with subtitles_complete set.
+    This lets the team video filters use an indexed join rather than
+    running a subquery against the subtitle languages for every video.
+
+    SubtitleLanguage calls update_for_videos() when subtitles_complete
+    changes or a language is deleted.
+    """
+    video = models.ForeignKey(Video, related_name='completed_languages')
+    language_code = models.CharField(max_length=16, db_index=True)
+
+    class Meta:
+        unique_together = [('video', 'language_code')]
+
+    @classmethod
+    def update_for_videos(cls, video_ids):
+        """Recalculate the completed languages for a list of videos
+
+        This also updates Video.completed_languages_count.
+        """
+        from subtitles.models import SubtitleLanguage
+
+        video_ids = list(video_ids)
+        if not video_ids:
+            return
+        completed = defaultdict(set)
+        for video_id, language_code in (SubtitleLanguage.objects
+                                        .filter(video__in=video_ids,
+                                                subtitles_complete=True)
+                                        .values_list('video_id',
+                                                     'language_code')):
+            completed[video_id].add(language_code)
+        current = defaultdict(set)
+        for video_id, language_code in (cls.objects
+                                        .filter(video__in=video_ids)
+                                        .values_list('video_id',
+                                                     'language_code')):
+            current[video_id].add(language_code)
+
+        to_create = []
+        by_count = defaultdict(list)
+        for video_id in video_ids:
+            if completed[video_id] == current[video_id]:
+                continue
+            removed = current[video_id] - completed[video_id]
+            if removed:
+                cls.objects.filter(video=video_id,
+                                   language_code__in=removed).delete()
+            to_create.extend(
+                cls(video_id=video_id, language_code=language_code)
+                for language_code in completed[video_id] - current[video_id])
+            by_count[len(completed[video_id])].append(video_id)
+        cls._create_rows(to_create)
+        for count, pks in by_count.items():
+            Video.objects.filter(pk__in=pks).update(
+                completed_languages_count=count)
+
+    @classmethod
+    def _create_rows(cls, rows):
+        if not rows:
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.bulk_create(rows)
+        except IntegrityError:
+            # Another process added some of the rows at the same time.  Fall
+            # back to adding them one-by-one.
+            for row in rows:
+                cls.objects.get_or_create(video_id=row.video_id,
+                                          language_code=row.language_code)
+
+class VideoIndexQueue(models.Model):
+    """Videos that need their VideoIndex updated
+
+    Rather than re-indexing a video each time it changes, we mark it here
+    and a periodic task indexes the marked videos in batches.  Marking a
+    video that's already queued just updates last_queued, so a burst of
+    changes results in a single re-index.
+
+    We wait until a video hasn't been marked for VIDEO_INDEX_QUEUE_DEBOUNCE
+    seconds before indexing it, but never wait longer than
+    VIDEO_INDEX_QUEUE_MAX_DELAY seconds after it was first queued.
+    """
+    video = models.OneToOneField(Video, primary_key=True,
+                                 related_name='index_queue')
+    first_queued = models.DateTimeField()
+    last_queued = models.DateTimeField()
+
+    # cache keys and timeout for our stats
+    STATS_TIMEOUT = 60 * 60 * 24 * 30
+    MARKED_KEY = 'video-index-queue:marked'
+    QUEUED_KEY = 'video-index-queue:queued'
+    INDEXED_KEY = 'video-index-queue:indexed'
+    FAILED_KEY = 'video-index-queue:failed'
+    LOCK_KEY = 'video-index-queue:lock'
+
+    @classmethod
+    def mark(cls, video_id):
+        """Mark a video as needing to be re-indexed."""
+        now = dates.now()
+        _incr_stat(cls.MARKED_KEY)
+        if cls.objects.filter(video_id=video_id).update(last_queued=now):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(video_id=video_id, first_queued=now,
+                                   last_queued=now)
+        except IntegrityError:
+            # Someone else queued the video at the same time
+            return
+        _incr_stat(cls.QUEUED_KEY)
+
+    @classmethod
+    def process(cls, batch_size=None, max_batches=None):
+        """Index the videos that are ready
+
+        Only one process() call runs at a time.  We hold a cache lock for up
+        to VIDEO_INDEX_QUEUE_LOCK_TIMEOUT seconds and stop starting new
+        batches halfway through that, so the lock doesn't expire while we're
+        still running.  Other calls return 0 right away.
+
+        If a video can't be indexed, we log the error and move it to the back
+        of the queue, so it doesn't block the videos behind it.
+
+        Returns the number of videos indexed
+        """
+        lock_timeout = getattr(settings, 'VIDEO_INDEX_QUEUE_LOCK_TIMEOUT',
+                               300)
+        token = uuid.uuid4().hex
+        if not cache.add(cls.LOCK_KEY, token, lock_timeout):
+            return 0
+        try:
+            return cls._process(batch_size, max_batches,
+                                time.time() + lock_timeout / 2)
+        finally:
+            if cache.get(cls.LOCK_KEY) == token:
+                cache.delete(cls.LOCK_KEY)
+
+    @classmethod
+    def _process(cls, batch_size, max_batches, deadline):
+        if batch_size is None:
+            batch_size = getattr(settings, 'VIDEO_INDEX_QUEUE_BATCH_SIZE', 100)
+        debounce = getattr(settings, 'VIDEO_INDEX_QUEUE_DEBOUNCE', 10)
+        max_delay = getattr(settings, 'VIDEO_INDEX_QUEUE_MAX_DELAY', 60)
+        count = 0
+        batch_count = 0
+        while ((max_batches is None or batch_count < max_batches) and
+               time.time() < deadline):
+            now = dates.now()
+            debounce_cutoff = now - timedelta(seconds=debounce)
+            max_delay_cutoff = now - timedelta(seconds=max_delay)
+            video_ids = list(cls.objects
+                             .filter(Q(last_queued__lte=debounce_cutoff) |
+                                     Q(first_queued__lte=max_delay_cutoff))
+                             .order_by('first_queued')
+                             .values_list('video_id', flat=True)[:batch_size])
+            if not video_ids:
+                break
+            failed = cls._index_batch(video_ids)
+            if failed:
+                # Move the failed videos to the back of the queue
+                cls.objects.filter(video_id__in=failed).update(
+                    first_queued=now, last_queued=now)
+                _incr_stat(cls.FAILED_KEY, len(failed))
+            indexed = [video_id for video_id in video_ids
+                       if video_id not in failed]
+            # Don't delete rows for videos that were marked again while we
+            # were indexing them.
+            cls.objects.filter(video_id__in=indexed,
+                               last_queued__lte=now).delete()
+            _incr_stat(cls.INDEXED_KEY, len(indexed))
+            count += len(indexed)
+            batch_count += 1
+        return count
+
+    @classmethod
+    def _index_batch(cls, video_ids):
+        """Index a batch of videos
+
+        If indexing the whole batch fails, we index the videos one at a time
+        to find the ones that fail.
+
+        Returns the set of video ids that we couldn't index.
+        """
+        try:
+            VideoIndex.index_videos(Video.objects.filter(id__in=video_ids))
+            return set()
+        except StandardError:
+            logger.warn('VideoIndexQueue: error indexing batch, retrying '
+                        'videos one at a time', exc_info=True)
+        failed = set()
+        for video in Video.objects.filter(id__in=video_ids):
+            try:
+                VideoIndex.index_videos([video])
+            except StandardError:
+                logger.error('VideoIndexQueue: error indexing video %s',
+                             video.id, exc_info=True)
+                failed.add(video.id)
+        return failed
+
+    @classmethod
+    def stats(cls):
+        """Get stats on the queue
+
+        Returns a dict with these keys:
+            - marked: number of times videos were marked
+            - queued: number of times videos were added to the queue
+            - indexed: number of videos indexed from the queue
+            - failed: number of times indexing a video failed
+            - coalescing_ratio: marked / queued.  This is the average number
+              of changes handled by each re-index.
+            - depth: number of videos currently in the queue
+        """
+        values = cache.get_many([cls.MARKED_KEY, cls.QUEUED_KEY,
+                                 cls.INDEXED_KEY, cls.FAILED_KEY])
+        marked = values.get(cls.MARKED_KEY, 0)
+        queued = values.get(cls.QUEUED_KEY, 0)
+        return {
+            'marked': marked,
+            'queued': queued,
+            'indexed': values.get(cls.INDEXED_KEY, 0),
+            'failed': values.get(cls.FAILED_KEY, 0),
+            'coalescing_ratio': (float(marked) / queued) if queued else 0.0,
+            'depth': cls.objects.count(),
+        }
+
+def _incr_stat(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        # key doesn't exist yet
+        if not cache.add(key, delta, VideoIndexQueue.STATS_TIMEOUT):
+            cache.incr(key, delta)
+
 # VideoMetadata
 #
 # TODO: remove this this class.  We use this class for a couple things:
@@ -2213,7 +2564,7 @@ class VideoUrl(models.Model):
 
 def video_url_remove_handler(sender, instance, **kwargs):
     print('Invalidating cache')
-    video_cache.invalidate_cache(instance.video.video_id)
+    video_cache.invalidate_cache(instance.video.video_id, instance.video)
 
 
 models.signals.pre_save.connect(create_video_id, sender=Video)
@@ -2228,6 +2579,15 @@ class VideoFeed(models.Model):
     user = models.ForeignKey(User, blank=True, null=True)
     team = models.ForeignKey("teams.Team", blank=True, null=True)
     last_update = models.DateTimeField(null=True)
+    # Feed state from the last update, used to skip unchanged feeds
+    etag = models.CharField(max_length=255, blank=True, default='')
+    last_modified = models.CharField(max_length=255, blank=True, default='')
+    entries_hash = models.CharField(max_length=40, blank=True, default='')
+    last_changed = models.DateTimeField(null=True)
+    # Seconds between updates.  This adapts to how often the feed changes,
+    # see schedule_next_check()
+    poll_interval = models.PositiveIntegerField(default=3600)
+    next_check = models.DateTimeField(null=True, db_index=True)
 
     YOUTUBE_PAGE_SIZE = 25
 
@@ -2241,12 +2601,40 @@ class VideoFeed(models.Model):
     def domain(self):
         return urlparse.urlparse(self.url).netloc
 
-    def update(self):
-        importer = VideoImporter(self.url, self.user, self.team)
-        new_videos = importer.import_videos(
-            import_next=self.last_update is None)
+    def update(self, response=None):
+        """Import new videos from the feed.
 
-        self.last_update = VideoFeed.now()
+        :param response: FeedResponse for the feed if it has already been
+            downloaded (see feed_parser.fetch_feeds()).  If not given, we
+            download the feed here.
+        :returns: list of new videos
+        """
+        if response is None:
+            response = fetch_feed(self.url, self.etag, self.last_modified)
+        now = VideoFeed.now()
+        if response.ok:
+            importer = VideoImporter(self.url, self.user, self.team)
+            new_videos = importer.import_videos(
+                import_next=self.last_update is None,
+                data=response.content,
+                last_entries_hash=self.entries_hash or None)
+            changed = importer.entries_hash != self.entries_hash
+            self.entries_hash = importer.entries_hash or ''
+            self.etag = (response.etag or '')[:255]
+            self.last_modified = (response.last_modified or '')[:255]
+        else:
+            # Either the feed wasn't modified or we couldn't download it
+            new_videos = []
+            changed = False
+        if changed:
+            self.last_changed = now
+        if response.ok or response.not_modified:
+            self.schedule_next_check(changed, now)
+        else:
+            # Don't back off when we can't download the feed, it's probably
+            # only down for a bit.  Keep polling it at the current rate.
+            self.next_check = now + timedelta(seconds=self.poll_interval)
+        self.last_update = now
         self.save()
         # create videos last-to-first so that the latest video is at the top
         # of the list when viewing the imported videos
@@ -2255,6 +2643,23 @@ class VideoFeed(models.Model):
         signals.feed_imported.send(sender=self, new_videos=new_videos)
         return new_videos
 
+    def schedule_next_check(self, changed, now):
+        """Set next_check based on if the feed changed in the last update.
+
+        Feeds that change get checked more often, down to
+        VIDEO_FEED_MIN_POLL_INTERVAL seconds between checks.  Feeds that
+        don't get checked less often, up to VIDEO_FEED_MAX_POLL_INTERVAL.
+        """
+        min_interval = getattr(settings, 'VIDEO_FEED_MIN_POLL_INTERVAL', 3600)
+        max_interval = getattr(settings, 'VIDEO_FEED_MAX_POLL_INTERVAL',
+                               86400)
+        if changed:
+            interval = self.poll_interval // 2
+        else:
+            interval = self.poll_interval * 3 // 2
+        self.poll_interval = max(min_interval, min(max_interval, interval))
+        self.next_check = now + timedelta(seconds=self.poll_interval)
+
 class ImportedVideo(models.Model):
     feed = models.ForeignKey(VideoFeed)
     video = models.OneToOneField(Video)
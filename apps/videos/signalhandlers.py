@@ -20,8 +20,9 @@ from django.dispatch import receiver
 from django.db.models.signals import post_save, post_delete, m2m_changed
 
 from activity.models import ActivityRecord
+from search import backends as search_backends
 from subtitles.models import SubtitleLanguage, SubtitleVersion
-from videos.models import Video, VideoUrl
+from videos.models import Video, VideoUrl, VideoCompletedLanguage
 from videos import signals
 from videos import tasks
 
@@ -35,10 +36,19 @@ def on_video_related_change(sender, instance, **kwargs):
     if instance.video_id is not None:
         Video.cache.invalidate_by_pk(instance.video_id)
 
+@receiver(post_delete, sender=SubtitleLanguage)
+def on_subtitle_language_delete(sender, instance, **kwargs):
+    if instance.__dict__.get('subtitles_complete', True):
+        VideoCompletedLanguage.update_for_videos([instance.video_id])
+
 @receiver(post_save, sender=Video)
 def on_video_change(sender, instance, **kwargs):
     instance.cache.invalidate()
 
+@receiver(post_delete, sender=Video)
+def on_video_delete(sender, instance, **kwargs):
+    search_backends.get_backend().remove_videos([instance.pk])
+
 @receiver(m2m_changed, sender=Video.followers.through)
 def on_video_followers_changed(instance, reverse, **kwargs):
     if not reverse:
@@ -23,15 +23,16 @@ from celery.task import task
 from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.files.base import ContentFile
-from django.db.models import ObjectDoesNotExist
+from django.db.models import ObjectDoesNotExist, Q
 import requests
 
 from babelsubs.storage import diff as diff_subtitles
 from messages.models import Message
 from messages import tasks
 from utils import send_templated_email, DEFAULT_PROTOCOL
+from videos.feed_parser import fetch_feeds
 from videos.models import (VideoFeed, Video, VIDEO_TYPE_YOUTUBE, VideoUrl,
-                           VideoIndex)
+                           VideoIndex, VideoIndexQueue)
 from subtitles.models import (
     SubtitleLanguage, SubtitleVersion
 )
@@ -73,11 +74,31 @@ def save_thumbnail_in_s3(video_id):
 
 @task
 def update_from_feed():
-    qs = VideoFeed.objects.exclude(last_update__gt=datetime.now()-
-                                   timedelta(hours=1))
-    for feed in qs:
-        update_video_feed_with_rate_limit.apply_async(
-            args=(feed.pk,), queue='feeds')
+    now = datetime.now()
+    feed_ids = list(VideoFeed.objects
+                    .filter(Q(next_check__isnull=True) |
+                            Q(next_check__lte=now))
+                    .values_list('id', flat=True))
+    # Push next_check forward so that we don't queue the feeds again while
+    # the tasks are pending.  VideoFeed.update() sets the real value.
+    retry_at = now + timedelta(seconds=getattr(
+        settings, 'VIDEO_FEED_MIN_POLL_INTERVAL', 3600))
+    batch_size = getattr(settings, 'VIDEO_FEED_FETCH_BATCH_SIZE', 20)
+    for i in xrange(0, len(feed_ids), batch_size):
+        batch = feed_ids[i:i+batch_size]
+        VideoFeed.objects.filter(id__in=batch).update(next_check=retry_at)
+        update_video_feeds.apply_async(args=(batch,), queue='feeds')
+
+# Batches have VIDEO_FEED_FETCH_BATCH_SIZE feeds, so this works out to 500
+# feeds/minute with the default settings
+@task(rate_limit='25/m')
+def update_video_feeds(video_feed_ids):
+    feeds = list(VideoFeed.objects.filter(id__in=video_feed_ids))
+    for feed, response in fetch_feeds(feeds):
+        try:
+            feed.update(response)
+        except Exception:
+            celery_logger.exception('Error updating video feed %s', feed.id)
 
 @task
 def update_video_feed(video_feed_id):
@@ -125,8 +146,21 @@ def video_changed_tasks(video_pk, new_version_id=None):
                 "version_pk": new_version_id,
                 "exception": str(e)})
 
-    video = Video.objects.get(pk=video_pk)
-    video.update_search_index()
+    VideoIndexQueue.mark(video_pk)
+
+@task()
+def update_search_index_for_videos(video_pks):
+    """Update the search index for a batch of videos."""
+    VideoIndex.index_videos(Video.objects.filter(pk__in=video_pks))
+
+@task()
+def process_video_index_queue():
+    """Index the videos that have been marked in VideoIndexQueue."""
+    count = VideoIndexQueue.process()
+    stats = VideoIndexQueue.stats()
+    celery_logger.info('process_video_index_queue: indexed %s videos '
+                       '(queue depth: %s, coalescing ratio: %.2f)',
+                       count, stats['depth'], stats['coalescing_ratio'])
 
 @task
 def subtitles_complete_changed(language_pk):
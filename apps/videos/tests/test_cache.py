@@ -18,10 +18,13 @@
 
 from django.test import TestCase
 
+from nose.tools import *
+
 from caching.tests.utils import assert_invalidates_model_cache
 from subtitles import pipeline
 from subtitles.models import SubtitleLanguage
 from utils.factories import *
+from videos.models import Video
 
 class VideoCacheInvalidationTest(TestCase):
     # test a bunch of actions that should invalidate the video cache
@@ -83,3 +86,25 @@ class VideoCacheInvalidationTest(TestCase):
         self.video.followers.add(user)
         with assert_invalidates_model_cache(self.video):
             self.video.followers.remove(user)
+
+class VideoCacheManagerTest(TestCase):
+    def setUp(self):
+        self.team_video = TeamVideoFactory()
+        self.video = self.team_video.video
+        self.other_video = VideoFactory()
+        self.pks = [self.video.pk, self.other_video.pk]
+
+    def test_get_instances(self):
+        # 1 query for the videos and 1 for the team videos
+        with self.assertNumQueries(2):
+            videos = Video.cache.get_instances(self.pks)
+        assert_equal(videos, [self.video, self.other_video])
+        assert_equal(videos[0].get_team_video(), self.team_video)
+        assert_equal(videos[1].get_team_video(), None)
+
+    def test_get_instances_cache_hit(self):
+        Video.cache.get_instances(self.pks)
+        with self.assertNumQueries(0):
+            videos = Video.cache.get_instances(self.pks)
+            assert_equal(videos[0].get_team_video(), self.team_video)
+            assert_equal(videos[1].get_team_video(), None)
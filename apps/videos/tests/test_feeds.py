@@ -27,6 +27,7 @@ import mock
 from utils import test_utils
 from utils.factories import *
 from videos.feed_parser import FeedParser
+from videos.feed_parser.fetcher import FeedResponse
 from videos.models import Video, VideoFeed
 from videos.types.vimeo import VimeoVideoType
 from videos.types.dailymotion import DailymotionVideoType
@@ -40,12 +41,19 @@ class FeedImportTest(TestCase):
             'feedparser._open_resource',
             self.open_resource_mock)
         self.open_resource_patcher.start()
+        self.fetch_feed_patcher = mock.patch(
+            'videos.models.fetch_feed',
+            lambda url, etag, last_modified: FeedResponse(
+                url, status=200, content=self.feed_data))
+        self.fetch_feed_patcher.start()
 
     def tearDown(self):
         self.open_resource_patcher.stop()
+        self.fetch_feed_patcher.stop()
         TestCase.tearDown(self)
 
     def set_feed_data(self, feed_data):
+        self.feed_data = feed_data
         self.open_resource_mock.side_effect = \
                 lambda *args: StringIO(feed_data)
 
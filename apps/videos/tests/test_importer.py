@@ -20,6 +20,7 @@
 import datetime
 
 from django.test import TestCase
+from django.test.utils import override_settings
 from nose.tools import *
 import mock
 
@@ -27,7 +28,8 @@ from utils import test_utils
 from utils.factories import *
 from videos import signals
 from videos.models import Video, VideoUrl, VideoFeed, ImportedVideo
-from videos.feed_parser import importer
+from videos.feed_parser import fetcher, importer
+from videos.feed_parser.fetcher import FeedResponse, fetch_feed
 from videos.types import HtmlFiveVideoType
 
 class VideoImporterTestCase(TestCase):
@@ -62,6 +64,8 @@ class VideoImporterTestCase(TestCase):
         self.feed_parser.feed.entries = [self.entry(name)
                                     for (name, extra) in item_info]
         self.feed_parser.feed.feed = {}
+        self.feed_parser.entries_hash.return_value = 'hash-{0}'.format(
+            ','.join(name for (name, extra) in item_info))
         self.feed_parser.items.return_value = [
             (self.video_type(name), info, self.entry(name))
             for (name, info) in item_info
@@ -72,9 +76,11 @@ class VideoImporterTestCase(TestCase):
             }
         self.mock_feedparser_class.return_value = self.feed_parser
 
-    def run_import_videos(self, import_next=False, team=None):
+    def run_import_videos(self, import_next=False, team=None, **kwargs):
         import_obj = importer.VideoImporter(self.feed_url(), self.user, team)
-        self.import_videos_rv = import_obj.import_videos(import_next)
+        self.import_videos_rv = import_obj.import_videos(import_next,
+                                                         **kwargs)
+        return import_obj
 
     def check_videos(self, *feed_item_names):
         all_videos = list(Video.objects.all())
@@ -159,6 +165,30 @@ class VideoImporterTestCase(TestCase):
             VideoUrl.objects.get(url=self.url('item-4')).video,
         ])
 
+    def test_import_from_data(self):
+        self.setup_feed_items([
+            ('item-1', {}),
+        ])
+        self.run_import_videos(data='<rss />')
+        self.mock_feedparser_class.assert_called_with(self.feed_url(),
+                                                      '<rss />')
+        self.check_videos('item-1')
+
+    def test_skip_unchanged_entries(self):
+        self.setup_feed_items([
+            ('item-1', {}),
+            ('item-2', {}),
+        ])
+        import_obj = self.run_import_videos(last_entries_hash='hash-item-1')
+        self.assertEquals(import_obj.entries_hash, 'hash-item-1,item-2')
+        self.check_videos('item-1', 'item-2')
+        # If the entries hash matches, we shouldn't check the items at all
+        self.feed_parser.items.reset_mock()
+        import_obj = self.run_import_videos(
+            last_entries_hash='hash-item-1,item-2')
+        self.assertEquals(self.import_videos_rv, [])
+        self.assertEquals(self.feed_parser.items.call_count, 0)
+
     def test_import_extra_links_from_youtube(self):
         # test importing extra items from youtube.
         #
@@ -182,7 +212,7 @@ class VideoImporterTestCase(TestCase):
         ]
         links_iter = iter(links)
         urls_parsed = []
-        def make_feed_parser(url):
+        def make_feed_parser(url, data=None):
             urls_parsed.append(url)
             self.setup_feed_items([], links_iter.next())
             return self.feed_parser
@@ -201,12 +231,20 @@ class VideoImporterTestCase(TestCase):
         self.assertEquals(urls_parsed, [self.feed_url()])
 
 class VideoFeedTest(TestCase):
+    @test_utils.patch_for_test('videos.models.fetch_feed')
     @test_utils.patch_for_test('videos.models.VideoImporter')
-    def setUp(self, MockVideoImporter):
+    def setUp(self, MockVideoImporter, mock_fetch_feed):
         self.MockVideoImporter = MockVideoImporter
         self.mock_video_importer = mock.Mock()
         self.mock_video_importer.last_link = None
+        self.mock_video_importer.entries_hash = 'hash-1'
         MockVideoImporter.return_value = self.mock_video_importer
+        self.mock_fetch_feed = mock_fetch_feed
+        self.set_feed_response(status=200, content='feed-data')
+
+    def set_feed_response(self, **kwargs):
+        self.mock_fetch_feed.side_effect = \
+                lambda url, etag, last_modified: FeedResponse(url, **kwargs)
 
     def test_video_feed(self):
         mock_feed_imported_handler = mock.Mock()
@@ -223,7 +261,8 @@ class VideoFeedTest(TestCase):
         self.mock_video_importer.import_videos.return_value = feed_videos
         rv = feed.update()
         self.MockVideoImporter.assert_called_with(url, user, None)
-        self.mock_video_importer.import_videos.assert_called_with(import_next=True)
+        self.mock_video_importer.import_videos.assert_called_with(
+            import_next=True, data='feed-data', last_entries_hash=None)
         self.assertEquals(rv, feed_videos)
         mock_feed_imported_handler.assert_called_with(
             signal=signals.feed_imported, sender=feed, new_videos=feed_videos)
@@ -232,7 +271,8 @@ class VideoFeedTest(TestCase):
         self.mock_video_importer.import_videos.return_value = []
         rv = feed.update()
         self.MockVideoImporter.assert_called_with(url, user, None)
-        self.mock_video_importer.import_videos.assert_called_with(import_next=False)
+        self.mock_video_importer.import_videos.assert_called_with(
+            import_next=False, data='feed-data', last_entries_hash='hash-1')
         self.assertEquals(rv, [])
         mock_feed_imported_handler.assert_called_with(
             signal=signals.feed_imported, sender=feed, new_videos=[])
@@ -275,3 +315,105 @@ class VideoFeedTest(TestCase):
         self.assertEquals(feed.last_update, now)
         self.assertEquals([iv.video for iv in feed.importedvideo_set.all()],
                           videos2 + videos)
+
+    def test_conditional_get(self):
+        feed = VideoFeed.objects.create(url='http://example.com/feed.rss')
+        self.set_feed_response(status=200, content='feed-data', etag='"abc"',
+                               last_modified='Sat, 01 Jan 2000 00:00:00 GMT')
+        self.mock_video_importer.import_videos.return_value = []
+        feed.update()
+        self.mock_fetch_feed.assert_called_with(feed.url, '', '')
+        self.assertEquals(feed.etag, '"abc"')
+        self.assertEquals(feed.last_modified,
+                          'Sat, 01 Jan 2000 00:00:00 GMT')
+        self.assertEquals(feed.entries_hash, 'hash-1')
+        # The next update should send the ETag and Last-Modified values.  If
+        # we get a 304 response, then we shouldn't import anything.
+        self.set_feed_response(status=304)
+        self.MockVideoImporter.reset_mock()
+        self.assertEquals(feed.update(), [])
+        self.mock_fetch_feed.assert_called_with(
+            feed.url, '"abc"', 'Sat, 01 Jan 2000 00:00:00 GMT')
+        self.assertEquals(self.MockVideoImporter.call_count, 0)
+        self.assertEquals(feed.etag, '"abc"')
+
+    @override_settings(VIDEO_FEED_MIN_POLL_INTERVAL=1000,
+                       VIDEO_FEED_MAX_POLL_INTERVAL=4000)
+    @test_utils.patch_for_test('videos.models.VideoFeed.now')
+    def test_poll_interval(self, mock_now):
+        now = datetime.datetime(2000, 1, 1)
+        mock_now.return_value = now
+        feed = VideoFeed.objects.create(url='http://example.com/feed.rss',
+                                        poll_interval=2000)
+        self.mock_video_importer.import_videos.return_value = []
+        # the entries changed, we should check the feed more often
+        feed.update()
+        self.assertEquals(feed.poll_interval, 1000)
+        self.assertEquals(feed.last_changed, now)
+        self.assertEquals(feed.next_check,
+                          now + datetime.timedelta(seconds=1000))
+        # the entries didn't change, we should check the feed less often
+        for interval in (1500, 2250, 3375, 4000, 4000):
+            feed.update()
+            self.assertEquals(feed.poll_interval, interval)
+        self.assertEquals(feed.last_changed, now)
+        # we should treat 304 responses as unchanged feeds
+        feed.poll_interval = 1000
+        self.set_feed_response(status=304)
+        feed.update()
+        self.assertEquals(feed.poll_interval, 1500)
+
+    @override_settings(VIDEO_FEED_MIN_POLL_INTERVAL=1000,
+                       VIDEO_FEED_MAX_POLL_INTERVAL=4000)
+    @test_utils.patch_for_test('videos.models.VideoFeed.now')
+    def test_poll_interval_on_error(self, mock_now):
+        now = datetime.datetime(2000, 1, 1)
+        mock_now.return_value = now
+        feed = VideoFeed.objects.create(url='http://example.com/feed.rss',
+                                        poll_interval=2000)
+        # errors shouldn't make us check the feed less often
+        for kwargs in [{'error': ValueError()}, {'status': 500}]:
+            self.set_feed_response(**kwargs)
+            feed.update()
+            self.assertEquals(feed.poll_interval, 2000)
+            self.assertEquals(feed.next_check,
+                              now + datetime.timedelta(seconds=2000))
+            self.assertEquals(feed.last_update, now)
+
+class FetchFeedTest(TestCase):
+    @test_utils.patch_for_test('requests.get')
+    def test_fetch_feed(self, mock_get):
+        mock_get.return_value.status_code = 200
+        mock_get.return_value.content = 'feed-data'
+        mock_get.return_value.headers = {
+            'etag': '"abc"',
+            'last-modified': 'Sat, 01 Jan 2000 00:00:00 GMT',
+        }
+        response = fetch_feed('http://example.com/feed.rss')
+        self.assertEquals(mock_get.call_args[1]['headers'], {})
+        self.assertTrue(response.ok)
+        self.assertEquals(response.content, 'feed-data')
+        self.assertEquals(response.etag, '"abc"')
+        self.assertEquals(response.last_modified,
+                          'Sat, 01 Jan 2000 00:00:00 GMT')
+
+        mock_get.return_value.status_code = 304
+        mock_get.return_value.content = ''
+        response = fetch_feed('http://example.com/feed.rss', '"abc"',
+                              'Sat, 01 Jan 2000 00:00:00 GMT')
+        self.assertEquals(mock_get.call_args[1]['headers'], {
+            'If-None-Match': '"abc"',
+            'If-Modified-Since': 'Sat, 01 Jan 2000 00:00:00 GMT',
+        })
+        self.assertTrue(response.not_modified)
+        self.assertFalse(response.ok)
+
+    @test_utils.patch_for_test('videos.feed_parser.fetcher.fetch_feed')
+    def test_fetch_feeds(self, mock_fetch_feed):
+        mock_fetch_feed.side_effect = lambda url, etag, last_modified: url
+        feeds = [
+            VideoFeed.objects.create(url='http://example.com/{0}.rss'.format(i))
+            for i in xrange(5)
+        ]
+        self.assertEquals(fetcher.fetch_feeds(feeds, concurrency=3),
+                          [(feed, feed.url) for feed in feeds])
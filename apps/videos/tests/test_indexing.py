@@ -18,13 +18,22 @@
 
 from contextlib import contextmanager
 from datetime import datetime, timedelta
+import os
+import shutil
+import tempfile
+
+from django.core.cache import cache
 from django.test import TestCase
+from django.test.utils import override_settings
 from nose.tools import *
+import mock
 
+from utils import dates
 from utils.test_utils import *
 from utils.factories import *
+from search.backends import InvertedIndexBackend
 from subtitles import pipeline
-from videos.models import VideoIndex
+from videos.models import Video, VideoIndex, VideoIndexQueue
 
 class VideoIndexingTest(TestCase):
     @patch_for_test('videos.models.VideoIndex.calc_text')
@@ -86,6 +95,239 @@ class VideoIndexingTest(TestCase):
         index_text = VideoIndex.calc_text(video, max_length=100)
         assert_equal(len(index_text), 100)
 
+    def make_video_with_subtitles(self, title):
+        video = VideoFactory(title=title)
+        VideoURLFactory(video=video)
+        pipeline.add_subtitles(
+            video, 'en', SubtitleSetFactory(),
+            title=title + '_en', metadata={'speaker-name': 'en_speaker'},
+            visibility='public')
+        pipeline.add_subtitles(
+            video, 'fr', SubtitleSetFactory(),
+            title=title + '_fr', visibility='private')
+        return video
+
+    def test_index_videos(self):
+        videos = [self.make_video_with_subtitles('video_%s' % i)
+                  for i in range(3)]
+        assert_equal(VideoIndex.index_videos(videos), 3)
+        for video in videos:
+            index = VideoIndex.objects.get(video=video)
+            assert_equal(index.text, VideoIndex.calc_text(video))
+            assert_equal(index.text_hash, VideoIndex.hash_text(index.text))
+
+    def test_index_videos_skips_unchanged(self):
+        videos = [self.make_video_with_subtitles('video_%s' % i)
+                  for i in range(3)]
+        VideoIndex.index_videos(videos)
+        assert_equal(VideoIndex.index_videos(videos), 0)
+        videos[1].title = 'new title'
+        videos[1].save()
+        assert_equal(VideoIndex.index_videos(videos), 1)
+        assert_equal(VideoIndex.objects.get(video=videos[1]).text,
+                     VideoIndex.calc_text(videos[1]))
+        assert_equal(VideoIndex.objects.count(), 3)
+
     # FIXME we should have searching tests, but we can't since we use sqlite
     # databases for our unittests and it has a different matching syntax then
     # MySQL
+
+class VideoIndexQueueTest(TestCase):
+    def setUp(self):
+        cache.delete_many([VideoIndexQueue.MARKED_KEY,
+                           VideoIndexQueue.QUEUED_KEY,
+                           VideoIndexQueue.INDEXED_KEY])
+        self.video = VideoFactory()
+        self.start = datetime(2015, 1, 1)
+
+    @contextmanager
+    def at(self, seconds):
+        with mock.patch.object(dates, 'now') as mock_now:
+            mock_now.return_value = self.start + timedelta(seconds=seconds)
+            yield
+
+    def test_mark_coalesces(self):
+        with self.at(0):
+            VideoIndexQueue.mark(self.video.pk)
+        with self.at(5):
+            VideoIndexQueue.mark(self.video.pk)
+        queued = VideoIndexQueue.objects.get(video=self.video)
+        assert_equal(queued.first_queued, self.start)
+        assert_equal(queued.last_queued, self.start + timedelta(seconds=5))
+        stats = VideoIndexQueue.stats()
+        assert_equal(stats['marked'], 2)
+        assert_equal(stats['queued'], 1)
+        assert_equal(stats['coalescing_ratio'], 2.0)
+        assert_equal(stats['depth'], 1)
+
+    @override_settings(VIDEO_INDEX_QUEUE_DEBOUNCE=10,
+                       VIDEO_INDEX_QUEUE_MAX_DELAY=60)
+    def test_debounce(self):
+        with self.at(0):
+            VideoIndexQueue.mark(self.video.pk)
+        with self.at(5):
+            assert_equal(VideoIndexQueue.process(), 0)
+        with self.at(10):
+            assert_equal(VideoIndexQueue.process(), 1)
+        assert_false(VideoIndexQueue.objects.exists())
+        assert_equal(VideoIndex.objects.get(video=self.video).text,
+                     VideoIndex.calc_text(self.video))
+        assert_equal(VideoIndexQueue.stats()['indexed'], 1)
+
+    @override_settings(VIDEO_INDEX_QUEUE_DEBOUNCE=10,
+                       VIDEO_INDEX_QUEUE_MAX_DELAY=60)
+    def test_max_delay(self):
+        # keep changing the video every 5 seconds.  We should still index it
+        # once it's been in the queue for VIDEO_INDEX_QUEUE_MAX_DELAY seconds
+        for seconds in range(0, 60, 5):
+            with self.at(seconds):
+                VideoIndexQueue.mark(self.video.pk)
+                assert_equal(VideoIndexQueue.process(), 0)
+        with self.at(60):
+            VideoIndexQueue.mark(self.video.pk)
+            assert_equal(VideoIndexQueue.process(), 1)
+
+    def test_only_one_process_at_once(self):
+        with self.at(0):
+            VideoIndexQueue.mark(self.video.pk)
+        # simulate another process() call that's still running
+        cache.set(VideoIndexQueue.LOCK_KEY, 'other-token', 60)
+        with self.at(100):
+            assert_equal(VideoIndexQueue.process(), 0)
+        assert_true(VideoIndexQueue.objects.filter(video=self.video).exists())
+        # once the lock is released, we should process the queue again
+        cache.delete(VideoIndexQueue.LOCK_KEY)
+        with self.at(100):
+            assert_equal(VideoIndexQueue.process(), 1)
+        assert_equal(cache.get(VideoIndexQueue.LOCK_KEY), None)
+
+    def test_failing_video_doesnt_block_queue(self):
+        bad_video = VideoFactory()
+        VideoIndexQueue.objects.all().delete()
+        VideoIndex.objects.all().delete()
+        with self.at(0):
+            VideoIndexQueue.mark(bad_video.pk)
+        with self.at(1):
+            VideoIndexQueue.mark(self.video.pk)
+        real_calc_text = VideoIndex._calc_text
+        def calc_text(video, *args, **kwargs):
+            if video.id == bad_video.id:
+                raise ValueError()
+            return real_calc_text(video, *args, **kwargs)
+        with mock.patch.object(VideoIndex, '_calc_text',
+                               staticmethod(calc_text)):
+            with self.at(100):
+                assert_equal(VideoIndexQueue.process(batch_size=1), 1)
+        assert_true(VideoIndex.objects.filter(video=self.video).exists())
+        # The failed video should be moved to the back of the queue
+        queued = VideoIndexQueue.objects.get()
+        assert_equal(queued.video_id, bad_video.id)
+        assert_equal(queued.first_queued,
+                     self.start + timedelta(seconds=100))
+        assert_equal(VideoIndexQueue.stats()['failed'], 1)
+
+class InvertedIndexBackendTest(TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.backend = InvertedIndexBackend(
+            os.path.join(self.tempdir, 'index.sqlite'))
+        self.backend.index_texts([
+            (1, u'go to the zoo'),
+            (2, u'a b c'),
+            (3, u'go go go'),
+            (4, u'Zoolog\xeda en Espa\xf1ol'),
+        ])
+
+    def test_ranking(self):
+        assert_equal(self.backend.search(u'go'), [3, 1])
+
+    def test_short_terms(self):
+        assert_equal(self.backend.search(u'a'), [2])
+        assert_equal(self.backend.search(u'to'), [1])
+
+    def test_all_terms_must_match(self):
+        assert_equal(self.backend.search(u'go zoo'), [1])
+        assert_equal(self.backend.search(u'go b'), [])
+
+    def test_prefix_search(self):
+        assert_equal(set(self.backend.search(u'zo*')), set([1, 4]))
+        assert_equal(self.backend.search(u'espa*'), [4])
+
+    def test_case_insensitive(self):
+        assert_equal(self.backend.search(u'ESPA\xd1OL'), [4])
+
+    def test_empty_query(self):
+        assert_equal(self.backend.search(u''), [])
+        assert_equal(self.backend.search(u'"  "'), [])
+
+    def test_reindex(self):
+        self.backend.index_texts([(3, u'nothing')])
+        assert_equal(self.backend.search(u'go'), [1])
+        assert_equal(self.backend.search(u'nothing'), [3])
+
+    def test_remove(self):
+        self.backend.remove_videos([1])
+        assert_equal(self.backend.search(u'go'), [3])
+
+    def test_clear(self):
+        self.backend.clear()
+        assert_equal(self.backend.search(u'go'), [])
+
+    def test_queryset_search(self):
+        video = VideoFactory(title=u'Go to the zoo')
+        other_video = VideoFactory(title=u'Go home')
+        VideoFactory(title=u'Something else')
+        VideoIndex.objects.all().delete()
+        with mock.patch('search.backends.get_backend') as get_backend:
+            get_backend.return_value = self.backend
+            VideoIndex.index_videos([video, other_video])
+            qs = Video.objects.filter(id__in=[video.id]).search(u'go')
+            assert_equal(list(qs), [video])
+
+    def test_queryset_search_ordered_by_rank(self):
+        videos = [
+            VideoFactory(title=u'go somewhere'),
+            VideoFactory(title=u'go go go'),
+            VideoFactory(title=u'go go'),
+        ]
+        VideoIndex.objects.all().delete()
+        with mock.patch('search.backends.get_backend') as get_backend:
+            get_backend.return_value = self.backend
+            self.backend.clear()
+            VideoIndex.index_videos(videos)
+            assert_equal(list(Video.objects.search(u'go')),
+                         [videos[1], videos[2], videos[0]])
+            with override_settings(SEARCH_MAX_RESULTS=2):
+                assert_equal(list(Video.objects.search(u'go')),
+                             [videos[1], videos[2]])
+
+    def test_filtered_search_below_cap(self):
+        # If the only match in a filtered queryset ranks below
+        # SEARCH_MAX_RESULTS, we should still find it
+        videos = [
+            VideoFactory(title=u'go go go'),
+            VideoFactory(title=u'go go'),
+            VideoFactory(title=u'go somewhere'),
+        ]
+        team = TeamFactory()
+        TeamVideoFactory(team=team, video=videos[2])
+        VideoIndex.objects.all().delete()
+        with mock.patch('search.backends.get_backend') as get_backend:
+            get_backend.return_value = self.backend
+            self.backend.clear()
+            VideoIndex.index_videos(videos)
+            with override_settings(SEARCH_MAX_RESULTS=1):
+                qs = Video.objects.filter(teamvideo__team=team)
+                assert_equal(list(qs.search(u'go')), [videos[2]])
+
+    def test_remove_deleted_video(self):
+        video = VideoFactory(title=u'go to the zoo')
+        VideoIndex.objects.all().delete()
+        with mock.patch('search.backends.get_backend') as get_backend:
+            get_backend.return_value = self.backend
+            self.backend.clear()
+            VideoIndex.index_videos([video])
+            assert_equal(self.backend.search(u'zoo'), [video.id])
+            video.delete()
+        assert_equal(self.backend.search(u'zoo'), [])
@@ -17,6 +17,7 @@
 # along with this program. If not, see
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+import datetime
 import functools
 
 from django.db import IntegrityError
@@ -28,8 +29,9 @@ import mock
 from auth.models import CustomUser as User
 from subtitles import pipeline
 from subtitles.models import SubtitleLanguage
-from videos import signals
-from videos.models import Video, VideoUrl, VideoTypeUrlPattern
+from videos import metadata_manager, signals
+from videos.models import (Video, VideoUrl, VideoTypeUrlPattern,
+                           VideoCompletedLanguage)
 from videos.tasks import video_changed_tasks
 from videos.tests.data import (
     get_video, make_subtitle_language, make_subtitle_version, make_rollback_to
@@ -126,6 +128,68 @@ class TestVideo(TestCase):
         make_rollback_to(sl_en, 1)
         _assert_title("New Title")
 
+class TestWidgetVideoCache(TestCase):
+    def setUp(self):
+        test_utils.invalidate_widget_video_cache.run_original_for_test()
+        self.video = VideoFactory()
+        video_cache.invalidation_stats.reset()
+
+    def test_invalidate(self):
+        video_id = self.video.video_id
+        assert_equal(len(video_cache.get_video_urls(video_id)), 1)
+        VideoURLFactory(video=self.video)
+        # we haven't invalidated yet, so we should get the cached value
+        assert_equal(len(video_cache.get_video_urls(video_id)), 1)
+        video_cache.invalidate_cache(video_id)
+        assert_equal(len(video_cache.get_video_urls(video_id)), 2)
+
+    def test_invalidate_video_id_key(self):
+        url = self.video.get_video_url()
+        assert_equal(video_cache.get_video_id(url), self.video.video_id)
+        with mock.patch('widget.video_cache.cache') as mock_cache:
+            video_cache.invalidate_cache(self.video.video_id, self.video)
+        mock_cache.delete_many.assert_called_once_with(
+            [video_cache._video_id_key(url)])
+
+    def test_round_trips(self):
+        # invalidation should take 1 write to change the namespace and 1
+        # delete_many() call for the keys outside it
+        video_cache.invalidate_cache(self.video.video_id, self.video)
+        video_cache.invalidate_cache(self.video.video_id)
+        assert_equal(video_cache.invalidation_stats.invalidations, 2)
+        assert_equal(video_cache.invalidation_stats.round_trips, 4)
+        assert_equal(
+            video_cache.invalidation_stats.round_trips_per_invalidation(),
+            2.0)
+
+    def test_team_namespace(self):
+        team_video = TeamVideoFactory(video=self.video)
+        team = team_video.team
+        video_id = self.video.video_id
+        assert_equal(video_cache.get_visibility_policies(video_id),
+                     {'is_public': team.is_visible, 'team_id': team.id})
+        team.is_visible = not team.is_visible
+        team.save()
+        video_cache.invalidate_team_namespace(team.id)
+        assert_equal(video_cache.get_visibility_policies(video_id),
+                     {'is_public': team.is_visible, 'team_id': team.id})
+
+    def test_invalidate_team_cache(self):
+        team = TeamFactory()
+        team_videos = [TeamVideoFactory(team=team) for i in range(2)]
+        with mock.patch('widget.video_cache.TEAM_INVALIDATION_CHUNK_SIZE', 1):
+            with mock.patch('widget.video_cache.cache') as mock_cache:
+                video_cache.invalidate_team_cache(team.id)
+        # We should delete the non-namespaced keys for each team video in a
+        # separate chunk
+        assert_equal(mock_cache.delete_many.call_args_list, [
+            mock.call([
+                video_cache._video_completed_languages(tv.id),
+                video_cache._video_id_key(tv.video.get_video_url()),
+            ])
+            for tv in team_videos
+        ])
+
 class TestChangedSignals(TestCase):
     def test_title_changed_signal(self):
         video = VideoFactory(title='old_title')
@@ -278,6 +342,120 @@ class TestModelsSaving(TestCase):
         video = _refresh(video)
         self.assertIsNotNone(video.complete_date)
 
+class UpdateMetadataTest(TestCase):
+    def setUp(self):
+        self.video = VideoFactory(primary_audio_language_code='en')
+        pipeline.add_subtitles(self.video, 'en', [(0, 1000, 'sub')],
+                               complete=True)
+        Video.objects.filter(pk=self.video.pk).update(
+            is_subtitled=False, was_subtitled=False, languages_count=0,
+            complete_date=None)
+        metadata_manager.metadata_stats.reset()
+
+    def test_update(self):
+        with mock.patch('videos.models.Video.save') as mock_save:
+            metadata_manager.update_metadata(self.video.pk)
+        assert_equal(mock_save.call_count, 0)
+        video = test_utils.reload_obj(self.video)
+        assert_true(video.is_subtitled)
+        assert_true(video.was_subtitled)
+        assert_equal(video.languages_count, 1)
+        assert_not_equal(video.complete_date, None)
+
+    def test_stats(self):
+        metadata_manager.update_metadata(self.video.pk)
+        # The old code would have saved the video 5 times.  The first time
+        # through, is_subtitled and complete_date change.
+        assert_equal(metadata_manager.metadata_stats.writes, 1)
+        assert_equal(metadata_manager.metadata_stats.writes_saved, 4)
+        # The second time through, they don't
+        metadata_manager.update_metadata(self.video.pk)
+        assert_equal(metadata_manager.metadata_stats.updates, 2)
+        assert_equal(metadata_manager.metadata_stats.writes, 2)
+        assert_equal(metadata_manager.metadata_stats.writes_saved, 6)
+
+    def test_only_changed_fields(self):
+        metadata_manager.update_metadata(self.video.pk)
+        with mock.patch('django.db.models.query.QuerySet.update') as \
+                mock_update:
+            metadata_manager.update_metadata(self.video.pk)
+        # only edited should be updated
+        assert_equal(mock_update.call_args[1].keys(), ['edited'])
+
+    def test_invalidates_cached_video(self):
+        # load the video into the cache with the stale values
+        Video.cache.invalidate_by_pk(self.video.pk)
+        cached = Video.cache.get_instance(self.video.pk)
+        assert_false(cached.is_subtitled)
+        metadata_manager.update_metadata(self.video.pk)
+        cached = Video.cache.get_instance(self.video.pk)
+        assert_true(cached.is_subtitled)
+        assert_true(cached.was_subtitled)
+        assert_equal(cached.languages_count, 1)
+        assert_not_equal(cached.complete_date, None)
+
+class UpdateMetadataForVideosTest(TestCase):
+    def setUp(self):
+        team = TeamFactory(is_visible=False)
+        self.videos = [
+            VideoFactory(primary_audio_language_code='en'),
+            VideoFactory(primary_audio_language_code='en'),
+            VideoFactory(primary_audio_language_code='fr'),
+            VideoFactory(),
+        ]
+        TeamVideoFactory(team=team, video=self.videos[0])
+        pipeline.add_subtitles(self.videos[0], 'en', [(0, 1000, 'sub')],
+                               complete=True)
+        pipeline.add_subtitles(self.videos[0], 'de', [(0, 1000, 'sub')])
+        pipeline.add_subtitles(self.videos[1], 'en', [(0, None, 'sub')],
+                               complete=True)
+        pipeline.add_subtitles(self.videos[2], 'en', [(0, 1000, 'sub')])
+
+    def reset_fields(self):
+        Video.objects.update(is_public=True, is_subtitled=False,
+                             was_subtitled=False, languages_count=10,
+                             complete_date=None)
+
+    def get_fields(self):
+        return [
+            (v.is_public, v.is_subtitled, v.was_subtitled, v.languages_count,
+             v.complete_date is not None)
+            for v in Video.objects.filter(pk__in=[v.pk for v in self.videos])
+            .order_by('pk')
+        ]
+
+    def test_matches_update_metadata(self):
+        self.reset_fields()
+        for video in self.videos:
+            metadata_manager.update_metadata(video.pk)
+        correct_fields = self.get_fields()
+        self.reset_fields()
+        metadata_manager.update_metadata_for_videos(
+            [v.pk for v in self.videos])
+        assert_equal(self.get_fields(), correct_fields)
+
+    def test_clear_fields(self):
+        Video.objects.update(is_subtitled=True,
+                             complete_date=datetime.datetime.now())
+        metadata_manager.update_metadata_for_videos(
+            [v.pk for v in self.videos])
+        assert_equal([f[1] for f in self.get_fields()],
+                     [True, True, False, False])
+        assert_equal([f[4] for f in self.get_fields()],
+                     [True, False, False, False])
+
+    def test_invalidates_cached_videos(self):
+        # load the videos into the cache with is_public=True
+        Video.objects.update(is_public=True)
+        for video in self.videos:
+            Video.cache.invalidate_by_pk(video.pk)
+            assert_true(Video.cache.get_instance(video.pk).is_public)
+        metadata_manager.update_metadata_for_videos(
+            [v.pk for v in self.videos])
+        assert_equal([Video.cache.get_instance(v.pk).is_public
+                      for v in self.videos],
+                     [False, True, True, True])
+
 class TestSubtitleLanguageCaching(TestCase):
     def setUp(self):
         self.videos, self.langs, self.versions = bulk_subs({
@@ -432,6 +610,79 @@ class TestSelectHasPublicVersion(TestCase):
             assert_true(videos[0].has_public_version())
             assert_false(videos[1].has_public_version())
 
+class CompletedLanguagesTest(TestCase):
+    def setUp(self):
+        self.video = VideoFactory()
+        self.other_video = VideoFactory()
+
+    def add_language(self, video, language_code, complete):
+        return SubtitleLanguageFactory(video=video,
+                                       language_code=language_code,
+                                       subtitles_complete=complete)
+
+    def check_completed_languages(self, video, correct_codes):
+        codes = (VideoCompletedLanguage.objects.filter(video=video)
+                 .values_list('language_code', flat=True))
+        assert_equal(set(codes), set(correct_codes))
+        assert_equal(test_utils.reload_obj(video).completed_languages_count,
+                     len(correct_codes))
+
+    def test_maintained_on_save(self):
+        self.add_language(self.video, 'en', True)
+        fr = self.add_language(self.video, 'fr', False)
+        self.check_completed_languages(self.video, ['en'])
+        fr.subtitles_complete = True
+        fr.save()
+        self.check_completed_languages(self.video, ['en', 'fr'])
+        fr.subtitles_complete = False
+        fr.save()
+        self.check_completed_languages(self.video, ['en'])
+
+    def test_maintained_on_delete(self):
+        en = self.add_language(self.video, 'en', True)
+        self.add_language(self.video, 'fr', True)
+        en.delete()
+        self.check_completed_languages(self.video, ['fr'])
+
+    def test_update_for_videos(self):
+        self.add_language(self.video, 'en', True)
+        self.add_language(self.other_video, 'fr', True)
+        self.add_language(self.video, 'de', False)
+        # QuerySet.update() bypasses save(), so the summary is out of sync
+        SubtitleLanguage.objects.filter(language_code='en').update(
+            subtitles_complete=False)
+        SubtitleLanguage.objects.filter(language_code='de').update(
+            subtitles_complete=True)
+        VideoCompletedLanguage.update_for_videos([self.video.pk,
+                                                  self.other_video.pk])
+        self.check_completed_languages(self.video, ['de'])
+        self.check_completed_languages(self.other_video, ['fr'])
+
+    def test_filters(self):
+        self.add_language(self.video, 'en', True)
+        self.add_language(self.video, 'fr', False)
+        self.add_language(self.other_video, 'fr', True)
+        third_video = VideoFactory()
+        def check(qs, correct_videos):
+            assert_equal(set(qs), set(correct_videos))
+        check(Video.objects.all().has_completed_language('en'), [self.video])
+        check(Video.objects.all().has_completed_language('fr'),
+              [self.other_video])
+        check(Video.objects.all().missing_completed_language('en'),
+              [self.other_video, third_video])
+        check(Video.objects.all().any_completed_languages(),
+              [self.video, self.other_video])
+        check(Video.objects.all().no_completed_languages(), [third_video])
+
+    def test_sort(self):
+        self.add_language(self.video, 'en', True)
+        self.add_language(self.other_video, 'en', True)
+        self.add_language(self.other_video, 'fr', True)
+        videos = list(Video.objects.all().add_num_completed_languages()
+                      .order_by('-completed_languages_count'))
+        assert_equal(videos, [self.other_video, self.video])
+        assert_equal(videos[0].num_completed_languages, 2)
+
 class TestGetMergedDFXP(TestCase):
     def test_get_merged_dfxp(self):
         video = VideoFactory(primary_audio_language_code='en')
@@ -21,6 +21,7 @@ import datetime
 import unittest
 
 from django.test import TestCase
+from django.test.utils import override_settings
 
 from babelsubs.storage import SubtitleLine, SubtitleSet
 
@@ -28,6 +29,7 @@ from auth.models import CustomUser as User
 from teams.models import Team, TeamVideo
 from subtitles import pipeline
 from subtitles.models import SubtitleLanguage, SubtitleVersion
+from videos.management.commands.benchmark_video_type_dispatch import URL_CORPUS
 from videos.models import Video, VIDEO_TYPE_BRIGHTCOVE
 from videos.types import video_type_registrar, VideoTypeError
 from videos.types.base import VideoType, VideoTypeRegistrar
@@ -232,6 +234,101 @@ class VideoTypeRegistrarTest(TestCase):
         self.assertRaises(VideoTypeError, video_type_registrar.video_type_for_url,
                           'http://youtube.com/v=100500')
 
+    def make_registrar(self, dynamic=True):
+        registrar = VideoTypeRegistrar()
+        self.calls = []
+        test = self
+
+        class KeywordVideoType(VideoType):
+            abbreviation = 'kw'
+            url_keywords = ('example.com',)
+
+            @classmethod
+            def matches_video_url(cls, url):
+                test.calls.append((cls.abbreviation, url))
+                return '/video/' in url
+
+        class ExtensionVideoType(VideoType):
+            abbreviation = 'ext'
+            url_extensions = ('ogv',)
+
+            @classmethod
+            def matches_video_url(cls, url):
+                test.calls.append((cls.abbreviation, url))
+                return cls.url_extension(url) == 'ogv'
+
+        class DynamicVideoType(VideoType):
+            abbreviation = 'dyn'
+            url_match_cacheable = False
+
+            @classmethod
+            def matches_video_url(cls, url):
+                test.calls.append((cls.abbreviation, url))
+                return 'dynamic' in url
+
+        registrar.register(KeywordVideoType)
+        registrar.register(ExtensionVideoType)
+        if dynamic:
+            registrar.register(DynamicVideoType)
+        return registrar
+
+    def test_dispatch_index_matches_scan(self):
+        registrar = video_type_registrar
+        for url in URL_CORPUS:
+            self.assertEquals(
+                registrar._find_video_type(url, registrar.type_list)[0],
+                registrar._find_video_type(url,
+                                           registrar._candidates(url))[0],
+                url)
+
+    def test_candidates(self):
+        registrar = self.make_registrar()
+        self.assertEquals([t.abbreviation for t in registrar._candidates(
+            'http://example.com/video/1.ogv')], ['kw', 'ext', 'dyn'])
+        self.assertEquals([t.abbreviation for t in registrar._candidates(
+            'http://other.com/1.ogv')], ['ext', 'dyn'])
+        self.assertEquals([t.abbreviation for t in registrar._candidates(
+            'http://other.com/1')], ['dyn'])
+
+    def test_memo(self):
+        registrar = self.make_registrar(dynamic=False)
+        url = 'http://example.com/video/1'
+        self.assertEquals(registrar.video_type_class_for_url(url).abbreviation,
+                          'kw')
+        self.assertEquals(len(self.calls), 1)
+        self.assertEquals(registrar.video_type_class_for_url(url).abbreviation,
+                          'kw')
+        self.assertEquals(len(self.calls), 1)
+        # misses are memoized too
+        self.assertEquals(registrar.video_type_class_for_url(
+            'http://example.com/about'), None)
+        registrar.video_type_class_for_url('http://example.com/about')
+        self.assertEquals(len(self.calls), 2)
+
+    def test_uncacheable_types_not_memoized(self):
+        registrar = self.make_registrar()
+        url = 'http://other.com/dynamic'
+        self.assertEquals(registrar.video_type_class_for_url(url).abbreviation,
+                          'dyn')
+        registrar.video_type_class_for_url(url)
+        self.assertEquals(self.calls, [('dyn', url), ('dyn', url)])
+
+    @override_settings(VIDEO_TYPE_URL_MEMO_SIZE=2)
+    def test_memo_size(self):
+        registrar = self.make_registrar()
+        for i in range(3):
+            registrar.video_type_class_for_url(
+                'http://example.com/video/{0}'.format(i))
+        self.assertEquals(registrar._memo.keys(), [
+            'http://example.com/video/1',
+            'http://example.com/video/2',
+        ])
+        # registering a type resets the memo
+        class OtherVideoType(VideoType):
+            abbreviation = 'other'
+        registrar.register(OtherVideoType)
+        self.assertEquals(len(registrar._memo), 0)
+
 class BrightcoveVideoTypeTest(TestCase):
     player_id = '1234'
     video_id = '5678'
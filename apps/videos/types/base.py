@@ -16,7 +16,10 @@
 # along with this program.  If not, see 
 # http://www.gnu.org/licenses/agpl-3.0.html.
 
+from collections import OrderedDict
 from urlparse import urlparse
+import re
+import threading
 
 from django.core.exceptions import ValidationError
 import subprocess, sys, uuid, os
@@ -32,6 +35,18 @@ class VideoType(object):
 
     CAN_IMPORT_SUBTITLES = False
 
+    # Hints for VideoTypeRegistrar's dispatch index.  url_keywords lists
+    # literal strings, at least one of which must appear in any URL that
+    # matches_video_url() accepts.  url_extensions lists the extensions
+    # (see url_extension()) that the type accepts.  Types that set neither
+    # are tried for every URL.
+    url_keywords = None
+    url_extensions = None
+    # Set to False if matches_video_url() depends on data that can change
+    # at runtime (for example database rows), so its results can't be
+    # memoized.
+    url_match_cacheable = True
+
     def __init__(self, url):
         self.url = url
 
@@ -151,6 +166,9 @@ class VideoTypeRegistrar(dict):
         super(VideoTypeRegistrar, self).__init__(*args, **kwargs)
         self.choices = []
         self.type_list = []
+        self._index = None
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
         
     def register(self, video_type):
         self[video_type.abbreviation] = video_type
@@ -158,11 +176,106 @@ class VideoTypeRegistrar(dict):
         self.choices.append((video_type.abbreviation, video_type.name))
         domain = getattr(video_type, 'site', None)
         domain and self.domains.append(domain)
-        
+        self._index = None
+        self.clear_memo()
+
+    def clear_memo(self):
+        """Forget the memoized URL -> video type lookups."""
+        with self._memo_lock:
+            self._memo.clear()
+
     def video_type_for_url(self, url):
-        for video_type in self.type_list:
+        video_type = self.video_type_class_for_url(url)
+        if video_type is not None:
+            return video_type(url)
+
+    def video_type_class_for_url(self, url):
+        """Get the VideoType subclass that matches url, or None
+
+        This is like video_type_for_url(), but doesn't construct the
+        VideoType, which for some types makes network requests.
+        """
+        if not isinstance(url, basestring):
+            return self._find_video_type(url, self.type_list)[0]
+        video_type = self._memo_get(url)
+        if video_type is _MISSING:
+            video_type, cacheable = self._find_video_type(
+                url, self._candidates(url))
+            if cacheable:
+                self._memo_set(url, video_type)
+        return video_type
+
+    def _find_video_type(self, url, candidates):
+        cacheable = True
+        for video_type in candidates:
+            if not video_type.url_match_cacheable:
+                cacheable = False
             if video_type.matches_video_url(url):
-                return video_type(url)
+                return video_type, cacheable
+        return None, cacheable
+
+    def _candidates(self, url):
+        """Get the types that could match url, in registration order."""
+        if self._index is None:
+            self._index = _DispatchIndex(self.type_list)
+        return self._index.candidates(url)
+
+    def _memo_get(self, url):
+        with self._memo_lock:
+            try:
+                video_type = self._memo.pop(url)
+            except KeyError:
+                return _MISSING
+            # re-insert to mark the entry as most recently used
+            self._memo[url] = video_type
+            return video_type
+
+    def _memo_set(self, url, video_type):
+        max_size = getattr(settings, 'VIDEO_TYPE_URL_MEMO_SIZE', 10000)
+        if max_size <= 0:
+            return
+        with self._memo_lock:
+            self._memo.pop(url, None)
+            self._memo[url] = video_type
+            while len(self._memo) > max_size:
+                self._memo.popitem(last=False)
+
+_MISSING = object()
+
+class _DispatchIndex(object):
+    """Narrow down the video types that could match a URL
+
+    Each type that declares url_keywords gets a single compiled regex that
+    searches for any of them, types that declare url_extensions are looked
+    up by the URL's extension, and the rest are always candidates.  Since
+    these are necessary conditions for matches_video_url(), checking only
+    the candidates gives the same result as checking every type.
+    """
+    def __init__(self, type_list):
+        self.type_list = list(type_list)
+        self.always = set()
+        self.by_extension = {}
+        self.keyword_regexes = []
+        for video_type in self.type_list:
+            if video_type.url_keywords:
+                regex = re.compile('|'.join(
+                    re.escape(k) for k in video_type.url_keywords))
+                self.keyword_regexes.append((video_type, regex))
+            elif video_type.url_extensions:
+                for ext in video_type.url_extensions:
+                    self.by_extension.setdefault(ext, set()).add(video_type)
+            else:
+                self.always.add(video_type)
+
+    def candidates(self, url):
+        found = set(self.always)
+        if self.by_extension:
+            found.update(self.by_extension.get(VideoType.url_extension(url),
+                                               ()))
+        for video_type, regex in self.keyword_regexes:
+            if regex.search(url):
+                found.add(video_type)
+        return [t for t in self.type_list if t in found]
             
 class VideoTypeError(Exception):
     pass
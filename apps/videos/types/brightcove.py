@@ -39,6 +39,9 @@ class BrightcoveVideoType(VideoType):
 
     abbreviation = 'C'
     name = 'Brightcove'
+    url_keywords = ('brightcove', 'bcove', 'bctid')
+    # matches can come from VideoTypeUrlPattern rows
+    url_match_cacheable = False
     site = 'brightcove.com'
     js_url = "//admin.brightcove.com/js/BrightcoveExperiences_all.js"
 
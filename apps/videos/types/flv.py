@@ -25,6 +25,7 @@ class FLVVideoType(VideoType):
 
     abbreviation = 'L'
     name = 'FLV'
+    url_extensions = ('flv',)
 
     def __init__(self, url):
         self.url = url
@@ -69,6 +69,7 @@ class HtmlFiveVideoType(VideoType):
     name = 'HTML5'
 
     valid_extensions = set(['ogv', 'ogg', 'mp4', 'm4v', 'webm'])
+    url_extensions = valid_extensions
 
     def __init__(self, url):
         self.url = url
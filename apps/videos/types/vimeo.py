@@ -30,6 +30,7 @@ class VimeoVideoType(VideoType):
 
     abbreviation = 'V'
     name = 'Vimeo.com'   
+    url_keywords = ('vimeo',)
     site = 'vimeo.com'
     
     def __init__(self, url):
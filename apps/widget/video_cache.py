@@ -24,6 +24,7 @@ from django.utils.translation import (
     ugettext_lazy as _
 )
 
+from utils import codes
 from videos.types import video_type_registrar
 from videos.types.base import VideoTypeError
 import unilangs
@@ -68,54 +69,162 @@ def associate_extra_url(video_url, video_id):
 
 
 # Invalidation
-def invalidate_cache(video_id):
-    cache.delete(_video_urls_key(video_id))
+#
+# Most of the values we cache for a video are stored under that video's
+# namespace.  The namespace is a random code stored in the cache and included
+# in each key.  Invalidating the cache for a video just means storing a new
+# namespace code, which orphans all the old keys in one write.
+#
+# For team videos, the namespace also includes a code for the team.  This
+# allows us to invalidate the data for all of a team's videos with one write
+# when the team's visibility or moderation settings change.  We store the
+# team id alongside the video's code, so we don't need to look it up in the
+# database for each request.
+#
+# A few keys can't use the namespace because they are looked up without
+# knowing the video id (the video id for a URL and the completed languages for
+# a team video).  We delete those with delete_many() calls.
 
-    try:
-        from videos.models import Video
-        video = Video.objects.get(video_id=video_id)
-        for l in video.newsubtitlelanguage_set.all():
-            cache.delete(_subtitles_dict_key(video_id, l.pk))
-    except Video.DoesNotExist:
-        pass
-
-    for language in settings.ALL_LANGUAGES:
-        cache.delete(_subtitle_language_pk_key(video_id, language[0]))
-
-    cache.delete(_subtitle_language_pk_key(video_id, None))
-    cache.delete(_subtitles_dict_key(video_id, None))
-    cache.delete(_subtitles_count_key(video_id))
-    cache.delete(_video_languages_key(video_id))
-    cache.delete(_video_languages_verbose_key(video_id))
-    cache.delete(_video_is_moderated_key(video_id))
-    cache.delete(_video_visibility_policy_key(video_id))
-    cache.delete(_video_filename_key(video_id))
+# How many team videos to handle at once when deleting the non-namespaced keys
+# for a team
+TEAM_INVALIDATION_CHUNK_SIZE = 1000
 
-    from videos.models import Video
-    try:
-        video = Video.objects.get(video_id=video_id)
-        for url in video.videourl_set.all():
-            cache.delete(_video_id_key(url.url))
+class InvalidationStats(object):
+    """Tracks how many cache round trips invalidate_cache() makes."""
+    def __init__(self):
+        self.invalidations = 0
+        self.round_trips = 0
+
+    def round_trips_per_invalidation(self):
+        if self.invalidations == 0:
+            return 0.0
+        return float(self.round_trips) / self.invalidations
 
+    def reset(self):
+        self.invalidations = self.round_trips = 0
+
+invalidation_stats = InvalidationStats()
+
+def _video_namespace_key(video_id):
+    return 'widget_video_ns_{0}'.format(video_id)
+
+def _team_namespace_key(team_id):
+    return 'widget_team_ns_{0}'.format(team_id)
+
+def _video_namespace(video_id):
+    value = cache.get(_video_namespace_key(video_id))
+    if value is None:
+        value = _new_video_namespace(video_id)
+    code, team_id = value
+    if team_id is None:
+        return code
+    return '{0}-{1}'.format(code, _team_namespace(team_id))
+
+def _new_video_namespace(video_id, video=None):
+    if video is not None:
         team_video = video.get_team_video()
+        team_id = team_video.team_id if team_video else None
+    else:
+        from teams.models import TeamVideo
+        team_ids = (TeamVideo.objects.filter(video__video_id=video_id)
+                    .values_list('team_id', flat=True))
+        team_id = team_ids[0] if team_ids else None
+    value = (codes.make_code(), team_id)
+    cache.set(_video_namespace_key(video_id), value, TIMEOUT)
+    return value
 
-        if team_video:
-            cache.delete(_video_completed_languages(team_video.id))
-    except Video.DoesNotExist:
-        pass
+def _team_namespace(team_id):
+    code = cache.get(_team_namespace_key(team_id))
+    if code is None:
+        code = _new_team_namespace(team_id)
+    return code
+
+def _new_team_namespace(team_id):
+    code = codes.make_code()
+    cache.set(_team_namespace_key(team_id), code, TIMEOUT)
+    return code
+
+def _namespaced_key(video_id, key):
+    return '{0}:{1}'.format(_video_namespace(video_id), key)
+
+def invalidate_cache(video_id, video=None):
+    """Invalidate all cached widget data for a video
+
+    Args:
+        video_id: video_id of the video to invalidate
+        video: Video object for video_id.  If given, we won't need to look it
+            up in the database.
+    """
+    from videos.models import Video
+    if video is None:
+        try:
+            video = Video.objects.get(video_id=video_id)
+        except Video.DoesNotExist:
+            video = None
+    _new_video_namespace(video_id, video)
+    invalidation_stats.invalidations += 1
+    invalidation_stats.round_trips += 1
+    if video is None:
+        return
+
+    keys = [_video_id_key(url.url) for url in video.videourl_set.all()]
+    team_video = video.get_team_video()
+    if team_video:
+        keys.append(_video_completed_languages(team_video.id))
+    if keys:
+        cache.delete_many(keys)
+        invalidation_stats.round_trips += 1
+
+def invalidate_team_namespace(team_id):
+    """Invalidate the namespaced widget data for all of a team's videos
+
+    This only takes a single cache write, but it doesn't touch the keys that
+    are stored outside the namespace.  Use invalidate_team_cache() to handle
+    those as well.
+    """
+    _new_team_namespace(team_id)
+    invalidation_stats.invalidations += 1
+    invalidation_stats.round_trips += 1
+
+def invalidate_team_cache(team_id):
+    """Invalidate all cached widget data for a team's videos
+
+    We invalidate the team namespace, then delete the non-namespaced keys for
+    TEAM_INVALIDATION_CHUNK_SIZE team videos at a time.
+    """
+    from teams.models import TeamVideo
+    from videos.models import VideoUrl
+
+    invalidate_team_namespace(team_id)
+    qs = (TeamVideo.objects.filter(team_id=team_id)
+          .order_by('id').values_list('id', 'video_id'))
+    last_id = 0
+    while True:
+        chunk = list(qs.filter(id__gt=last_id)[:TEAM_INVALIDATION_CHUNK_SIZE])
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+        keys = [_video_completed_languages(row[0]) for row in chunk]
+        urls = (VideoUrl.objects
+                .filter(video_id__in=[row[1] for row in chunk])
+                .values_list('url', flat=True))
+        keys.extend(_video_id_key(url) for url in urls)
+        cache.delete_many(keys)
+        invalidation_stats.round_trips += 1
 
 def invalidate_video_id(video_url):
     cache.delete(_video_id_key(video_url))
 
 def invalidate_video_moderation(video_id):
-    cache.delete(_video_is_moderated_key(video_id))
+    cache.delete(_namespaced_key(video_id, _video_is_moderated_key(video_id)))
 
 def invalidate_video_visibility(video_id):
-    cache.delete(_video_visibility_policy_key(video_id))
+    cache.delete(_namespaced_key(video_id,
+                                 _video_visibility_policy_key(video_id)))
 
 def on_video_url_delete(sender, instance, **kwargs):
     if instance.video and instance.video.video_id:
-        invalidate_cache(instance.video.video_id)
+        invalidate_cache(instance.video.video_id, instance.video)
 
 def _video_id_key(video_url):
     return 'video_id_{0}'.format(hashlib.sha1(video_url).hexdigest())
@@ -158,7 +267,8 @@ def pk_for_default_language(video_id, language_code):
     # the widget sends langauge code as an empty dict
     # don't ask me why
     language_code = language_code or None
-    cache_key = _subtitle_language_pk_key(video_id, language_code)
+    cache_key = _namespaced_key(
+        video_id, _subtitle_language_pk_key(video_id, language_code))
     value = cache.get(cache_key)
 
     if value is None:
@@ -171,7 +281,7 @@ def pk_for_default_language(video_id, language_code):
     return value
 
 def get_video_urls(video_id):
-    cache_key = _video_urls_key(video_id)
+    cache_key = _namespaced_key(video_id, _video_urls_key(video_id))
     video_urls = cache.get(cache_key)
 
     if video_urls is None:
@@ -185,7 +295,8 @@ def get_video_urls(video_id):
 def get_subtitles_dict(video_id, language_pk, version_number, 
                        subtitles_dict_fn, is_remote=False):
 
-    cache_key = _subtitles_dict_key(video_id, language_pk, version_number)
+    cache_key = _namespaced_key(
+        video_id, _subtitles_dict_key(video_id, language_pk, version_number))
     cached_value = cache.get(cache_key)
 
     if cached_value is None:
@@ -216,7 +327,7 @@ def get_subtitles_dict(video_id, language_pk, version_number,
 def get_video_languages(video_id):
     from widget.rpc import language_summary
 
-    cache_key = _video_languages_key(video_id)
+    cache_key = _namespaced_key(video_id, _video_languages_key(video_id))
     value = cache.get(cache_key)
 
     if value is None:
@@ -250,7 +361,8 @@ def get_video_completed_languages(team_video_id):
 def get_video_languages_verbose(video_id, max_items=6):
     # FIXME: we should probably merge a better method with get_video_languages
     # maybe accepting a 'verbose' param?
-    cache_key = _video_languages_verbose_key(video_id)
+    cache_key = _namespaced_key(video_id,
+                                _video_languages_verbose_key(video_id))
     data = cache.get(cache_key)
 
     if data is None:
@@ -284,7 +396,7 @@ def get_video_languages_verbose(video_id, max_items=6):
     return data
 
 def get_is_moderated(video_id):
-    cache_key = _video_is_moderated_key(video_id)
+    cache_key = _namespaced_key(video_id, _video_is_moderated_key(video_id))
     value = cache.get(cache_key)
 
     if value is None:
@@ -296,7 +408,7 @@ def get_is_moderated(video_id):
     return value
 
 def get_download_filename(video_id):
-    cache_key = _video_filename_key(video_id)
+    cache_key = _namespaced_key(video_id, _video_filename_key(video_id))
     value = cache.get(cache_key)
 
     if value is None:
@@ -308,7 +420,8 @@ def get_download_filename(video_id):
     return value
 
 def get_visibility_policies(video_id):
-    cache_key = _video_visibility_policy_key(video_id)
+    cache_key = _namespaced_key(video_id,
+                                _video_visibility_policy_key(video_id))
     value = cache.get(cache_key)
 
     if value is None:
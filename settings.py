@@ -381,6 +381,86 @@ EMAIL_BCC_LIST = []
 
 CACHE_BACKEND = 'locmem://'
 
+# In-process cache for CacheGroups with a cache pattern (see
+# caching.cachegroup).  Set the size to 0 to disable it.
+CACHE_GROUP_LOCAL_CACHE_SIZE = 0
+CACHE_GROUP_LOCAL_CACHE_TIMEOUT = 300
+CACHE_GROUP_LOCAL_CACHE_STALENESS = 5
+# Cache for API key checks (see api.auth).  The local cache is per-process,
+# so keep its timeout short.  Set the size to 0 to disable it.
+API_AUTH_LOCAL_CACHE_SIZE = 1000
+API_AUTH_LOCAL_CACHE_TIMEOUT = 30
+API_AUTH_CACHE_TIMEOUT = 300
+API_AUTH_NEGATIVE_CACHE_TIMEOUT = 60
+# Log a warning if a username gets this many failed API authentications in
+# API_AUTH_FAILURE_WINDOW seconds
+API_AUTH_FAILURE_WINDOW = 60
+API_AUTH_FAILURE_WARNING_COUNT = 100
+# Cache pattern usage tracking (see caching.cachegroup)
+CACHE_PATTERN_SYNC_INTERVAL = 60
+CACHE_PATTERN_DECAY = 0.2
+CACHE_PATTERN_MIN_USAGE = 0.01
+CACHE_PATTERN_MAX_KEYS = 100
+# Timeouts for CacheGroup values.  CACHE_GROUP_TTL_POLICIES maps cache
+# patterns to TTLPolicy arguments, for example:
+#   {'video-page': {'default': 3600, 'overrides': {'teamvideo': 600},
+#                   'jitter': 0.1}}
+CACHE_GROUP_DEFAULT_TTL = None
+CACHE_GROUP_TTL_POLICIES = {}
+# Track CacheGroup value sizes for the cache_size_report command
+CACHE_GROUP_SIZE_STATS = False
+# Compress models stored with CacheGroup.set_model() above this many bytes
+CACHE_MODEL_COMPRESS_THRESHOLD = 1024
+# Number of parsed SubtitleSets to keep in each process (see subtitles.cache)
+PARSED_SUBTITLE_CACHE_SIZE = 200
+# How to compress SubtitleVersion.serialized_subtitles (see utils.compress).
+# Use the recompress_subtitles command to convert existing versions.
+SUBTITLE_STORAGE_METHOD = 'zlib'
+SUBTITLE_STORAGE_LEVEL = 6
+
+# Search index updates are queued in VideoIndexQueue and processed in batches.
+# Wait until a video hasn't changed for VIDEO_INDEX_QUEUE_DEBOUNCE seconds
+# before indexing it, but never longer than VIDEO_INDEX_QUEUE_MAX_DELAY
+# seconds after the first change.
+VIDEO_INDEX_QUEUE_DEBOUNCE = 10
+VIDEO_INDEX_QUEUE_MAX_DELAY = 60
+VIDEO_INDEX_QUEUE_BATCH_SIZE = 100
+# Only one process_video_index_queue task runs at once.  This is how long
+# the lock lasts, each run stops starting new batches after half of it.
+VIDEO_INDEX_QUEUE_LOCK_TIMEOUT = 300
+
+# Backend for video searches (see search.backends).  The default uses the
+# MySQL FULLTEXT index on VideoIndex.  search.backends.InvertedIndexBackend
+# keeps a local index at SEARCH_INDEX_PATH instead; populate it with the
+# rebuild_search_index command.  The index is a sqlite file on the local
+# disk, so with multiple hosts either put it on shared storage or rebuild it
+# on each host.  SEARCH_MAX_RESULTS caps the number of ranked matches that
+# the InvertedIndexBackend returns for a query.
+SEARCH_BACKEND = 'search.backends.MySQLFulltextBackend'
+SEARCH_INDEX_PATH = rel('search-index.sqlite')
+SEARCH_MAX_RESULTS = 1000
+
+# Number of URL -> video type lookups that VideoTypeRegistrar memoizes per
+# process.
+VIDEO_TYPE_URL_MEMO_SIZE = 10000
+
+# Video feeds are checked every VIDEO_FEED_MIN_POLL_INTERVAL to
+# VIDEO_FEED_MAX_POLL_INTERVAL seconds, depending on how often they change.
+# Feeds are downloaded in batches of VIDEO_FEED_FETCH_BATCH_SIZE, with up to
+# VIDEO_FEED_FETCH_CONCURRENCY downloads at once.
+VIDEO_FEED_MIN_POLL_INTERVAL = 3600
+VIDEO_FEED_MAX_POLL_INTERVAL = 86400
+VIDEO_FEED_FETCH_BATCH_SIZE = 20
+VIDEO_FEED_FETCH_CONCURRENCY = 8
+VIDEO_FEED_FETCH_TIMEOUT = 30
+
+# Bulk team video imports (teams.tasks.add_team_videos) are split into tasks
+# that each import TEAM_VIDEO_IMPORT_CHUNK_SIZE rows.  Transcripts are
+# downloaded with up to TEAM_VIDEO_IMPORT_FETCH_CONCURRENCY requests at once.
+TEAM_VIDEO_IMPORT_CHUNK_SIZE = 100
+TEAM_VIDEO_IMPORT_FETCH_CONCURRENCY = 8
+TEAM_VIDEO_IMPORT_TRANSCRIPT_TIMEOUT = 30
+
 #for unisubs.example.com
 RECAPTCHA_PUBLIC = '6LdoScUSAAAAANmmrD7ALuV6Gqncu0iJk7ks7jZ0'
 RECAPTCHA_SECRET = ' 6LdoScUSAAAAALvQj3aI1dRL9mHgh85Ks2xZH1qc'
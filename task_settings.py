@@ -62,7 +62,7 @@ CELERYBEAT_SCHEDULE = {
     },
     'update_feeds': {
         'task': 'videos.tasks.update_from_feed',
-        'schedule': crontab(minute=0),
+        'schedule': crontab(minute='*/15'),
     },
     'import_from_accounts': {
         'task': 'externalsites.tasks.import_videos_from_accounts',
@@ -72,6 +72,10 @@ CELERYBEAT_SCHEDULE = {
         'task': 'externalsites.tasks.retry_failed_sync',
         'schedule': timedelta(seconds=10),
     },
+    'process_video_index_queue': {
+        'task': 'videos.tasks.process_video_index_queue',
+        'schedule': timedelta(seconds=10),
+    },
 }
 
 __all__ = ['CELERYBEAT_SCHEDULE', 'CELERY_QUEUES', 'CELERY_DEFAULT_QUEUE', ]
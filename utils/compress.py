@@ -16,11 +16,30 @@
 # You should have received a copy of the GNU Affero General Public License along
 # with this program.  If not, see http://www.gnu.org/licenses/agpl-3.0.html.
 
-"""Django-ORM-friendly data compression."""
+"""Django-ORM-friendly data compression.
 
-import base64, zlib
+Compressed data is stored as base64 text so that it can go in a TextField.
+Newer data starts with a format tag that says how it was compressed, for
+example ``$z$`` for zlib.  Data without a tag was created by the original
+version of compress(), which used zlib and base64.encodestring().  The tag
+character is not part of the base64 alphabet, so we can always tell the
+formats apart.
+"""
 
-def compress(data):
+import base64, bz2, zlib
+
+# map method names to (tag, compress_func, decompress_func) tuples
+METHODS = {
+    'zlib': ('$z$', zlib.compress, zlib.decompress),
+    'bz2': ('$b$', bz2.compress, bz2.decompress),
+}
+_TAG_LENGTH = 3
+_DECOMPRESS_FUNCS = dict((tag, decompress_func)
+                         for (tag, compress_func, decompress_func)
+                         in METHODS.values())
+LEGACY_FORMAT = 'legacy'
+
+def compress(data, method='zlib', level=6):
     """Compress a bytestring and return it in a form Django can store.
 
     If you want to store a Unicode string, you need to encode it to a bytestring
@@ -29,9 +48,32 @@ def compress(data):
     Django prefers to receive Unicode strings to store in a text field, which
     will mangle normal zip data.  We base64 it to avoid the problem.
 
+    Args:
+        data: bytestring to compress
+        method: compression method, either "zlib" or "bz2".  zlib is fast
+            and bz2 usually creates smaller data for text like XML.
+        level: compression level, from 1 (fastest) to 9 (smallest)
     """
-    return base64.encodestring(zlib.compress(data))
+    tag, compress_func, decompress_func = METHODS[method]
+    return tag + base64.b64encode(compress_func(data, level))
 
 def decompress(data):
     """Decompress data created with compress."""
-    return zlib.decompress(base64.decodestring(data))
+    tag = data[:_TAG_LENGTH]
+    if tag in _DECOMPRESS_FUNCS:
+        return _DECOMPRESS_FUNCS[tag](base64.b64decode(data[_TAG_LENGTH:]))
+    else:
+        return zlib.decompress(base64.decodestring(data))
+
+def get_format(data):
+    """Get the method used to compress data.
+
+    Returns:
+        One of the keys of METHODS, or LEGACY_FORMAT for data created before
+        we added the format tags.
+    """
+    tag = data[:_TAG_LENGTH]
+    for method, (method_tag, compress_func, decompress_func) in METHODS.items():
+        if tag == method_tag:
+            return method
+    return LEGACY_FORMAT
@@ -116,23 +116,23 @@ class RequestsMocker(object):
         self.patchers = []
 
     def mock_get(self, url, params=None, data=None, headers=None, auth=None,
-                 verify=True):
+                 verify=True, timeout=None):
         return self.check_request('get', url, params, data, headers, auth)
 
     def mock_post(self, url, params=None, data=None, headers=None, auth=None,
-                  verify=True):
+                  verify=True, timeout=None):
         return self.check_request('post', url, params, data, headers, auth)
 
     def mock_put(self, url, params=None, data=None, headers=None, auth=None,
-                 verify=True):
+                 verify=True, timeout=None):
         return self.check_request('put', url, params, data, headers, auth)
 
     def mock_delete(self, url, params=None, data=None, headers=None,
-                    auth=None, verify=True):
+                    auth=None, verify=True, timeout=None):
         return self.check_request('delete', url, params, data, headers, auth)
 
     def mock_request(self, method, url, params=None, data=None, headers=None,
-                     auth=None, verify=True):
+                     auth=None, verify=True, timeout=None):
         return self.check_request(method.lower(), url, params, data, headers,
                                   auth)
 
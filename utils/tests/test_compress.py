@@ -22,7 +22,10 @@ from random import randint, choice
 
 from django.test import TestCase
 
-from utils.compress import compress, decompress
+import base64
+import zlib
+
+from utils.compress import compress, decompress, get_format
 
 class CompressTest(TestCase):
     def test_compression(self):
@@ -53,3 +56,21 @@ class CompressTest(TestCase):
             round_tripped = decompress(compress(encoded_data)).decode('utf-8')
 
             self.assertEqual(data, round_tripped)
+
+    def test_methods(self):
+        data = 'test data ' * 100
+        for method in ('zlib', 'bz2'):
+            for level in (1, 9):
+                compressed = compress(data, method, level)
+                self.assertEqual(get_format(compressed), method)
+                self.assertEqual(data, decompress(compressed))
+
+    def test_legacy_format(self):
+        # data compressed by the old version of compress() should still work
+        data = 'test data ' * 100
+        legacy = base64.encodestring(zlib.compress(data))
+        self.assertEqual(get_format(legacy), 'legacy')
+        self.assertEqual(data, decompress(legacy))
+        # We also might get unicode data from the DB
+        self.assertEqual(data, decompress(unicode(legacy)))
+        self.assertEqual(data, decompress(unicode(compress(data))))